@@ -1,13 +1,14 @@
 
 import os
 import logging
+from db_profiles import configure_engine, engine_options, resolve_profile
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
 from werkzeug.middleware.proxy_fix import ProxyFix
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+# Configure logging; per-request SQL and timing details come from perf.py, not DEBUG logs
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper())
 
 class Base(DeclarativeBase):
     pass
@@ -25,27 +26,41 @@ if database_url and database_url.startswith("postgres://"):
     database_url = database_url.replace("postgres://", "postgresql://", 1)
 
 app.config["SQLALCHEMY_DATABASE_URI"] = database_url
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "pool_recycle": 300,
-    "pool_pre_ping": True,
-}
+app.config["DATABASE_PROFILE"] = resolve_profile(database_url, os.environ.get("DATABASE_PROFILE", "auto"))
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app.config["DATABASE_PROFILE"])
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+app.config["STATISTICS_CACHE_TTL"] = int(os.environ.get("STATISTICS_CACHE_TTL", 30))
+app.config["FRAGMENT_CACHE_MAX_BYTES"] = int(os.environ.get("FRAGMENT_CACHE_MAX_BYTES", 8 * 1024 * 1024))
+# Set it for CLI commands too: only processes with it on write the change log the index polls
+app.config["LEADERBOARD_INDEX_ENABLED"] = os.environ.get("LEADERBOARD_INDEX_ENABLED", "").lower() in ("1", "true", "yes")
+app.config["LEADERBOARD_INDEX_POLL_SECONDS"] = float(os.environ.get("LEADERBOARD_INDEX_POLL_SECONDS", 2))
+app.config["LEADERBOARD_CHANGE_LOG_KEEP_HOURS"] = int(os.environ.get("LEADERBOARD_CHANGE_LOG_KEEP_HOURS", 24))
+app.config["AVATAR_CACHE_DIR"] = os.environ.get("AVATAR_CACHE_DIR", os.path.join(app.instance_path, "avatars"))
+app.config["AVATAR_CACHE_TTL"] = int(os.environ.get("AVATAR_CACHE_TTL", 24 * 3600))
+app.config["AVATAR_CACHE_MAX_BYTES"] = int(os.environ.get("AVATAR_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+app.config["AVATAR_CACHE_KEEP_DAYS"] = int(os.environ.get("AVATAR_CACHE_KEEP_DAYS", 30))
+app.config["AVATAR_MAX_AGE"] = int(os.environ.get("AVATAR_MAX_AGE", 7 * 24 * 3600))
+app.config["PERF_INSTRUMENTATION"] = os.environ.get("PERF_INSTRUMENTATION", "1").lower() in ("1", "true", "yes")
+app.config["PERF_WINDOW_SECONDS"] = int(os.environ.get("PERF_WINDOW_SECONDS", 15 * 60))
+app.config["SLOW_QUERY_MS"] = float(os.environ.get("SLOW_QUERY_MS", 100))
+app.config["N_PLUS_ONE_THRESHOLD"] = int(os.environ.get("N_PLUS_ONE_THRESHOLD", 5))
+app.config["PROFILE_CACHE_MAX_AGE"] = int(os.environ.get("PROFILE_CACHE_MAX_AGE", 60))
+app.config["RANKS_CACHE_MAX_AGE"] = int(os.environ.get("RANKS_CACHE_MAX_AGE", 30))
 
 # Initialize the app with the extension
 db.init_app(app)
 
 with app.app_context():
-    # Import models to ensure tables are created
+    configure_engine(db.engine, app.config["DATABASE_PROFILE"])
+
+with app.app_context():
+    # Register models, routes, request instrumentation and CLI commands
     import models
+    import perf
     import routes
-    
-    # Drop all tables and recreate them to fix schema issues
-    db.create_all()
-    
-    # Initialize default data
-    from models import Quest, Achievement
-    Quest.create_default_quests()
-    Achievement.create_default_achievements()
+    import commands
+
+# Schema and default data are set up once per deploy by `flask migrate` and `flask seed`
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
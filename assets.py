@@ -0,0 +1,120 @@
+from app import app
+from flask import url_for
+import gzip
+import hashlib
+import json
+import os
+import re
+
+try:
+    import brotli
+except ImportError:  # Optional: without it only .gz siblings are written
+    brotli = None
+
+# Files under static/ that templates load through asset_url()
+ASSET_SOURCES = ('css/style.css', 'js/main.js')
+
+ASSETS_DIR = os.path.join(app.static_folder, 'dist')
+MANIFEST_PATH = os.path.join(ASSETS_DIR, 'manifest.json')
+
+# Precompressed siblings, best first: (Accept-Encoding token, file suffix)
+ASSET_ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def minify_css(text):
+    """Drop comments and insignificant whitespace; spaces around ':' are kept since they matter in selectors"""
+    text = re.sub(r'/\*.*?\*/', '', text, flags=re.S)
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'\s*([{};,>])\s*', r'\1', text)
+    return text.replace(';}', '}').strip() + '\n'
+
+
+def minify_js(text):
+    """Drop indentation, blank lines and whole-line // comments, leaving template literals untouched.
+
+    Line breaks are kept, so automatic semicolon insertion still sees the
+    same statements; anything smarter needs a real JavaScript parser.
+    """
+    lines = []
+    in_template = False
+    for line in text.splitlines():
+        if in_template:
+            lines.append(line)
+        else:
+            stripped = line.strip()
+            if stripped and not stripped.startswith('//'):
+                lines.append(stripped)
+        # An odd number of unescaped backticks opens or closes a multi-line template literal
+        if len(re.findall(r'(?<!\\)`', line)) % 2:
+            in_template = not in_template
+    return '\n'.join(lines) + '\n'
+
+
+MINIFIERS = {'.css': minify_css, '.js': minify_js}
+
+
+def write_file(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as output:
+        output.write(data)
+
+
+def build_assets(sources=ASSET_SOURCES, output_dir=ASSETS_DIR):
+    """Minify each asset into a content-hashed file with .gz (and .br) siblings and write the manifest.
+
+    Files from earlier builds are removed. Returns the manifest, which maps
+    a source path like 'css/style.css' to its built path under output_dir.
+    """
+    manifest = {}
+    written = set()
+    for source in sources:
+        with open(os.path.join(app.static_folder, source), encoding='utf-8') as source_file:
+            text = source_file.read()
+        base, extension = os.path.splitext(source)
+        data = MINIFIERS.get(extension, lambda value: value)(text).encode('utf-8')
+
+        built = f'{base}.{hashlib.sha256(data).hexdigest()[:12]}{extension}'
+        path = os.path.join(output_dir, built)
+        write_file(path, data)
+        # mtime=0 keeps the .gz byte-identical across builds of the same content
+        write_file(path + '.gz', gzip.compress(data, compresslevel=9, mtime=0))
+        written.update((path, path + '.gz'))
+        if brotli is not None:
+            write_file(path + '.br', brotli.compress(data, quality=11))
+            written.add(path + '.br')
+        manifest[source] = built
+
+    for directory, _, files in os.walk(output_dir):
+        for name in files:
+            path = os.path.join(directory, name)
+            if path not in written and name != os.path.basename(MANIFEST_PATH):
+                os.remove(path)
+
+    write_file(os.path.join(output_dir, os.path.basename(MANIFEST_PATH)),
+               json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+    return manifest
+
+
+def load_manifest():
+    """The built asset manifest, or an empty one when build-assets has not run (plain static files are used)"""
+    try:
+        with open(MANIFEST_PATH, encoding='utf-8') as manifest_file:
+            return json.load(manifest_file)
+    except (OSError, ValueError):
+        return {}
+
+
+# Read once per worker; a deploy rebuilds the assets and restarts the workers
+asset_manifest = load_manifest()
+# Changes when a build changes any asset URL, for validators of cached pages that link them
+asset_version = hashlib.sha1(json.dumps(asset_manifest, sort_keys=True).encode()).hexdigest()
+
+
+@app.template_global()
+def asset_url(source):
+    """URL of a static asset: the fingerprinted build when there is one, else the plain static file"""
+    built = asset_manifest.get(source)
+    # The debug server shows edits to static/ right away instead of a stale build
+    if built is None or app.debug:
+        return url_for('static', filename=source)
+    return url_for('asset', filename=built)
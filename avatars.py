@@ -0,0 +1,224 @@
+from app import app
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from urllib.parse import urlsplit
+from urllib.request import Request, urlopen
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+# Size variants served by /avatar/<player_id>.png; other requested sizes fall back to the default
+AVATAR_SIZES = (32, 64, 128)
+DEFAULT_AVATAR_SIZE = 128
+
+# Only these hosts are fetched server-side; other custom avatar URLs are linked directly
+PROXIED_AVATAR_HOSTS = ('mc-heads.net', 'crafatar.com')
+
+MAX_AVATAR_BYTES = 1024 * 1024
+
+# Bundled faces served when the skin service is unreachable
+BUILTIN_AVATAR_DIR = os.path.join(app.static_folder, 'img', 'avatars')
+
+
+def is_proxied_avatar(url):
+    """Whether an upstream avatar URL is served through the local cache"""
+    parts = urlsplit(url)
+    host = (parts.hostname or '').lower()
+    return parts.scheme in ('http', 'https') and \
+        any(host == allowed or host.endswith(f'.{allowed}') for allowed in PROXIED_AVATAR_HOSTS)
+
+
+def fetch_url(url, timeout=5):
+    """Download an image and return (bytes, content type); raises on errors and non-image responses"""
+    request = Request(url, headers={'User-Agent': 'BedwarsLeaderboard avatar cache'})
+    with urlopen(request, timeout=timeout) as response:
+        content_type = response.headers.get_content_type()
+        data = response.read(MAX_AVATAR_BYTES + 1)
+    if not content_type.startswith('image/'):
+        raise ValueError(f'{url} returned {content_type}, not an image')
+    if len(data) > MAX_AVATAR_BYTES:
+        raise ValueError(f'{url} is larger than {MAX_AVATAR_BYTES} bytes')
+    return data, content_type
+
+
+class AvatarStore:
+    """Content-addressed on-disk cache of upstream avatar images.
+
+    Images are stored once under ``objects/<sha256>`` no matter how many
+    URLs return them (every default Steve is one file), and
+    ``refs/<sha1 of url>.json`` maps a URL to its image and fetch time.
+    The sha256 doubles as a strong ETag. ``fetcher(url)`` returns
+    ``(bytes, content type)`` and can be swapped for a local stand-in.
+    Downloads run on a small background pool so requests never wait on
+    the skin service, and every ``prune_every`` downloads the cache is
+    trimmed to ``max_bytes`` and ``keep_seconds``.
+    """
+
+    def __init__(self, directory, fetcher=fetch_url, ttl=86400, retry_after=300,
+                 max_bytes=256 * 1024 * 1024, keep_seconds=30 * 86400, prune_every=200, workers=2):
+        self.directory = directory
+        self.fetcher = fetcher
+        self.ttl = ttl
+        self.retry_after = retry_after
+        self.max_bytes = max_bytes
+        self.keep_seconds = keep_seconds
+        self.prune_every = prune_every
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='avatar-fetch')
+        self._lock = threading.Lock()
+        self._failed_at = {}
+        self._pending = set()
+        self._fetches = 0
+
+    def get(self, url):
+        """Return the cached entry for url without waiting on the network.
+
+        A missing or expired entry is refreshed in the background, and the
+        stale one (or None) is returned meanwhile.
+        """
+        entry = self._read_ref(url)
+        if entry is None or time.time() - entry['fetched_at'] >= self.ttl:
+            self.schedule(url)
+        return entry
+
+    def schedule(self, url):
+        """Queue a background refresh of url unless one is pending or it failed within ``retry_after``"""
+        with self._lock:
+            failed_at = self._failed_at.get(url)
+            if url in self._pending or (failed_at is not None and time.monotonic() - failed_at < self.retry_after):
+                return
+            self._pending.add(url)
+        self._executor.submit(self.refresh, url)
+
+    def refresh(self, url):
+        """Download url into the cache, remembering failures; returns the entry or None"""
+        try:
+            return self.fetch(url)
+        except Exception as e:
+            app.logger.warning(f"Error fetching avatar {url}: {e}")
+            with self._lock:
+                self._failed_at[url] = time.monotonic()
+            return None
+        finally:
+            with self._lock:
+                self._pending.discard(url)
+
+    def fetch(self, url):
+        """Download url into the cache and return its entry"""
+        data, content_type = self.fetcher(url)
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._object_path(digest)
+        if not os.path.exists(path):
+            self._write(path, data)
+
+        entry = {'digest': digest, 'content_type': content_type, 'fetched_at': time.time()}
+        self._write(self._ref_path(url), json.dumps(entry).encode())
+        with self._lock:
+            self._failed_at.pop(url, None)
+            self._fetches += 1
+            due = self.prune_every and self._fetches % self.prune_every == 0
+        if due:
+            self._executor.submit(self.prune)
+        return dict(entry, path=path)
+
+    def prune(self):
+        """Drop refs not fetched within ``keep_seconds``, then the oldest until images fit ``max_bytes``.
+
+        Images no remaining ref points to are deleted. Returns the number of
+        files removed.
+        """
+        refs = []
+        for path in self._files('refs'):
+            try:
+                with open(path, 'rb') as ref:
+                    entry = json.load(ref)
+                refs.append((entry['fetched_at'], path, entry['digest']))
+            except (OSError, ValueError, KeyError):
+                refs.append((0, path, None))
+        objects = {os.path.basename(path): path for path in self._files('objects')}
+        sizes = {digest: os.path.getsize(path) for digest, path in objects.items() if os.path.exists(path)}
+
+        refs.sort(reverse=True)
+        cutoff = time.time() - self.keep_seconds
+        kept = set()
+        total = 0
+        removed = 0
+        for fetched_at, path, digest in refs:
+            size = 0 if digest in kept else sizes.get(digest)
+            if size is None or fetched_at < cutoff or total + size > self.max_bytes:
+                removed += self._remove(path)
+                continue
+            kept.add(digest)
+            total += size
+
+        for digest, path in objects.items():
+            if digest not in kept:
+                removed += self._remove(path)
+        return removed
+
+    def _files(self, subdirectory):
+        for directory, _, files in os.walk(os.path.join(self.directory, subdirectory)):
+            for name in files:
+                yield os.path.join(directory, name)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+            return 1
+        except FileNotFoundError:
+            return 0
+
+    def _read_ref(self, url):
+        try:
+            with open(self._ref_path(url), 'rb') as ref:
+                entry = json.load(ref)
+        except (OSError, ValueError):
+            return None
+        path = self._object_path(entry['digest'])
+        if not os.path.exists(path):
+            return None
+        return dict(entry, path=path)
+
+    def _ref_path(self, url):
+        return os.path.join(self.directory, 'refs', hashlib.sha1(url.encode()).hexdigest() + '.json')
+
+    def _object_path(self, digest):
+        return os.path.join(self.directory, 'objects', digest[:2], digest)
+
+    @staticmethod
+    def _write(path, data):
+        # Write to a temp file and rename, so readers never see a partial image
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, 'wb') as temp_file:
+                temp_file.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+
+@lru_cache(maxsize=None)
+def builtin_avatar(name):
+    """Entry for a bundled 'steve' or 'alex' face"""
+    path = os.path.join(BUILTIN_AVATAR_DIR, f'{name}.png')
+    with open(path, 'rb') as image:
+        digest = hashlib.sha256(image.read()).hexdigest()
+    return {'digest': digest, 'content_type': 'image/png', 'path': path}
+
+
+avatar_store = AvatarStore(app.config['AVATAR_CACHE_DIR'], ttl=app.config['AVATAR_CACHE_TTL'],
+                           max_bytes=app.config['AVATAR_CACHE_MAX_BYTES'],
+                           keep_seconds=app.config['AVATAR_CACHE_KEEP_DAYS'] * 86400)
+
+
+def prefetch_avatar(player):
+    """Warm the cache with every size of a player's avatar in the background, e.g. after a skin change"""
+    urls = {player.avatar_source(size) for size in AVATAR_SIZES}
+    for url in urls:
+        if is_proxied_avatar(url):
+            avatar_store.schedule(url)
@@ -0,0 +1,107 @@
+from collections import OrderedDict
+import sys
+import threading
+import time
+
+
+class SnapshotCache:
+    """Process-local cache for a single computed value.
+
+    The value is reused until it is older than the TTL or the shared version
+    returned by ``version_getter`` changes. Keeping the version in the
+    database lets a write in one gunicorn worker invalidate the copies held
+    by the others.
+    """
+
+    def __init__(self, version_getter, ttl_getter):
+        self._version_getter = version_getter
+        self._ttl_getter = ttl_getter
+        self._lock = threading.Lock()
+        self._value = None
+        self._version = None
+        self._loaded_at = 0.0
+
+    def get(self, loader):
+        """Return the cached value, recomputing it with loader() when stale"""
+        version = self._version_getter()
+        with self._lock:
+            fresh = time.monotonic() - self._loaded_at < self._ttl_getter()
+            if self._value is not None and self._version == version and fresh:
+                return self._value
+
+        value = loader()
+        with self._lock:
+            self._value = value
+            self._version = version
+            self._loaded_at = time.monotonic()
+        return value
+
+    def invalidate(self):
+        """Drop the cached value in this process"""
+        with self._lock:
+            self._value = None
+            self._version = None
+
+
+class FragmentCache:
+    """Thread-safe LRU cache of rendered HTML fragments, capped by entry count and memory.
+
+    Each entry belongs to a group (for example a player id) so everything
+    rendered for one owner can be dropped at once, and stores the version it
+    was rendered for; a lookup with a different version is a miss.
+    """
+
+    def __init__(self, max_bytes, max_entries=10000):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._groups = {}
+        self._bytes = 0
+
+    def get(self, group, key, version):
+        """Return the cached fragment or None if missing or rendered for another version"""
+        with self._lock:
+            entry = self._entries.get((group, key))
+            if entry is None or entry[0] != version:
+                return None
+            self._entries.move_to_end((group, key))
+            return entry[1]
+
+    def set(self, group, key, version, fragment):
+        """Store a fragment, evicting least recently used entries beyond the caps"""
+        size = sys.getsizeof(fragment)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._remove((group, key))
+            self._entries[(group, key)] = (version, fragment, size)
+            self._groups.setdefault(group, set()).add(key)
+            self._bytes += size
+            while self._bytes > self.max_bytes or len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, group):
+        """Drop every fragment rendered for a group"""
+        with self._lock:
+            for key in list(self._groups.get(group, ())):
+                self._remove((group, key))
+
+    def clear(self):
+        """Drop every fragment"""
+        with self._lock:
+            self._entries.clear()
+            self._groups.clear()
+            self._bytes = 0
+
+    def _remove(self, entry_key):
+        entry = self._entries.pop(entry_key, None)
+        if entry is None:
+            return
+        self._bytes -= entry[2]
+        group, key = entry_key
+        keys = self._groups.get(group)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._groups[group]
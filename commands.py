@@ -0,0 +1,606 @@
+from app import app, db
+from assets import ASSET_SOURCES, brotli, build_assets
+from avatars import avatar_store
+from dataset import generate_dataset
+from leaderboard import LeaderboardIndex
+from migrations import add_missing_columns, migration_lock, run_migrations, seed_defaults
+from models import LEADERBOARD_SORT_KEYS, STAT_DELTA_FIELDS, Achievement, Player, PlayerChange, PlayerStatRollup
+from db_profiles import DATABASE_PROFILES, configure_engine, engine_options, lift_timeouts, long_running_statements, resolve_profile
+from flask import url_for
+from sqlalchemy import Column, Integer, MetaData, Table, create_engine, event, func, select
+from sqlalchemy.exc import OperationalError
+from search import create_search_index
+from datetime import datetime
+import click
+import json
+import multiprocessing
+import os
+import random
+import re
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+
+@app.cli.command('migrate')
+def migrate():
+    """Apply pending schema migrations; safe to run from several instances at once"""
+    with migration_lock():
+        applied = run_migrations()
+    for name in applied:
+        click.echo(f'Applied: {name}')
+    click.echo('Schema is up to date')
+
+
+@app.cli.command('seed')
+def seed():
+    """Create missing default quests and achievements; safe to run on every deploy"""
+    with migration_lock():
+        added = seed_defaults()
+    click.echo(f'Added {added} default rows')
+
+
+@app.cli.command('build-assets')
+def build_assets_command():
+    """Minify static CSS/JS into fingerprinted files with precompressed siblings for asset_url()"""
+    manifest = build_assets()
+    for source in ASSET_SOURCES:
+        sizes = [os.path.getsize(os.path.join(app.static_folder, source))]
+        sizes += [os.path.getsize(os.path.join(app.static_folder, 'dist', manifest[source]) + suffix)
+                  for suffix in ('', '.gz') + (('.br',) if brotli else ())]
+        click.echo(f'{source} -> {manifest[source]}  ' + ' -> '.join(f'{size / 1024:.1f} KB' for size in sizes))
+    if brotli is None:
+        click.echo('brotli is not installed; only .gz variants were written')
+
+
+@app.cli.command('benchmark-startup')
+@click.option('--runs', default=5, show_default=True, help='Cold imports to time')
+def benchmark_startup(runs):
+    """Time cold imports of the app in fresh interpreters and count the SQL they issue"""
+    # Counts statements on every engine, so queries made while importing the app are included
+    probe = (
+        'import json, time\n'
+        'from sqlalchemy import event\n'
+        'from sqlalchemy.engine import Engine\n'
+        'statements = []\n'
+        'event.listen(Engine, "before_cursor_execute", lambda *args: statements.append(args[2]))\n'
+        'started = time.perf_counter()\n'
+        'import main\n'
+        'print(json.dumps({"seconds": time.perf_counter() - started, "statements": len(statements)}))\n'
+    )
+    results = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', probe], capture_output=True, text=True,
+                                check=True, cwd=app.root_path).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    timings = sorted(result['seconds'] for result in results)
+    click.echo(f'import time: median {statistics.median(timings) * 1000:.0f} ms, '
+               f'min {timings[0] * 1000:.0f} ms, max {timings[-1] * 1000:.0f} ms over {runs} runs')
+    click.echo(f'SQL statements during import: {max(result["statements"] for result in results)}')
+
+
+# Scratch table for benchmark-writes, kept out of db.metadata so migrations never create it
+benchmark_metadata = MetaData()
+benchmark_table = Table(
+    'benchmark_write', benchmark_metadata,
+    Column('id', Integer, primary_key=True),
+    Column('counter', Integer, nullable=False, default=0)
+)
+
+
+def run_write_benchmark_worker(database_url, profile, seconds, rows, reader, results):
+    """One benchmark process until the time is up: a writer runs read-then-update transactions
+    on random rows, a reader sums the whole table like a leaderboard page"""
+    engine = create_engine(database_url, **engine_options(profile))
+    configure_engine(engine, profile)
+    done = failures = 0
+    latencies = []
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        row_id = random.randint(1, rows)
+        started = time.perf_counter()
+        try:
+            with engine.begin() as connection:
+                if reader:
+                    connection.execute(select(func.sum(benchmark_table.c.counter))).scalar()
+                else:
+                    connection.execute(select(benchmark_table.c.counter).where(benchmark_table.c.id == row_id)).scalar()
+                    connection.execute(benchmark_table.update().where(benchmark_table.c.id == row_id)
+                                       .values(counter=benchmark_table.c.counter + 1))
+            done += 1
+            latencies.append(time.perf_counter() - started)
+        except OperationalError:
+            # "database is locked" and friends: the request would have failed
+            failures += 1
+    engine.dispose()
+    results.put((reader, done, failures, latencies))
+
+
+@app.cli.command('benchmark-writes')
+@click.option('--writers', default=4, show_default=True, help='Concurrent writer processes, like gunicorn workers')
+@click.option('--seconds', default=5.0, show_default=True, help='Duration per profile')
+@click.option('--readers', default=2, show_default=True, help='Concurrent processes reading the whole table')
+@click.option('--rows', default=10000, show_default=True, help='Rows in the scratch table')
+@click.option('--profile', 'profiles', multiple=True, type=click.Choice(DATABASE_PROFILES),
+              help='Profiles to compare (repeatable); defaults to the configured profile and "default"')
+@click.option('--database-url', default=None,
+              help='Database to benchmark; SQLite defaults to a fresh temporary file per profile')
+def benchmark_writes(writers, readers, seconds, rows, profiles, database_url):
+    """Compare commit throughput and lock failures of engine profiles under concurrent writers"""
+    configured_url = app.config['SQLALCHEMY_DATABASE_URI']
+    profiles = profiles or tuple(dict.fromkeys((app.config['DATABASE_PROFILE'], 'default')))
+
+    for profile in profiles:
+        url = database_url or configured_url
+        if profile != 'default' and resolve_profile(url) != profile:
+            click.echo(f'{profile:<10} skipped: not applicable to {url.split(":")[0]}')
+            continue
+        temporary_dir = None
+        if url.startswith('sqlite') and not database_url:
+            # A fresh file per run: journal_mode=WAL sticks to a database file once set
+            temporary_dir = tempfile.mkdtemp()
+            url = f'sqlite:///{os.path.join(temporary_dir, "benchmark.db")}'
+
+        engine = create_engine(url, **engine_options(profile))
+        configure_engine(engine, profile)
+        with engine.begin() as connection:
+            benchmark_table.drop(connection, checkfirst=True)
+            benchmark_table.create(connection)
+            connection.execute(benchmark_table.insert(), [{'id': row_id, 'counter': 0} for row_id in range(1, rows + 1)])
+
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        processes = [context.Process(target=run_write_benchmark_worker,
+                                     args=(url, profile, seconds, rows, index < readers, results))
+                     for index in range(readers + writers)]
+        for process in processes:
+            process.start()
+        outcomes = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+
+        with engine.begin() as connection:
+            benchmark_table.drop(connection)
+        engine.dispose()
+        if temporary_dir:
+            shutil.rmtree(temporary_dir, ignore_errors=True)
+
+        writes = [outcome for outcome in outcomes if not outcome[0]]
+        reads = [outcome for outcome in outcomes if outcome[0]]
+        commits = sum(outcome[1] for outcome in writes)
+        failures = sum(outcome[2] for outcome in outcomes)
+        latencies = sorted(latency for outcome in writes for latency in outcome[3])
+        p95 = latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0
+        click.echo(f'{profile:<10} {commits / seconds:8.0f} commits/s  p95 {p95:6.1f} ms  '
+                   f'{sum(outcome[1] for outcome in reads) / seconds:8.0f} reads/s  {failures:6d} failed  '
+                   f'({writers} writers, {readers} readers, {seconds:g}s)')
+
+
+@app.cli.command('generate-dataset')
+@click.option('--players', default=10000, show_default=True, help='Players to add')
+@click.option('--seed', default=0, show_default=True, help='Random seed; the same seed gives the same data')
+@click.option('--offset', default=0, show_default=True, help='Index of the first generated player, to add to an earlier run')
+@click.option('--batch-size', default=2000, show_default=True, help='Players per transaction')
+@click.option('--quests-per-player', default=2.0, show_default=True, help='Average accepted quests per player')
+def generate_dataset_command(players, seed, offset, batch_size, quests_per_player):
+    """Fill the database with a deterministic synthetic population for benchmarks"""
+    started = time.perf_counter()
+
+    def report(added):
+        click.echo(f'{added}/{players} players ({added / (time.perf_counter() - started):.0f}/s)')
+
+    try:
+        with long_running_statements(db.session):
+            added = generate_dataset(players, seed=seed, offset=offset, batch_size=batch_size,
+                                     quests_per_player=quests_per_player, progress=report)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(f'Added {added} players in {time.perf_counter() - started:.1f}s')
+
+
+# A p95 change smaller than this is noise, however large in percent
+ROUTE_REGRESSION_NOISE_MS = 2.0
+
+
+def benchmark_route_requests(player):
+    """(name, URL, session) for every GET page and API, using a sample player's id and nickname"""
+    admin = {'is_admin': True}
+    signed_in = {'player_nickname': player.nickname}
+    with app.test_request_context():
+        return [
+            ('index', url_for('index'), {}),
+            ('index by kills', url_for('index', sort='kills'), {}),
+            ('index search', url_for('index', search=player.nickname[:6]), {}),
+            ('player', url_for('player_profile', player_id=player.id), {}),
+            ('player ranks', url_for('player_ranks', player_id=player.id), {}),
+            ('public profile', url_for('public_profile', nickname=player.nickname), {}),
+            ('my profile', url_for('my_profile'), signed_in),
+            ('statistics', url_for('statistics'), {}),
+            ('quests', url_for('quests'), signed_in),
+            ('achievements', url_for('achievements'), signed_in),
+            ('export (10k rows)', url_for('export_leaderboard', limit=10000), {}),
+            ('api stats', url_for('api_stats'), {}),
+            ('api leaderboard', url_for('api_leaderboard'), {}),
+            ('api leaderboard around', url_for('api_leaderboard', around=player.nickname), {}),
+            ('api leaderboard day', url_for('api_leaderboard', window='day'), {}),
+            ('api player ranks', url_for('api_player_ranks', nickname=player.nickname), {}),
+            ('api search suggest', url_for('api_search_suggest', q=player.nickname[:4]), {}),
+            ('admin', url_for('admin'), admin),
+            ('admin quests', url_for('admin_quests'), admin),
+            ('admin achievements', url_for('admin_achievements'), admin),
+            ('admin titles', url_for('admin_titles'), admin),
+            ('admin gradients', url_for('admin_gradients'), admin),
+        ]
+
+
+@app.cli.command('benchmark-routes')
+@click.option('--requests', 'runs', default=20, show_default=True, help='Measured requests per route')
+@click.option('--warmup', default=2, show_default=True, help='Unmeasured requests per route first')
+@click.option('--route', 'selected', multiple=True, help='Only routes whose name contains this text (repeatable)')
+@click.option('--baseline', 'baseline_path', type=click.Path(dir_okay=False), default=None,
+              help='Baseline JSON file  [default: instance/route-benchmark.json]')
+@click.option('--save-baseline', is_flag=True, help='Store these results as the new baseline')
+@click.option('--max-regression', type=float, default=None,
+              help='Fail if a route is this much slower than the baseline at p95 (0.25 = 25%) or runs more queries')
+def benchmark_routes(runs, warmup, selected, baseline_path, save_baseline, max_regression):
+    """Time every page and API through the test client and compare with a stored baseline.
+
+    Reports p50/p95 latency, SQL statements per request and the process
+    peak RSS after each route. Run it against a database filled by
+    generate-dataset; baselines are only comparable on the same data and
+    machine.
+    """
+    baseline_path = baseline_path or os.path.join(app.instance_path, 'route-benchmark.json')
+    player = Player.query.order_by(Player.id).first()
+    if player is None:
+        raise click.ClickException('No players to benchmark with; run "flask generate-dataset" first')
+    players = db.session.query(func.count(Player.id)).scalar()
+    db.session.remove()
+
+    baseline = None
+    if os.path.exists(baseline_path) and not save_baseline:
+        with open(baseline_path) as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline['players'] != players:
+            click.echo(f'Baseline has {baseline["players"]} players, this database {players}; timings may differ')
+
+    statements = []
+    count_statement = lambda *args: statements.append(args[2])
+    event.listen(db.engine, 'before_cursor_execute', count_statement)
+    results = {}
+    regressions = []
+    try:
+        for name, url, session_values in benchmark_route_requests(player):
+            if selected and not any(part in name for part in selected):
+                continue
+            client = app.test_client()
+            if session_values:
+                with client.session_transaction() as client_session:
+                    client_session.update(session_values)
+
+            timings = []
+            query_counts = []
+            for run in range(warmup + runs):
+                statements.clear()
+                started = time.perf_counter()
+                response = client.get(url)
+                response.get_data()
+                elapsed = time.perf_counter() - started
+                if response.status_code >= 400:
+                    raise click.ClickException(f'{name}: {url} returned {response.status_code}')
+                if run >= warmup:
+                    timings.append(elapsed * 1000)
+                    query_counts.append(len(statements))
+
+            timings.sort()
+            result = {
+                'p50_ms': timings[len(timings) // 2],
+                'p95_ms': timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+                'queries': statistics.median(query_counts),
+                # ru_maxrss is in KiB on Linux
+                'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            }
+            results[name] = result
+
+            line = (f'{name:<24} p50 {result["p50_ms"]:8.1f} ms  p95 {result["p95_ms"]:8.1f} ms  '
+                    f'{result["queries"]:5g} queries  peak RSS {result["peak_rss_mb"]:6.0f} MB')
+            previous = (baseline or {}).get('routes', {}).get(name)
+            if previous:
+                change = (result['p95_ms'] - previous['p95_ms']) / previous['p95_ms'] if previous['p95_ms'] else 0
+                line += f'  p95 {change:+.0%} vs baseline'
+                if max_regression is not None and (
+                        (change > max_regression and result['p95_ms'] - previous['p95_ms'] > ROUTE_REGRESSION_NOISE_MS)
+                        or result['queries'] > previous['queries']):
+                    regressions.append(name)
+                    line += '  REGRESSION'
+            click.echo(line)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', count_statement)
+
+    if save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(baseline_path)), exist_ok=True)
+        with open(baseline_path, 'w') as baseline_file:
+            json.dump({'players': players, 'created_at': datetime.utcnow().isoformat(), 'routes': results},
+                      baseline_file, indent=2, sort_keys=True)
+        click.echo(f'Saved baseline to {baseline_path}')
+    if regressions:
+        raise click.ClickException(f'{len(regressions)} routes regressed: {", ".join(regressions)}')
+
+
+@app.cli.command('backfill-derived-stats')
+@click.option('--batch-size', default=1000, show_default=True, help='Players per commit')
+def backfill_derived_stats(batch_size):
+    """Add and populate persisted level, K/D, FK/D, win rate and star rating columns"""
+    with db.engine.begin() as connection:
+        added = add_missing_columns(connection, Player)
+    if added:
+        click.echo(f'Added columns: {", ".join(added)}')
+
+    updated = 0
+    last_id = 0
+    with long_running_statements(db.session):
+        while True:
+            player_ids = Player.update_derived_stats(db.session.connection(), after_id=last_id, limit=batch_size)
+            if not player_ids:
+                break
+            last_id = player_ids[-1]
+            updated += len(player_ids)
+            db.session.commit()
+
+    click.echo(f'Recalculated derived stats for {updated} players')
+
+
+@app.cli.command('create-indexes')
+def create_indexes():
+    """Create indexes declared on the models that are missing from the database"""
+    with db.engine.begin() as connection:
+        lift_timeouts(connection)
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(connection, checkfirst=True)
+    click.echo('Indexes are up to date')
+
+
+@app.cli.command('build-search-index')
+def build_search_index():
+    """Create (or rebuild) the nickname search index: pg_trgm on PostgreSQL, FTS5 on SQLite"""
+    with db.engine.begin() as connection:
+        lift_timeouts(connection)
+        if not create_search_index(connection):
+            raise click.ClickException(f'No search index could be created for {db.engine.dialect.name}')
+    click.echo('Search index is ready')
+
+
+@app.cli.command('award-achievements')
+@click.option('--achievement-id', 'achievement_ids', type=int, multiple=True,
+              help='Only sweep these achievements (repeatable)')
+def award_achievements(achievement_ids):
+    """Award achievements to every player who meets their conditions, e.g. after a balance change"""
+    with long_running_statements(db.session):
+        awarded = Achievement.award_eligible(achievement_ids=achievement_ids or None)
+        db.session.commit()
+
+    counts = {}
+    for _, achievement in awarded:
+        counts[achievement.title] = counts.get(achievement.title, 0) + 1
+    for title, count in counts.items():
+        click.echo(f'{title}: {count} players')
+    click.echo(f'Awarded {len(awarded)} achievements')
+
+
+@app.cli.command('compact-matches')
+@click.option('--keep-days', default=30, show_default=True, help='Days of raw match records to keep')
+@click.option('--keep-hourly-days', default=7, show_default=True, help='Days of hourly rollups to keep (at least 2)')
+def compact_matches(keep_days, keep_hourly_days):
+    """Drop raw matches and hourly rollups past retention; their totals stay in the daily rollups"""
+    if keep_hourly_days < 2:
+        raise click.ClickException('The rolling day leaderboard needs at least 2 days of hourly rollups')
+    with long_running_statements(db.session):
+        matches, hourly = PlayerStatRollup.compact(keep_days, keep_hourly_days)
+        db.session.commit()
+    click.echo(f'Removed {matches} matches and {hourly} hourly rollups')
+
+
+@app.cli.command('prune-player-changes')
+@click.option('--keep-hours', default=24, show_default=True, help='Hours of change log to keep')
+def prune_player_changes(keep_hours):
+    """Drop old leaderboard change log entries; workers that are further behind reload their index"""
+    removed = PlayerChange.prune(keep_hours)
+    db.session.commit()
+    click.echo(f'Removed {removed} change log entries')
+
+
+@app.cli.command('prune-avatars')
+def prune_avatars():
+    """Trim the avatar cache to AVATAR_CACHE_MAX_BYTES and AVATAR_CACHE_KEEP_DAYS (also done every few hundred fetches)"""
+    removed = avatar_store.prune()
+    click.echo(f'Removed {removed} cached avatar files')
+
+
+def compare_leaderboard_index(index, label):
+    """Compare every sort order, sampled ranks and the statistics of an index with SQL; returns failures"""
+    failures = 0
+    total = db.session.query(func.count(Player.id)).scalar()
+    for sort_by in LEADERBOARD_SORT_KEYS:
+        expected, _ = Player.get_leaderboard_page(sort_by, None, total)
+        actual, _ = index.page_after(sort_by, None, total)
+        for row in actual:
+            row.pop('rank')
+        if actual != expected:
+            failures += 1
+            click.echo(f'FAIL {label}: {sort_by} order or rows differ')
+
+        sample = random.sample([row['id'] for row in expected], min(50, len(expected)))
+        expected_ranks = Player.get_ranks([sort_by], sample)
+        if any(index.rank(sort_by, player_id) != expected_ranks[player_id][sort_by] for player_id in sample):
+            failures += 1
+            click.echo(f'FAIL {label}: {sort_by} ranks differ')
+
+    if index.get_statistics() != Player.compute_statistics():
+        failures += 1
+        click.echo(f'FAIL {label}: statistics differ')
+    if not failures:
+        click.echo(f'ok   {label}')
+    return failures
+
+
+@app.cli.command('check-leaderboard-index')
+@click.option('--changes', default=200, show_default=True, help='Players to change for the incremental check')
+def check_leaderboard_index(changes):
+    """Check the in-process leaderboard index against SQL after a full load and after incremental updates.
+
+    The incremental check changes, adds, renames and deletes players in a
+    transaction that is rolled back afterwards. The change log is written
+    for it even when LEADERBOARD_INDEX_ENABLED is off.
+    """
+    index = LeaderboardIndex(poll_seconds=0)
+    failures = compare_leaderboard_index(index, 'full load')
+
+    index_enabled = app.config['LEADERBOARD_INDEX_ENABLED']
+    app.config['LEADERBOARD_INDEX_ENABLED'] = True
+    try:
+        players = Player.query.order_by(func.random()).limit(changes).all()
+        if len(players) >= 3:
+            Player.apply_stat_deltas({
+                player.nickname: {field: random.randint(0, 20) for field in STAT_DELTA_FIELDS}
+                for player in players[2:]
+            })
+            players[0].nickname = f'{players[0].nickname}-renamed'
+            players[0].role = 'Index check'
+            db.session.delete(players[1])
+        db.session.add(Player(nickname='index-check-new-player',
+                              **{field: random.randint(0, 500) for field in STAT_DELTA_FIELDS}))
+        db.session.flush()
+
+        index.sync(force=True)
+        failures += compare_leaderboard_index(index, 'incremental update')
+    finally:
+        db.session.rollback()
+        app.config['LEADERBOARD_INDEX_ENABLED'] = index_enabled
+
+    if failures:
+        raise click.ClickException(f'{failures} leaderboard index checks failed')
+
+
+# Admin-maintained catalogues of a few dozen rows; reading them whole is cheaper than an index
+CATALOGUE_TABLES = {'quest', 'achievement', 'custom_title', 'gradient_theme'}
+
+# Routes that list a whole table by design, with the table they read
+ACCEPTED_FULL_SCANS = {
+    ('admin titles', 'player'),  # title assignment picks from every player
+}
+
+
+def capture_route_statements(player):
+    """(route name, SQL, parameters) for each distinct SELECT the GET routes issue.
+
+    Every route is requested once to warm the snapshot caches, then again
+    while recording, so statements that only rebuild a cache are left out.
+    """
+    requests = benchmark_route_requests(player)
+    clients = []
+    for name, url, session_values in requests:
+        client = app.test_client()
+        if session_values:
+            with client.session_transaction() as client_session:
+                client_session.update(session_values)
+        clients.append((name, url, client))
+        client.get(url)
+
+    captured = {}
+    current_route = [None]
+
+    def record_statement(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+            captured.setdefault(statement, (current_route[0], parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', record_statement)
+    try:
+        for name, url, client in clients:
+            current_route[0] = name
+            response = client.get(url)
+            if response.status_code >= 400:
+                raise click.ClickException(f'{name}: {url} returned {response.status_code}')
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record_statement)
+    return [(name, sql, parameters) for sql, (name, parameters) in captured.items()]
+
+
+def explain_problems(connection, route, sql, parameters):
+    """Return full scans and sorts not served by an index in a statement's query plan.
+
+    Sorting rows an index already narrowed down (a page of ids, one
+    window's rollups) is accepted; a sort is only reported together with
+    a full scan, which is what an unindexed leaderboard looks like.
+    """
+    def scan_accepted(table):
+        return table in CATALOGUE_TABLES or (route, table) in ACCEPTED_FULL_SCANS
+
+    if db.engine.dialect.name == 'sqlite':
+        rows = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {sql}', parameters).fetchall()
+        scans = [match.group(1) for match in (re.match(r'SCAN (\w+)$', row[-1]) for row in rows) if match]
+        problems = [f'SCAN {table}' for table in scans if not scan_accepted(table)]
+        if problems:
+            problems += [row[-1] for row in rows if 'TEMP B-TREE' in row[-1]]
+        return problems
+
+    if db.engine.dialect.name == 'postgresql':
+        # Not run in CI yet: this branch is unverified against a live server.
+        # Tiny test tables make a seq scan look cheap, so only accept one if no index applies
+        connection.exec_driver_sql('SET LOCAL enable_seqscan = off')
+        plan = connection.exec_driver_sql(f'EXPLAIN (FORMAT JSON) {sql}', parameters).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        problems = []
+        sorts = []
+        nodes = [plan[0]['Plan']]
+        while nodes:
+            node = nodes.pop()
+            if node['Node Type'] == 'Seq Scan' and not scan_accepted(node.get('Relation Name')):
+                problems.append(f"Seq Scan on {node.get('Relation Name')}")
+            elif node['Node Type'] == 'Sort':
+                sorts.append(f"Sort on {', '.join(node.get('Sort Key', []))}")
+            nodes.extend(node.get('Plans', []))
+        return problems + sorts if problems else []
+
+    raise click.ClickException(f'Query plan checks are not supported for {db.engine.dialect.name}')
+
+
+@app.cli.command('check-query-plans')
+def check_query_plans():
+    """Fail if a page or API statement needs a full table scan or an unindexed sort.
+
+    Requests every GET route through the test client, records the SQL it
+    sends and checks the query plan of each statement with its real
+    parameters. Only the SQLite plans are exercised by the test suite.
+    """
+    player = Player.query.order_by(Player.experience.desc()).first()
+    if player is None:
+        raise click.ClickException('No players to check with; run "flask generate-dataset" first')
+    db.session.remove()
+
+    problems_by_route = {}
+    for route, sql, parameters in capture_route_statements(player):
+        with db.engine.connect() as connection:
+            with connection.begin():
+                problems = explain_problems(connection, route, sql, parameters)
+        route_problems = problems_by_route.setdefault(route, [])
+        if problems:
+            route_problems.append(f'{"; ".join(problems)}\n     {" ".join(sql.split())[:200]}')
+
+    failures = 0
+    for route, route_problems in problems_by_route.items():
+        for problem in route_problems:
+            click.echo(f'FAIL {route}: {problem}')
+        if route_problems:
+            failures += len(route_problems)
+        else:
+            click.echo(f'ok   {route}')
+
+    if failures:
+        raise click.ClickException(f'{failures} statements are not served by an index')
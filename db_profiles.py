@@ -0,0 +1,107 @@
+from contextlib import contextmanager
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+import contextvars
+import os
+
+# Engine profiles: pool options and per-connection settings for each database backend
+DATABASE_PROFILES = ('sqlite', 'postgresql', 'default')
+
+# Set inside long_running_statements(); session transactions begun meanwhile lift the timeouts
+long_running = contextvars.ContextVar('long_running', default=False)
+
+
+def resolve_profile(database_url, requested='auto'):
+    """Pick the profile for a database URL; 'auto' follows the URL scheme"""
+    if requested and requested != 'auto':
+        if requested not in DATABASE_PROFILES:
+            raise ValueError(f'Unknown database profile {requested!r}, expected one of {", ".join(DATABASE_PROFILES)}')
+        return requested
+    if database_url.startswith('sqlite'):
+        return 'sqlite'
+    if database_url.startswith('postgresql'):
+        return 'postgresql'
+    return 'default'
+
+
+def engine_options(profile, environ=os.environ):
+    """SQLAlchemy create_engine() options for a profile, tunable through environment variables"""
+    if profile == 'sqlite':
+        # busy_timeout is also set on connect; the driver timeout covers the initial lock on open
+        return {'connect_args': {'timeout': int(environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000)) / 1000}}
+
+    if profile == 'postgresql':
+        statement_timeout = int(environ.get('DB_STATEMENT_TIMEOUT_MS', 15000))
+        idle_timeout = int(environ.get('DB_IDLE_IN_TRANSACTION_TIMEOUT_MS', 60000))
+        return {
+            'pool_size': int(environ.get('DB_POOL_SIZE', 5)),
+            'max_overflow': int(environ.get('DB_MAX_OVERFLOW', 5)),
+            'pool_timeout': int(environ.get('DB_POOL_TIMEOUT', 10)),
+            'pool_recycle': int(environ.get('DB_POOL_RECYCLE', 1800)),
+            # A server-side disconnect (restart, failover, idle kill) only shows up on the next round trip,
+            # so test each connection at checkout rather than fail the first query of a request
+            'pool_pre_ping': environ.get('DB_POOL_PRE_PING', '1').lower() in ('1', 'true', 'yes'),
+            'connect_args': {
+                'connect_timeout': int(environ.get('DB_CONNECT_TIMEOUT', 5)),
+                'options': f'-c statement_timeout={statement_timeout} '
+                           f'-c idle_in_transaction_session_timeout={idle_timeout}',
+                # Let the OS notice half-open connections, e.g. after a database failover
+                'keepalives': 1,
+                'keepalives_idle': 30,
+                'keepalives_interval': 10,
+                'keepalives_count': 3,
+            },
+        }
+
+    return {'pool_recycle': 300, 'pool_pre_ping': True}
+
+
+def lift_timeouts(connection):
+    """Turn off the PostgreSQL profile's statement and idle-in-transaction timeouts for the current transaction"""
+    if connection.dialect.name == 'postgresql':
+        connection.exec_driver_sql('SET LOCAL statement_timeout = 0')
+        connection.exec_driver_sql('SET LOCAL idle_in_transaction_session_timeout = 0')
+
+
+@contextmanager
+def long_running_statements(session):
+    """Run a session's work without the request-sized timeouts, e.g. streamed exports and maintenance sweeps.
+
+    Covers the open transaction and every one begun inside the block, so
+    sweeps that commit per batch stay covered.
+    """
+    token = long_running.set(True)
+    try:
+        # Opens a transaction if there is none, which the after_begin hook covers too; lifting twice is harmless
+        lift_timeouts(session.connection())
+        yield
+    finally:
+        long_running.reset(token)
+
+
+def configure_engine(engine, profile, environ=os.environ):
+    """Install a profile's connect and checkout listeners on an engine"""
+    if profile == 'sqlite':
+        pragmas = (
+            # WAL lets readers run alongside the single writer instead of failing with "database is locked"
+            'PRAGMA journal_mode=WAL',
+            f'PRAGMA busy_timeout={int(environ.get("SQLITE_BUSY_TIMEOUT_MS", 5000))}',
+            # Durable across application crashes in WAL mode; only an OS crash can drop the last commits
+            'PRAGMA synchronous=NORMAL',
+            f'PRAGMA mmap_size={int(environ.get("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))}',
+            # Negative values are KiB rather than pages
+            f'PRAGMA cache_size={-int(environ.get("SQLITE_CACHE_SIZE_KB", 64 * 1024))}',
+        )
+
+        @event.listens_for(engine, 'connect')
+        def apply_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for pragma in pragmas:
+                cursor.execute(pragma)
+            cursor.close()
+
+    elif profile == 'postgresql':
+        @event.listens_for(Session, 'after_begin')
+        def lift_timeouts_for_long_running_work(session, transaction, connection):
+            if long_running.get() and connection.engine is engine:
+                lift_timeouts(connection)
@@ -0,0 +1,260 @@
+from app import db
+from bisect import bisect_left, bisect_right, insort
+from flask import current_app
+from models import LEADERBOARD_SORT_KEYS, Player, PlayerChange
+from sqlalchemy import func, or_
+import threading
+import time
+
+# Log entries applied one by one per poll; a longer backlog is cheaper to answer with a full reload
+MAX_INCREMENTAL_CHANGES = 5000
+
+# How long a skipped log id is re-checked: it may belong to a transaction that commits late
+CHANGE_GAP_GRACE_SECONDS = 60
+
+# How often each worker deletes change log entries older than LEADERBOARD_CHANGE_LOG_KEEP_HOURS
+CHANGE_LOG_PRUNE_SECONDS = 3600
+
+# Counters summed for LeaderboardIndex.get_statistics(), matching Player.compute_statistics()
+STATISTICS_TOTALS = {
+    'total_kills': 'kills',
+    'total_deaths': 'deaths',
+    'total_games': 'games_played',
+    'total_wins': 'wins',
+    'total_beds_broken': 'beds_broken',
+    'total_experience': 'experience',
+}
+
+
+def index_columns():
+    """Player columns kept for every indexed row; the rows work with Player.leaderboard_row_dict()"""
+    return (
+        Player.id, Player.nickname, Player.role, Player.level_value, Player.experience, Player.kills,
+        Player.final_kills, Player.deaths, Player.beds_broken, Player.wins, Player.games_played,
+        Player.kd_ratio_value, Player.fkd_ratio_value, Player.win_rate_value, Player.star_rating_value
+    )
+
+
+def sort_attribute(sort_by):
+    """Row attribute behind a sort option, falling back to experience like Player.get_sort_column()"""
+    return Player.get_sort_column(sort_by).key
+
+
+class LeaderboardIndex:
+    """Per-worker sorted copy of the leaderboard for top-N, rank and keyset reads without SQL.
+
+    Every sort option keeps a sorted list of ``(-value, id)`` keys, the same
+    order as ``ORDER BY column DESC, id``, so a rank is a bisection and a page
+    is a slice. At most every ``poll_seconds`` the index reads the PlayerChange
+    log past the last id it applied and re-reads just those players, so a
+    write in any worker shows up here without a full reload.
+    """
+
+    def __init__(self, poll_seconds=None):
+        self._poll_seconds = poll_seconds
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._rows = {}
+        self._orders = {}
+        self._totals = {}
+        self._last_change_id = None
+        self._gaps = {}
+        self._polled_at = 0.0
+        self._pruned_at = time.monotonic()
+
+    @property
+    def version(self):
+        """Last change log id applied, usable in ETags"""
+        return self._last_change_id
+
+    def sync(self, force=False):
+        """Catch up with the change log if the poll interval has passed (or force is set)"""
+        poll_seconds = self._poll_seconds
+        if poll_seconds is None:
+            poll_seconds = current_app.config.get('LEADERBOARD_INDEX_POLL_SECONDS', 2)
+        if not force and self._last_change_id is not None and time.monotonic() - self._polled_at < poll_seconds:
+            return
+
+        # One thread catches up at a time; the others keep reading the current copy meanwhile
+        if not self._sync_lock.acquire(blocking=self._last_change_id is None):
+            return
+        try:
+            if self._last_change_id is None:
+                self._reload()
+            else:
+                self._apply_changes()
+            self._polled_at = time.monotonic()
+            if self._polled_at - self._pruned_at >= CHANGE_LOG_PRUNE_SECONDS:
+                self._prune_change_log()
+        finally:
+            self._sync_lock.release()
+
+    def top(self, sort_by, limit, offset=0):
+        """Get leaderboard rows offset..offset+limit for a sort option"""
+        self.sync()
+        with self._lock:
+            keys = self._orders[sort_attribute(sort_by)][offset:offset + limit]
+            return [self._rows[player_id] for _, player_id in keys]
+
+    def page_after(self, sort_by, after=None, limit=50):
+        """Same result as Player.get_leaderboard_page(), with each row's rank added"""
+        self.sync()
+        attribute = sort_attribute(sort_by)
+        with self._lock:
+            order = self._orders[attribute]
+            start = 0
+            if after is not None:
+                after_value, after_id = after
+                start = bisect_right(order, (-after_value, after_id))
+            keys = order[start:start + limit + 1]
+            rows = [self._rows[player_id] for _, player_id in keys]
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = f'{getattr(rows[-1], attribute)}:{rows[-1].id}'
+
+        players = []
+        for offset, row in enumerate(rows):
+            player = Player.leaderboard_row_dict(row)
+            player['rank'] = start + offset + 1
+            players.append(player)
+        return players, next_cursor
+
+    def rank(self, sort_by, player_id):
+        """Get a player's 1-based rank and percentile, or None if the player is not indexed"""
+        self.sync()
+        attribute = sort_attribute(sort_by)
+        with self._lock:
+            row = self._rows.get(player_id)
+            if row is None:
+                return None
+            total = len(self._rows)
+            rank = bisect_left(self._orders[attribute], (-getattr(row, attribute), player_id)) + 1
+        return {'rank': rank, 'percentile': round((total - rank) / total * 100, 1)}
+
+    def get_statistics(self):
+        """Same result as Player.compute_statistics(), from running totals"""
+        self.sync()
+        with self._lock:
+            total_players = len(self._rows)
+            totals = dict(self._totals)
+            experience_order = self._orders['experience']
+            top = self._rows[experience_order[0][1]] if experience_order else None
+
+        top_player = None
+        if top is not None:
+            top_player = {
+                'nickname': top.nickname,
+                'level': top.level_value,
+                'experience': top.experience,
+                'kills': top.kills,
+                'wins': top.wins
+            }
+        average_experience = totals['total_experience'] / total_players if total_players else 0
+
+        return {
+            'total_players': total_players,
+            'total_kills': totals['total_kills'],
+            'total_deaths': totals['total_deaths'],
+            'total_games': totals['total_games'],
+            'total_wins': totals['total_wins'],
+            'total_beds_broken': totals['total_beds_broken'],
+            'average_level': round(average_experience / 1000) if average_experience else 0,
+            'top_player': top_player
+        }
+
+    def _reload(self):
+        # Read the log position first: changes committed while loading are applied again later
+        last_change_id = db.session.query(func.max(PlayerChange.id)).scalar() or 0
+        rows = db.session.query(*index_columns()).all()
+
+        attributes = [sort_attribute(sort_by) for sort_by in LEADERBOARD_SORT_KEYS]
+        orders = {attribute: sorted((-getattr(row, attribute), row.id) for row in rows) for attribute in attributes}
+        totals = {name: sum(getattr(row, field) for row in rows) for name, field in STATISTICS_TOTALS.items()}
+
+        with self._lock:
+            self._rows = {row.id: row for row in rows}
+            self._orders = orders
+            self._totals = totals
+            self._last_change_id = last_change_id
+            self._gaps = {}
+
+    def _prune_change_log(self):
+        # Own short transaction, so the caller's session is never committed from a read path
+        self._pruned_at = time.monotonic()
+        keep_hours = current_app.config.get('LEADERBOARD_CHANGE_LOG_KEEP_HOURS', 24)
+        try:
+            with db.engine.begin() as connection:
+                PlayerChange.prune(keep_hours, connection)
+        except Exception as e:
+            # Another writer may hold the lock; the next interval tries again
+            current_app.logger.warning(f"Error pruning leaderboard change log: {e}")
+
+    def _apply_changes(self):
+        now = time.monotonic()
+        self._gaps = {change_id: deadline for change_id, deadline in self._gaps.items() if deadline > now}
+        criteria = PlayerChange.id > self._last_change_id
+        if self._gaps:
+            criteria = or_(criteria, PlayerChange.id.in_(list(self._gaps)))
+        changes = db.session.query(PlayerChange.id, PlayerChange.player_id).filter(criteria) \
+            .order_by(PlayerChange.id).limit(MAX_INCREMENTAL_CHANGES + 1).all()
+        if not changes:
+            return
+
+        new_ids = [change_id for change_id, _ in changes if change_id > self._last_change_id]
+        if new_ids and new_ids[0] > self._last_change_id + 1:
+            # Either ids skipped by uncommitted or rolled back transactions, or a prune removed
+            # entries this worker never saw
+            oldest = db.session.query(func.min(PlayerChange.id)).scalar()
+            if oldest > self._last_change_id + 1:
+                self._reload()
+                return
+
+        if len(changes) > MAX_INCREMENTAL_CHANGES or any(player_id is None for _, player_id in changes):
+            self._reload()
+            return
+
+        expected = self._last_change_id + 1
+        for change_id in new_ids:
+            for missing in range(expected, change_id):
+                self._gaps[missing] = now + CHANGE_GAP_GRACE_SECONDS
+            expected = change_id + 1
+        for change_id, _ in changes:
+            self._gaps.pop(change_id, None)
+
+        player_ids = sorted({player_id for _, player_id in changes})
+        rows = {}
+        for start in range(0, len(player_ids), 500):
+            chunk = player_ids[start:start + 500]
+            rows.update((row.id, row) for row in
+                        db.session.query(*index_columns()).filter(Player.id.in_(chunk)))
+
+        with self._lock:
+            for player_id in player_ids:
+                self._replace(player_id, rows.get(player_id))
+            if new_ids:
+                self._last_change_id = new_ids[-1]
+
+    def _replace(self, player_id, row):
+        """Swap a player's indexed row for a fresh one (None removes the player)"""
+        old = self._rows.pop(player_id, None)
+        if old is not None:
+            for attribute, order in self._orders.items():
+                del order[bisect_left(order, (-getattr(old, attribute), player_id))]
+            for name, field in STATISTICS_TOTALS.items():
+                self._totals[name] -= getattr(old, field)
+        if row is not None:
+            self._rows[player_id] = row
+            for attribute, order in self._orders.items():
+                insort(order, (-getattr(row, attribute), player_id))
+            for name, field in STATISTICS_TOTALS.items():
+                self._totals[name] += getattr(row, field)
+
+
+leaderboard_index = LeaderboardIndex()
+
+
+def leaderboard_index_enabled():
+    """Whether routes should read the leaderboard from the in-process index"""
+    return current_app.config.get('LEADERBOARD_INDEX_ENABLED', False)
@@ -1,4 +1,8 @@
 from app import app
 
 if __name__ == '__main__':
+    # Local development server: set up the database here instead of running the deploy commands
+    from migrations import prepare_database
+    with app.app_context():
+        prepare_database()
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,134 @@
+from app import app, db
+from contextlib import contextmanager
+from db_profiles import lift_timeouts
+from models import Achievement, CacheVersion, Player, Quest, SchemaMigration
+from search import create_search_index
+from sqlalchemy import inspect, literal, select, text
+import fcntl
+import os
+
+# Key for pg_advisory_lock(); any constant shared by every deploy of this app works
+MIGRATION_LOCK_KEY = 7_384_219_505
+
+
+def add_missing_columns(connection, model):
+    """Add columns and indexes declared on a model but missing from an existing table"""
+    table = model.__table__
+    existing_columns = {column['name'] for column in inspect(connection).get_columns(table.name)}
+    added = []
+
+    for column in table.columns:
+        if column.name in existing_columns:
+            continue
+
+        column_type = column.type.compile(dialect=connection.dialect)
+        ddl = f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'
+        if column.default is not None and column.default.is_scalar:
+            default = literal(column.default.arg, column.type).compile(
+                dialect=connection.dialect, compile_kwargs={'literal_binds': True}
+            )
+            ddl += f' DEFAULT {default}'
+        if not column.nullable:
+            ddl += ' NOT NULL'
+        connection.execute(text(ddl))
+        added.append(column.name)
+
+    for index in table.indexes:
+        index.create(connection, checkfirst=True)
+
+    return added
+
+
+def create_tables(connection):
+    """Create missing tables, then add columns and indexes that older databases lack"""
+    db.metadata.create_all(connection)
+    for mapper in db.Model.registry.mappers:
+        add_missing_columns(connection, mapper.class_)
+
+
+def create_nickname_search_index(connection):
+    """Nickname search index for databases created before it existed (see search.py)"""
+    if connection.dialect.name == 'sqlite' and \
+            not connection.execute(text("SELECT sqlite_compileoption_used('ENABLE_FTS5')")).scalar():
+        return
+    create_search_index(connection)
+
+
+def backfill_derived_stats(connection, batch_size=1000):
+    """Recalculate persisted level, K/D, FK/D, win rate and star rating for every player"""
+    last_id = 0
+    while True:
+        player_ids = Player.update_derived_stats(connection, after_id=last_id, limit=batch_size)
+        if not player_ids:
+            break
+        last_id = player_ids[-1]
+
+
+def add_cache_version_timestamps(connection):
+    """Track when each cache version was last bumped, for Last-Modified headers"""
+    add_missing_columns(connection, CacheVersion)
+
+
+# Applied in order and recorded in schema_migration; append new steps, never edit or reorder applied ones
+MIGRATIONS = [
+    (1, 'create tables', create_tables),
+    (2, 'nickname search index', create_nickname_search_index),
+    (3, 'backfill derived stats', backfill_derived_stats),
+    (4, 'cache version timestamps', add_cache_version_timestamps),
+]
+
+
+@contextmanager
+def migration_lock():
+    """Serialize migrate and seed runs: a PostgreSQL advisory lock, or a file lock next to a local database"""
+    if db.engine.dialect.name == 'postgresql':
+        with db.engine.connect() as connection:
+            connection.execute(text('SELECT pg_advisory_lock(:key)'), {'key': MIGRATION_LOCK_KEY})
+            # Session-level lock: it outlives this transaction, which should not sit idle meanwhile
+            connection.commit()
+            try:
+                yield
+            finally:
+                connection.execute(text('SELECT pg_advisory_unlock(:key)'), {'key': MIGRATION_LOCK_KEY})
+                connection.commit()
+        return
+
+    os.makedirs(app.instance_path, exist_ok=True)
+    with open(os.path.join(app.instance_path, 'migrate.lock'), 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def run_migrations():
+    """Apply pending migrations, each in its own transaction; returns the names applied"""
+    applied = []
+    with db.engine.begin() as connection:
+        SchemaMigration.__table__.create(connection, checkfirst=True)
+        done = set(connection.execute(select(SchemaMigration.version)).scalars())
+
+    for version, name, migration in MIGRATIONS:
+        if version in done:
+            continue
+        with db.engine.begin() as connection:
+            # Index builds and backfills may outlast the request-sized statement timeout
+            lift_timeouts(connection)
+            migration(connection)
+            connection.execute(SchemaMigration.__table__.insert().values(version=version, name=name))
+        applied.append(name)
+    return applied
+
+
+def seed_defaults():
+    """Create the default quests and achievements that are missing; returns how many were added"""
+    return Quest.create_default_quests() + Achievement.create_default_achievements()
+
+
+def prepare_database():
+    """Migrate and seed under the migration lock; run once per deploy, before workers start"""
+    with migration_lock():
+        applied = run_migrations()
+        seeded = seed_defaults()
+    return applied, seeded
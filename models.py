@@ -1,7 +1,16 @@
 from app import db
-from datetime import datetime
-from sqlalchemy import func
+from avatars import DEFAULT_AVATAR_SIZE, is_proxied_avatar
+from cache import SnapshotCache
+from datetime import datetime, timedelta
+from flask import current_app, url_for
+from functools import lru_cache
+from sqlalchemy import Integer, and_, bindparam, case, cast, event, func, inspect, literal, or_, select, true, tuple_, update
+from sqlalchemy.orm import Session, aliased, joinedload
+from urllib.parse import urlencode, urlsplit, urlunsplit
+import hashlib
 import json
+import re
+import zlib
 
 class Player(db.Model):
     """Enhanced model for storing detailed player Bedwars statistics"""
@@ -27,6 +36,13 @@ class Player(db.Model):
     emerald_collected = db.Column(db.Integer, default=0, nullable=False)
     items_purchased = db.Column(db.Integer, default=0, nullable=False)
     
+    # Persisted derived statistics, kept in sync by refresh_derived_stats() for SQL-side sorting
+    level_value = db.Column(db.Integer, default=1, nullable=False)
+    kd_ratio_value = db.Column(db.Float, default=0, nullable=False)
+    fkd_ratio_value = db.Column(db.Float, default=0, nullable=False)
+    win_rate_value = db.Column(db.Float, default=0, nullable=False)
+    star_rating_value = db.Column(db.Integer, default=1, nullable=False)
+    
     # Minecraft skin system
     skin_url = db.Column(db.String(255), nullable=True)  # Custom skin URL from NameMC
     skin_type = db.Column(db.String(10), default='auto', nullable=False)  # auto, steve, alex, custom
@@ -61,6 +77,22 @@ class Player(db.Model):
     social_section_color = db.Column(db.String(7), default='#343a40', nullable=True)
     prefs_section_color = db.Column(db.String(7), default='#343a40', nullable=True)
     
+    # Leaderboard indexes match ORDER BY <column> DESC, id so sorting never needs a temp table
+    __table_args__ = (
+        db.Index('ix_player_experience_rank', experience.desc(), id),
+        db.Index('ix_player_kills_rank', kills.desc(), id),
+        db.Index('ix_player_final_kills_rank', final_kills.desc(), id),
+        db.Index('ix_player_beds_broken_rank', beds_broken.desc(), id),
+        db.Index('ix_player_wins_rank', wins.desc(), id),
+        db.Index('ix_player_level_rank', level_value.desc(), id),
+        db.Index('ix_player_kd_ratio_rank', kd_ratio_value.desc(), id),
+        db.Index('ix_player_fkd_ratio_rank', fkd_ratio_value.desc(), id),
+        db.Index('ix_player_win_rate_rank', win_rate_value.desc(), id),
+        db.Index('ix_player_star_rating_rank', star_rating_value.desc(), id),
+        db.Index('ix_player_created_at', created_at),
+        db.Index('ix_player_last_updated', last_updated),
+    )
+    
     # Relationships for quest system
     player_quests = db.relationship('PlayerQuest', backref='player', lazy=True, cascade='all, delete-orphan')
     player_achievements = db.relationship('PlayerAchievement', backref='player', lazy=True, cascade='all, delete-orphan')
@@ -68,6 +100,9 @@ class Player(db.Model):
     @property
     def active_custom_title(self):
         """Get player's active custom title"""
+        cosmetics = self.__dict__.get('_cosmetics')
+        if cosmetics is not None:
+            return cosmetics['title']
         player_title = PlayerTitle.query.filter_by(
             player_id=self.id, 
             is_active=True
@@ -76,6 +111,9 @@ class Player(db.Model):
     
     def get_gradient_for_element(self, element_type):
         """Get gradient setting for specific element type"""
+        cosmetics = self.__dict__.get('_cosmetics')
+        if cosmetics is not None:
+            return cosmetics['gradients'].get(element_type)
         setting = PlayerGradientSetting.query.filter_by(
             player_id=self.id,
             element_type=element_type,
@@ -83,6 +121,31 @@ class Player(db.Model):
         ).first()
         return setting.css_gradient if setting else None
     
+    def gradient_class(self, element_type):
+        """Get the gradients stylesheet class for an element type, or None"""
+        cosmetics = self.__dict__.get('_cosmetics')
+        if cosmetics is not None:
+            return cosmetics['gradient_classes'].get(element_type)
+        setting = PlayerGradientSetting.query.filter_by(
+            player_id=self.id,
+            element_type=element_type,
+            is_enabled=True
+        ).first()
+        return setting.css_class if setting else None
+    
+    @property
+    def cosmetics_version(self):
+        """Fingerprint of the player's displayed gradients and title, used in fragment cache keys"""
+        cosmetics = self.__dict__.get('_cosmetics')
+        if cosmetics is None:
+            Player.preload_cosmetics([self])
+            cosmetics = self._cosmetics
+        title = cosmetics['title']
+        title_key = (title.id, title.display_name, title.color, title.glow_color) if title else None
+        fingerprint = repr((sorted(cosmetics['gradients'].items()), sorted(cosmetics['gradient_classes'].items()),
+                            title_key))
+        return hashlib.md5(fingerprint.encode()).hexdigest()
+    
     @property
     def nickname_gradient(self):
         """Get nickname gradient CSS"""
@@ -248,28 +311,59 @@ class Player(db.Model):
         # Convert to 1-5 star rating
         return min(5, max(1, round(base_score / 13)))
     
+    def refresh_derived_stats(self):
+        """Recalculate persisted derived statistics from the raw counters"""
+        # Column defaults are applied only by the INSERT, so Player(nickname='x') reaches here with None counters
+        for field in DERIVED_STAT_DEPENDENCIES['star_rating']:
+            if getattr(self, field) is None:
+                setattr(self, field, 0)
+        for stat in PERSISTED_DERIVED_STATS:
+            setattr(self, f'{stat}_value', getattr(self, stat))
+    
     @property
     def minecraft_skin_url(self):
-        """Get Minecraft skin URL based on skin type and settings"""
+        """Get the avatar URL for templates, served through the local avatar cache when possible"""
+        return self.avatar_url(DEFAULT_AVATAR_SIZE)
+
+    def avatar_url(self, size=DEFAULT_AVATAR_SIZE):
+        """Get the /avatar URL for one size variant; v changes with the skin so browsers can cache it long"""
+        if self.custom_avatar_url and not is_proxied_avatar(self.custom_avatar_url):
+            return self.custom_avatar_url
+        return url_for('avatar', player_id=self.id, size=size, v=self.avatar_version)
+
+    @property
+    def avatar_version(self):
+        """Cheap fingerprint of the settings that pick the avatar image"""
+        settings = f'{self.custom_avatar_url}|{self.skin_type}|{self.skin_url}|{self.is_premium}|{self.nickname}'
+        return format(zlib.crc32(settings.encode()), '08x')
+
+    def avatar_source(self, size=DEFAULT_AVATAR_SIZE):
+        """Get the upstream image URL for the player's avatar based on skin type and settings"""
         # Use custom avatar if set
         if self.custom_avatar_url:
             return self.custom_avatar_url
             
         if self.skin_type == 'custom' and self.skin_url:
+            parts = urlsplit(self.skin_url)
+            if parts.hostname == 'crafatar.com':
+                # Crafatar renders any size, so request the variant instead of scaling the stored one
+                return urlunsplit(parts._replace(query=urlencode({'size': size})))
             return self.skin_url
         elif self.skin_type == 'steve':
-            return 'https://mc-heads.net/avatar/steve/128'
+            return f'https://mc-heads.net/avatar/steve/{size}'
         elif self.skin_type == 'alex':
-            return 'https://mc-heads.net/avatar/alex/128'
+            return f'https://mc-heads.net/avatar/alex/{size}'
         elif self.is_premium and self.nickname:
             # Try to get premium skin by nickname
-            return f'https://mc-heads.net/avatar/{self.nickname}/128'
+            return f'https://mc-heads.net/avatar/{self.nickname}/{size}'
         else:
-            # Default to steve/alex randomly based on nickname hash
-            import hashlib
-            hash_val = int(hashlib.md5(self.nickname.encode()).hexdigest(), 16)
-            default_skin = 'alex' if hash_val % 2 else 'steve'
-            return f'https://mc-heads.net/avatar/{default_skin}/128'
+            return f'https://mc-heads.net/avatar/{self.default_skin}/{size}'
+
+    @property
+    def default_skin(self):
+        """Steve or Alex, picked from the nickname hash for players without a skin"""
+        hash_val = int(hashlib.md5(self.nickname.encode()).hexdigest(), 16)
+        return 'alex' if hash_val % 2 else 'steve'
     
     def set_custom_skin(self, namemc_url):
         """Set custom skin from NameMC URL"""
@@ -289,71 +383,405 @@ class Player(db.Model):
                 pass
         return False
 
+    @classmethod
+    def get_sort_column(cls, sort_by):
+        """Get the indexed column backing a leaderboard sort option (see LEADERBOARD_SORT_KEYS)"""
+        sort_columns = {
+            'experience': cls.experience,
+            'kills': cls.kills,
+            'final_kills': cls.final_kills,
+            'beds_broken': cls.beds_broken,
+            'wins': cls.wins,
+            'level': cls.level_value,
+            'kd_ratio': cls.kd_ratio_value,
+            'fkd_ratio': cls.fkd_ratio_value,
+            'win_rate': cls.win_rate_value,
+            'star_rating': cls.star_rating_value
+        }
+        return sort_columns.get(sort_by, cls.experience)
+
+    @classmethod
+    def leaderboard_query(cls, sort_by='experience'):
+        """Build the ordered leaderboard query for a sort option"""
+        sort_column = cls.get_sort_column(sort_by)
+        return cls.query.order_by(sort_column.desc(), cls.id)
+
     @classmethod
     def get_leaderboard(cls, sort_by='experience', limit=50):
         """Get top players ordered by specified field"""
-        if sort_by == 'experience':
-            return cls.query.order_by(cls.experience.desc()).limit(limit).all()
-        elif sort_by == 'kills':
-            return cls.query.order_by(cls.kills.desc()).limit(limit).all()
-        elif sort_by == 'final_kills':
-            return cls.query.order_by(cls.final_kills.desc()).limit(limit).all()
-        elif sort_by == 'beds_broken':
-            return cls.query.order_by(cls.beds_broken.desc()).limit(limit).all()
-        elif sort_by == 'wins':
-            return cls.query.order_by(cls.wins.desc()).limit(limit).all()
-        elif sort_by == 'level':
-            return sorted(cls.query.all(), key=lambda p: p.level, reverse=True)[:limit]
-        elif sort_by == 'kd_ratio':
-            return sorted(cls.query.all(), key=lambda p: p.kd_ratio, reverse=True)[:limit]
-        elif sort_by == 'win_rate':
-            return sorted(cls.query.all(), key=lambda p: p.win_rate, reverse=True)[:limit]
-        else:
-            return cls.query.order_by(cls.experience.desc()).limit(limit).all()
+        return cls.leaderboard_query(sort_by).limit(limit).all()
 
     @classmethod
-    def search_players(cls, query):
-        """Search players by nickname"""
-        return cls.query.filter(cls.nickname.ilike(f'%{query}%')).all()
+    def get_leaderboard_page(cls, sort_by='experience', after=None, limit=50):
+        """Get one keyset page of compact leaderboard rows and the cursor for the next page.
+
+        ``after`` is the ``(sort value, id)`` of the last row already seen, so
+        every page is an index seek no matter how deep it is.
+        """
+        sort_column = cls.get_sort_column(sort_by)
+        query = cls.leaderboard_query(sort_by).with_entities(*cls.leaderboard_entities(sort_by))
+        if after is not None:
+            after_value, after_id = after
+            # The redundant <= bound lets the (column DESC, id) index start at the cursor
+            query = query.filter(
+                sort_column <= after_value,
+                or_(sort_column < after_value, cls.id > after_id)
+            )
+
+        rows = query.limit(limit + 1).all()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = f'{rows[-1].sort_value}:{rows[-1].id}'
+
+        return [cls.leaderboard_row_dict(row) for row in rows], next_cursor
 
     @classmethod
-    def get_statistics(cls):
-        """Get overall leaderboard statistics"""
-        total_players = cls.query.count()
-        if total_players == 0:
-            return {
-                'total_players': 0,
-                'total_kills': 0,
-                'total_deaths': 0,
-                'total_games': 0,
-                'total_wins': 0,
-                'total_beds_broken': 0,
-                'average_level': 0,
-                'top_player': None
-            }
-            
-        stats = db.session.query(
+    def leaderboard_entities(cls, sort_by):
+        """Columns selected for compact leaderboard rows (see leaderboard_row_dict)"""
+        return (
+            cls.id, cls.nickname, cls.role, cls.get_sort_column(sort_by).label('sort_value'),
+            cls.level_value, cls.experience, cls.kills, cls.final_kills, cls.deaths,
+            cls.beds_broken, cls.wins, cls.games_played,
+            cls.kd_ratio_value, cls.fkd_ratio_value, cls.win_rate_value
+        )
+
+    @staticmethod
+    def leaderboard_row_dict(row):
+        """Convert a row selected with leaderboard_entities() into the API representation"""
+        return {
+            'id': row.id,
+            'nickname': row.nickname,
+            'role': row.role,
+            'level': row.level_value,
+            'experience': row.experience,
+            'kills': row.kills,
+            'final_kills': row.final_kills,
+            'deaths': row.deaths,
+            'beds_broken': row.beds_broken,
+            'wins': row.wins,
+            'games_played': row.games_played,
+            'kd_ratio': row.kd_ratio_value,
+            'fkd_ratio': row.fkd_ratio_value,
+            'win_rate': row.win_rate_value
+        }
+
+    @classmethod
+    def get_ranks(cls, sort_keys, player_ids):
+        """Get 1-based ranks and percentiles for several players and sort options in one query.
+
+        A rank is one plus the players ahead in ``ORDER BY column DESC, id``,
+        counted with two range scans of the leaderboard index. Percentile is
+        the share of players ranked below. Returns
+        ``{player_id: {sort_key: {'rank': ..., 'percentile': ...}}}``.
+        """
+        player_ids = list(player_ids)
+        if not player_ids:
+            return {}
+
+        rank_columns = []
+        for sort_by in sort_keys:
+            other = aliased(cls)
+            sort_column = cls.get_sort_column(sort_by)
+            other_column = getattr(other, sort_column.key)
+            ahead = select(func.count()).select_from(other).where(other_column > sort_column) \
+                .correlate_except(other).scalar_subquery()
+            tied_ahead = select(func.count()).select_from(other).where(
+                other_column == sort_column, other.id < cls.id
+            ).correlate_except(other).scalar_subquery()
+            rank_columns.append((ahead + tied_ahead + 1).label(f'rank_{sort_by}'))
+        total = select(func.count()).select_from(aliased(cls)).scalar_subquery().label('total')
+
+        rows = db.session.query(cls.id, total, *rank_columns).filter(cls.id.in_(player_ids)).all()
+        ranks = {}
+        for row in rows:
+            ranks[row.id] = {}
+            for sort_by in sort_keys:
+                rank = getattr(row, f'rank_{sort_by}')
+                ranks[row.id][sort_by] = {
+                    'rank': rank,
+                    'percentile': round((row.total - rank) / row.total * 100, 1)
+                }
+        return ranks
+
+    @classmethod
+    def get_leaderboard_around(cls, sort_by, player, count=5):
+        """Get the player's leaderboard row with up to count rows above and below, each with its rank"""
+        sort_column = cls.get_sort_column(sort_by)
+        value = getattr(player, sort_column.key)
+        rank = cls.get_ranks([sort_by], [player.id])[player.id][sort_by]
+
+        # Walk the index backwards from the player for the rows above
+        above = cls.query.with_entities(*cls.leaderboard_entities(sort_by)).filter(
+            sort_column >= value,
+            or_(sort_column > value, cls.id < player.id)
+        ).order_by(sort_column.asc(), cls.id.desc()).limit(count).all()[::-1]
+        below, _ = cls.get_leaderboard_page(sort_by, after=(value, player.id), limit=count)
+
+        players = [cls.leaderboard_row_dict(row) for row in above] + [cls.leaderboard_row_dict(player)] + below
+        first_rank = rank['rank'] - len(above)
+        for offset, row in enumerate(players):
+            row['rank'] = first_rank + offset
+        return players, rank
+
+    @classmethod
+    def parse_leaderboard_cursor(cls, sort_by, cursor):
+        """Parse a 'value:id' cursor from get_leaderboard_page(), raising ValueError if malformed"""
+        value, player_id = cursor.rsplit(':', 1)
+        sort_column = cls.get_sort_column(sort_by)
+        python_type = sort_column.type.python_type
+        return python_type(value), int(player_id)
+
+    @classmethod
+    def get_leaderboard_version(cls):
+        """Get a token that changes whenever any leaderboard row changes"""
+        latest_update = db.session.query(func.max(cls.last_updated)).scalar()
+        return f'{latest_update.isoformat() if latest_update else "empty"}:{CacheVersion.current("statistics")}'
+
+    def get_profile_version(self):
+        """Validators for the profile pages in one query: (version string, last modified time).
+
+        Covers the player's row, their cosmetics (latest assignment plus
+        counts and the active title, so removals and switches count too),
+        their achievement count and the 'titles' cache version. Ranks move
+        with every other player's stats, so the pages load them separately
+        (see the player_ranks route) and other players' writes leave these
+        validators alone.
+        """
+        cls = type(self)
+        enabled_gradients = (PlayerGradientSetting.player_id == self.id, PlayerGradientSetting.is_enabled == True)
+        row = db.session.query(
+            select(cls.last_updated).where(cls.id == self.id).scalar_subquery(),
+            select(func.max(PlayerGradientSetting.assigned_at)).where(*enabled_gradients).scalar_subquery(),
+            select(func.count(PlayerGradientSetting.id)).where(*enabled_gradients).scalar_subquery(),
+            select(func.max(PlayerTitle.assigned_at)).where(PlayerTitle.player_id == self.id).scalar_subquery(),
+            select(func.count(PlayerTitle.id)).where(PlayerTitle.player_id == self.id).scalar_subquery(),
+            select(PlayerTitle.title_id).where(PlayerTitle.player_id == self.id,
+                                               PlayerTitle.is_active == True).limit(1).scalar_subquery(),
+            select(func.count(PlayerAchievement.id)).where(PlayerAchievement.player_id == self.id).scalar_subquery(),
+            select(CacheVersion.version).where(CacheVersion.name == 'titles').scalar_subquery(),
+            select(CacheVersion.updated_at).where(CacheVersion.name == 'titles').scalar_subquery()
+        ).one()
+
+        player_updated, gradient_assigned, _, title_assigned, _, _, _, _, titles_updated = row
+        last_modified = max(value for value in (player_updated, gradient_assigned, title_assigned, titles_updated)
+                            if value is not None)
+        return '|'.join(map(str, row)), last_modified
+
+    @classmethod
+    def preload_cosmetics(cls, players):
+        """Load enabled gradients and active titles for a page of players in two queries"""
+        players = list(players)
+        if not players:
+            return players
+
+        player_ids = [player.id for player in players]
+        cosmetics = {player_id: {'gradients': {}, 'gradient_classes': {}, 'title': None} for player_id in player_ids}
+
+        settings = PlayerGradientSetting.query.options(
+            joinedload(PlayerGradientSetting.gradient_theme)
+        ).filter(
+            PlayerGradientSetting.player_id.in_(player_ids),
+            PlayerGradientSetting.is_enabled == True
+        ).order_by(PlayerGradientSetting.id).all()
+        for setting in settings:
+            # Keep the first matching row, like the per-player .first() lookup
+            cosmetics[setting.player_id]['gradients'].setdefault(setting.element_type, setting.css_gradient)
+            cosmetics[setting.player_id]['gradient_classes'].setdefault(setting.element_type, setting.css_class)
+
+        player_titles = PlayerTitle.query.options(
+            joinedload(PlayerTitle.title)
+        ).filter(
+            PlayerTitle.player_id.in_(player_ids),
+            PlayerTitle.is_active == True
+        ).order_by(PlayerTitle.id).all()
+        for player_title in player_titles:
+            if cosmetics[player_title.player_id]['title'] is None:
+                cosmetics[player_title.player_id]['title'] = player_title.title
+
+        for player in players:
+            player._cosmetics = cosmetics[player.id]
+        return players
+
+    @classmethod
+    def search_players(cls, query, limit=50):
+        """Search players by nickname, best matches first (see search.search_query)"""
+        from search import search_query
+        return search_query(query, limit).all()
+
+    @classmethod
+    def get_level_distribution(cls):
+        """Count players per level with a single GROUP BY.
+
+        Groups on the persisted level_value instead of a CASE over the
+        experience thresholds: it holds Player.level for every row (see
+        update_derived_stats), the bands are the per-level ones /api/stats
+        returns, and ix_player_level_rank serves the grouping without a sort.
+        """
+        rows = db.session.query(
+            cls.level_value, func.count(cls.id)
+        ).group_by(cls.level_value).order_by(cls.level_value).all()
+        return {f'Level {level}': count for level, count in rows}
+
+    @classmethod
+    def get_distribution(cls, field):
+        """Count players per band of a derived stat (see DISTRIBUTION_BANDS) with a single GROUP BY"""
+        values = {
+            'kd_ratio': cls.kd_ratio_value,
+            'win_rate': cls.win_rate_value,
+            'resources': cls.iron_collected + cls.gold_collected + cls.diamond_collected + cls.emerald_collected
+        }
+        bands = DISTRIBUTION_BANDS[field]
+        bucket = case(
+            *[(values[field] < upper, index) for index, (upper, label) in enumerate(bands[:-1])],
+            else_=len(bands) - 1
+        ).label('bucket')
+
+        counts = dict(db.session.query(bucket, func.count(cls.id)).group_by(bucket).all())
+        return {label: counts.get(index, 0) for index, (upper, label) in enumerate(bands)}
+
+    @classmethod
+    def compute_statistics(cls):
+        """Compute overall leaderboard statistics and the top player in one query"""
+        totals = db.session.query(
+            func.count(cls.id).label('total_players'),
             func.sum(cls.kills).label('total_kills'),
             func.sum(cls.deaths).label('total_deaths'),
             func.sum(cls.games_played).label('total_games'),
             func.sum(cls.wins).label('total_wins'),
             func.sum(cls.beds_broken).label('total_beds_broken'),
             func.avg(cls.experience).label('average_experience')
-        ).first()
-        
-        top_player = cls.query.order_by(cls.experience.desc()).first()
-        
+        ).subquery()
+        top = db.session.query(
+            cls.nickname, cls.level_value, cls.experience, cls.kills, cls.wins
+        ).order_by(cls.experience.desc(), cls.id).limit(1).subquery()
+
+        stats = db.session.query(totals, top).select_from(totals).outerjoin(top, true()).one()
+
+        top_player = None
+        if stats.nickname is not None:
+            top_player = {
+                'nickname': stats.nickname,
+                'level': stats.level_value,
+                'experience': stats.experience,
+                'kills': stats.kills,
+                'wins': stats.wins
+            }
+
         return {
-            'total_players': total_players,
-            'total_kills': int(stats.total_kills) if stats and stats.total_kills else 0,
-            'total_deaths': int(stats.total_deaths) if stats and stats.total_deaths else 0,
-            'total_games': int(stats.total_games) if stats and stats.total_games else 0,
-            'total_wins': int(stats.total_wins) if stats and stats.total_wins else 0,
-            'total_beds_broken': int(stats.total_beds_broken) if stats and stats.total_beds_broken else 0,
-            'average_level': round(stats.average_experience / 1000) if stats and stats.average_experience else 0,
+            'total_players': stats.total_players,
+            'total_kills': int(stats.total_kills or 0),
+            'total_deaths': int(stats.total_deaths or 0),
+            'total_games': int(stats.total_games or 0),
+            'total_wins': int(stats.total_wins or 0),
+            'total_beds_broken': int(stats.total_beds_broken or 0),
+            'average_level': round(stats.average_experience / 1000) if stats.average_experience else 0,
             'top_player': top_player
         }
 
+    @classmethod
+    def get_statistics(cls):
+        """Get overall leaderboard statistics, cached per worker until stats change"""
+        return dict(statistics_cache.get(cls.compute_statistics))
+
+    @classmethod
+    def apply_stat_deltas(cls, deltas):
+        """Add per-player stat deltas (nickname -> {field: delta}) in one bulk UPSERT.
+
+        Counters are incremented in SQL (``col = col + delta``, see
+        upsert_increments), so concurrent batches never lose updates, and
+        unknown nicknames become new players.
+        Does not commit; returns the touched player ids and how many were created.
+        """
+        nicknames = list(deltas)
+        now = datetime.utcnow()
+        rows = [
+            {'nickname': nickname, 'last_updated': now,
+             **{field: delta.get(field, 0) for field in STAT_DELTA_FIELDS}}
+            for nickname, delta in deltas.items()
+        ]
+        existing = {nickname for (nickname,) in
+                    db.session.query(cls.nickname).filter(cls.nickname.in_(nicknames))}
+
+        upsert_increments(cls.__table__, rows, ('nickname',), STAT_DELTA_FIELDS, replace_columns=('last_updated',))
+        if len(existing) < len(nicknames):
+            # New players came in through the Core upsert, which the flush listeners do not see
+            CacheVersion.bump(db.session.connection(), 'nicknames')
+
+        player_ids = cls.refresh_derived_stats_where(cls.nickname.in_(nicknames))
+        return player_ids, len(nicknames) - len(existing)
+
+    @classmethod
+    def update_derived_stats(cls, connection, *criteria, after_id=0, limit=None):
+        """Rewrite the persisted derived stats of matching players from their counters; returns their ids.
+
+        The formulas stay in the Python properties: only the counters are read,
+        and rows whose derived values changed are written back in one
+        executemany UPDATE. Pass after_id and limit to walk the table in batches.
+        """
+        table = cls.__table__
+        derived_fields = [f'{stat}_value' for stat in PERSISTED_DERIVED_STATS]
+        counters = sorted({field for stat in PERSISTED_DERIVED_STATS for field in DERIVED_STAT_DEPENDENCIES[stat]})
+        query = select(
+            table.c.id, table.c.last_updated, *[table.c[field] for field in counters + derived_fields]
+        ).where(table.c.id > after_id, *criteria).order_by(table.c.id)
+        if limit is not None:
+            query = query.limit(limit)
+        rows = connection.execute(query).all()
+
+        updates = []
+        for row in rows:
+            # Transient, never added to a session; only used to run the stat formulas
+            player = cls(**{field: getattr(row, field) for field in counters})
+            player.refresh_derived_stats()
+            values = {field: getattr(player, field) for field in derived_fields}
+            if any(values[field] != getattr(row, field) for field in derived_fields):
+                # Keep the timestamp: recomputing is not a stat change
+                updates.append({'derived_player_id': row.id, 'last_updated': row.last_updated, **values})
+        if updates:
+            connection.execute(table.update().where(table.c.id == bindparam('derived_player_id')), updates)
+        return [row.id for row in rows]
+
+    @classmethod
+    def refresh_derived_stats_where(cls, *criteria):
+        """Recompute persisted derived stats after a Core UPDATE of counters; returns the matching ids"""
+        connection = db.session.connection()
+        player_ids = cls.update_derived_stats(connection, *criteria)
+        # The Core UPDATEs bypassed the session, so reload players it already holds on next access
+        for obj in list(db.session.identity_map.values()):
+            if isinstance(obj, cls):
+                db.session.expire(obj)
+        CacheVersion.bump(connection, 'statistics')
+        PlayerChange.record(connection, player_ids)
+        return player_ids
+
+    @classmethod
+    def add_experience(cls, rewards):
+        """Add reward XP (player id -> xp) in one executemany UPDATE and refresh those players' derived stats"""
+        rewards = {player_id: xp for player_id, xp in rewards.items() if xp}
+        if not rewards:
+            return []
+        table = cls.__table__
+        db.session.execute(
+            table.update().where(table.c.id == bindparam('reward_player_id'))
+            .values(experience=table.c.experience + bindparam('reward_xp'), last_updated=datetime.utcnow()),
+            [{'reward_player_id': player_id, 'reward_xp': xp} for player_id, xp in rewards.items()]
+        )
+        return cls.refresh_derived_stats_where(cls.id.in_(list(rewards)))
+
+    def changed_fields(self):
+        """Names of columns with pending, unflushed changes"""
+        state = inspect(self)
+        return {attr.key for attr in state.mapper.column_attrs if state.attrs[attr.key].history.has_changes()}
+
+    def get_quest_stat(self, quest_type):
+        """Current value of the stat a quest type tracks (see Quest.stat_expression)"""
+        if quest_type == 'resources':
+            return self.total_resources
+        if quest_type in ACHIEVEMENT_CONDITION_EXPRESSIONS:
+            return int(getattr(self, quest_type))
+        return getattr(self, quest_type, 0)
+
     def update_stats(self, **kwargs):
         """Update player statistics"""
         for key, value in kwargs.items():
@@ -390,6 +818,595 @@ class Player(db.Model):
         return player
 
 
+class CacheVersion(db.Model):
+    """Shared version counters used to invalidate per-worker caches"""
+    
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=True)  # Last bump, for Last-Modified headers
+    
+    def __repr__(self):
+        return f'<CacheVersion {self.name}: {self.version}>'
+    
+    @classmethod
+    def current(cls, name):
+        """Get the current version of a named cache"""
+        return db.session.query(cls.version).filter_by(name=name).scalar() or 0
+    
+    @classmethod
+    def bump(cls, connection, name):
+        """Increment a named cache version inside the caller's transaction"""
+        table = cls.__table__
+        now = datetime.utcnow()
+        result = connection.execute(
+            table.update().where(table.c.name == name).values(version=table.c.version + 1, updated_at=now)
+        )
+        if result.rowcount == 0:
+            connection.execute(table.insert().values(name=name, version=1, updated_at=now))
+
+
+class SchemaMigration(db.Model):
+    """Schema migrations already applied to this database (see migrations.py)"""
+    
+    version = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(200), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    def __repr__(self):
+        return f'<SchemaMigration {self.version}: {self.name}>'
+
+
+class PlayerChange(db.Model):
+    """Append-only log of players whose leaderboard rows changed, polled by leaderboard.LeaderboardIndex.
+
+    A row with no player_id means an unknown set of players changed (a
+    bulk UPDATE or DELETE) and readers must reload everything.
+    """
+    
+    id = db.Column(db.Integer, primary_key=True)
+    player_id = db.Column(db.Integer, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    # Ids are the readers' position in the log, so they must never be reused after a prune
+    __table_args__ = (
+        db.Index('ix_player_change_created_at', 'created_at'),
+        {'sqlite_autoincrement': True},
+    )
+    
+    def __repr__(self):
+        return f'<PlayerChange {self.id}: {self.player_id}>'
+    
+    @classmethod
+    def record(cls, connection, player_ids):
+        """Append changed player ids (None for "everything") inside the caller's transaction.
+
+        Nothing is written unless LEADERBOARD_INDEX_ENABLED is set, since no
+        worker reads the log then; an index that is turned on later starts
+        with a full load anyway.
+        """
+        if not current_app.config.get('LEADERBOARD_INDEX_ENABLED', False):
+            return
+        now = datetime.utcnow()
+        rows = [{'player_id': None, 'created_at': now}] if player_ids is None else \
+            [{'player_id': player_id, 'created_at': now} for player_id in player_ids]
+        if rows:
+            connection.execute(cls.__table__.insert(), rows)
+    
+    @classmethod
+    def prune(cls, keep_hours=24, connection=None):
+        """Delete log entries older than keep_hours; readers that fall behind them reload. Does not commit."""
+        cutoff = datetime.utcnow() - timedelta(hours=keep_hours)
+        return (connection or db.session).execute(
+            cls.__table__.delete().where(cls.created_at < cutoff)
+        ).rowcount
+
+
+class IngestBatch(db.Model):
+    """Idempotency keys of stat batches already applied through /api/ingest"""
+    
+    idempotency_key = db.Column(db.String(100), primary_key=True)
+    players_updated = db.Column(db.Integer, default=0, nullable=False)
+    players_created = db.Column(db.Integer, default=0, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<IngestBatch {self.idempotency_key}>'
+
+
+class Match(db.Model):
+    """One finished game reported by a game server, with per-player stat deltas"""
+    
+    id = db.Column(db.Integer, primary_key=True)
+    server_ip = db.Column(db.String(100), default='', nullable=True)
+    map_name = db.Column(db.String(100), nullable=True)
+    mode = db.Column(db.String(50), nullable=True)
+    ended_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_match_ended_at', 'ended_at'),
+    )
+    
+    participants = db.relationship('MatchParticipant', backref='match', lazy=True,
+                                   cascade='all, delete-orphan', passive_deletes=True)
+    
+    def __repr__(self):
+        return f'<Match {self.id} at {self.ended_at}>'
+    
+    @classmethod
+    def record(cls, deltas, server_ip='', map_name=None, mode=None, ended_at=None):
+        """Store a match with its participants' deltas (nickname -> {field: delta}) and add them to the rollups.
+
+        The players must already exist (see Player.apply_stat_deltas). Does
+        not commit.
+        """
+        match = cls(server_ip=server_ip, map_name=map_name, mode=mode,
+                    ended_at=ended_at or datetime.utcnow())
+        db.session.add(match)
+        db.session.flush()
+
+        rows = [{'match_id': match.id, **row} for row in PlayerStatRollup.delta_rows(deltas)]
+        db.session.execute(MatchParticipant.__table__.insert(), rows)
+        PlayerStatRollup.add(match.ended_at, rows)
+        return match
+
+
+class MatchParticipant(db.Model):
+    """A player's stat deltas in one match"""
+    
+    id = db.Column(db.Integer, primary_key=True)
+    match_id = db.Column(db.Integer, db.ForeignKey('match.id', ondelete='CASCADE'), nullable=False)
+    player_id = db.Column(db.Integer, db.ForeignKey('player.id', ondelete='CASCADE'), nullable=False)
+    kills = db.Column(db.Integer, default=0, nullable=False)
+    final_kills = db.Column(db.Integer, default=0, nullable=False)
+    deaths = db.Column(db.Integer, default=0, nullable=False)
+    beds_broken = db.Column(db.Integer, default=0, nullable=False)
+    games_played = db.Column(db.Integer, default=0, nullable=False)
+    wins = db.Column(db.Integer, default=0, nullable=False)
+    experience = db.Column(db.Integer, default=0, nullable=False)
+    iron_collected = db.Column(db.Integer, default=0, nullable=False)
+    gold_collected = db.Column(db.Integer, default=0, nullable=False)
+    diamond_collected = db.Column(db.Integer, default=0, nullable=False)
+    emerald_collected = db.Column(db.Integer, default=0, nullable=False)
+    items_purchased = db.Column(db.Integer, default=0, nullable=False)
+    
+    __table_args__ = (
+        db.Index('ix_match_participant_match', 'match_id'),
+        db.Index('ix_match_participant_player', 'player_id', 'match_id'),
+    )
+    
+    def __repr__(self):
+        return f'<MatchParticipant {self.match_id}:{self.player_id}>'
+
+
+class PlayerStatRollup(db.Model):
+    """Per-player stat totals for one hour or one day, maintained incrementally as matches are recorded"""
+    
+    id = db.Column(db.Integer, primary_key=True)
+    period = db.Column(db.String(10), nullable=False)  # hour, day
+    period_start = db.Column(db.DateTime, nullable=False)
+    player_id = db.Column(db.Integer, db.ForeignKey('player.id', ondelete='CASCADE'), nullable=False)
+    kills = db.Column(db.Integer, default=0, nullable=False)
+    final_kills = db.Column(db.Integer, default=0, nullable=False)
+    deaths = db.Column(db.Integer, default=0, nullable=False)
+    beds_broken = db.Column(db.Integer, default=0, nullable=False)
+    games_played = db.Column(db.Integer, default=0, nullable=False)
+    wins = db.Column(db.Integer, default=0, nullable=False)
+    experience = db.Column(db.Integer, default=0, nullable=False)
+    iron_collected = db.Column(db.Integer, default=0, nullable=False)
+    gold_collected = db.Column(db.Integer, default=0, nullable=False)
+    diamond_collected = db.Column(db.Integer, default=0, nullable=False)
+    emerald_collected = db.Column(db.Integer, default=0, nullable=False)
+    items_purchased = db.Column(db.Integer, default=0, nullable=False)
+    
+    # Windowed leaderboards are range scans over (period, period_start)
+    __table_args__ = (
+        db.Index('ix_player_stat_rollup_window', 'period', 'period_start', 'player_id', unique=True),
+    )
+    
+    def __repr__(self):
+        return f'<PlayerStatRollup {self.period} {self.period_start} {self.player_id}>'
+    
+    @classmethod
+    def add(cls, occurred_at, rows):
+        """Add per-player delta rows (player_id plus STAT_DELTA_FIELDS) to the hour and day containing occurred_at"""
+        hour = occurred_at.replace(minute=0, second=0, microsecond=0)
+        day = hour.replace(hour=0)
+        rollups = [
+            {'period': period, 'period_start': period_start, 'player_id': row['player_id'],
+             **{field: row[field] for field in STAT_DELTA_FIELDS}}
+            for period, period_start in (('hour', hour), ('day', day))
+            for row in rows
+        ]
+        upsert_increments(cls.__table__, rollups, ('period', 'period_start', 'player_id'), STAT_DELTA_FIELDS)
+    
+    @classmethod
+    def delta_rows(cls, deltas):
+        """Turn nickname -> {field: delta} of existing players into rows of player_id plus STAT_DELTA_FIELDS"""
+        player_ids = dict(db.session.query(Player.nickname, Player.id).filter(Player.nickname.in_(list(deltas))))
+        return [
+            {'player_id': player_ids[nickname], **{field: player_deltas.get(field, 0) for field in STAT_DELTA_FIELDS}}
+            for nickname, player_deltas in deltas.items()
+        ]
+    
+    @classmethod
+    def add_deltas(cls, occurred_at, deltas):
+        """Add stat deltas (nickname -> {field: delta}) that did not come with a match, such as a counter top-up"""
+        cls.add(occurred_at, cls.delta_rows(deltas))
+    
+    @classmethod
+    def get_window(cls, window, now=None):
+        """Get the rollup period and first period_start covered by a leaderboard window (see LEADERBOARD_WINDOWS)"""
+        now = now or datetime.utcnow()
+        hour = now.replace(minute=0, second=0, microsecond=0)
+        today = hour.replace(hour=0)
+        if window == 'day':
+            # Rolling 24 hours, current hour included
+            return 'hour', hour - timedelta(hours=23)
+        if window == 'week':
+            return 'day', today - timedelta(days=6)
+        if window == 'month':
+            return 'day', today - timedelta(days=29)
+        if window == 'season':
+            # Seasons are calendar quarters
+            return 'day', today.replace(month=(today.month - 1) // 3 * 3 + 1, day=1)
+        raise ValueError(f'Unknown leaderboard window: {window}')
+    
+    @classmethod
+    def get_leaderboard(cls, window, sort_by='experience', limit=50, now=None):
+        """Get top players by a stat summed over a time window, straight from the rollups"""
+        if sort_by not in WINDOW_SORT_KEYS:
+            sort_by = 'experience'
+        period, since = cls.get_window(window, now)
+        totals = [func.sum(getattr(cls, field)).label(field) for field in WINDOW_STAT_FIELDS]
+        sort_total = func.sum(getattr(cls, sort_by))
+
+        rows = db.session.query(Player.id, Player.nickname, Player.role, *totals).join(
+            Player, Player.id == cls.player_id
+        ).filter(
+            cls.period == period,
+            cls.period_start >= since
+        ).group_by(Player.id, Player.nickname, Player.role).order_by(
+            sort_total.desc(), Player.id
+        ).limit(limit).all()
+
+        players = [{
+            'id': row.id,
+            'nickname': row.nickname,
+            'role': row.role,
+            **{field: int(getattr(row, field) or 0) for field in WINDOW_STAT_FIELDS}
+        } for row in rows]
+        return players, since
+    
+    @classmethod
+    def compact(cls, keep_matches_days, keep_hourly_days):
+        """Delete raw matches and hourly rollups past retention; daily rollups already hold their totals"""
+        now = datetime.utcnow()
+        match_cutoff = now - timedelta(days=keep_matches_days)
+        hourly_cutoff = now.replace(minute=0, second=0, microsecond=0) - timedelta(days=keep_hourly_days)
+
+        old_matches = select(Match.id).where(Match.ended_at < match_cutoff)
+        db.session.execute(
+            MatchParticipant.__table__.delete().where(MatchParticipant.match_id.in_(old_matches))
+        )
+        matches = db.session.execute(Match.__table__.delete().where(Match.ended_at < match_cutoff)).rowcount
+        hourly = db.session.execute(
+            cls.__table__.delete().where(cls.period == 'hour', cls.period_start < hourly_cutoff)
+        ).rowcount
+        return matches, hourly
+
+
+# Sort options accepted by Player.get_sort_column()
+LEADERBOARD_SORT_KEYS = ('experience', 'kills', 'final_kills', 'beds_broken', 'wins',
+                         'level', 'kd_ratio', 'fkd_ratio', 'win_rate', 'star_rating')
+
+# Histogram bands for Player.get_distribution(): (exclusive upper bound, label), last band is open-ended
+DISTRIBUTION_BANDS = {
+    'kd_ratio': [(0.5, '0-0.5'), (1.0, '0.5-1.0'), (1.5, '1.0-1.5'), (2.0, '1.5-2.0'),
+                 (3.0, '2.0-3.0'), (None, '3.0+')],
+    'win_rate': [(10 * decile, f'{10 * (decile - 1)}-{10 * decile}%') for decile in range(1, 10)] +
+                [(None, '90-100%')],
+    'resources': [(1000, '0-1K'), (5000, '1K-5K'), (10000, '5K-10K'), (50000, '10K-50K'),
+                  (None, '50K+')]
+}
+
+# Player columns that feed Player.get_statistics()
+STATISTICS_FIELDS = ('nickname', 'kills', 'final_kills', 'deaths', 'beds_broken',
+                     'games_played', 'wins', 'experience')
+
+# Player columns held by leaderboard.LeaderboardIndex; a change to any of them is written to PlayerChange
+LEADERBOARD_INDEX_FIELDS = ('nickname', 'role', 'experience', 'kills', 'final_kills', 'deaths', 'beds_broken',
+                            'games_played', 'wins', 'level_value', 'kd_ratio_value', 'fkd_ratio_value',
+                            'win_rate_value', 'star_rating_value')
+
+# Time windows answered by PlayerStatRollup.get_leaderboard()
+LEADERBOARD_WINDOWS = ('day', 'week', 'month', 'season')
+
+# Window leaderboards can only sort by counters that sum over time
+WINDOW_SORT_KEYS = ('experience', 'kills', 'final_kills', 'beds_broken', 'wins')
+WINDOW_STAT_FIELDS = ('experience', 'kills', 'final_kills', 'deaths', 'beds_broken', 'games_played', 'wins')
+
+# Counters that Player.apply_stat_deltas() (and /api/ingest) can increment
+STAT_DELTA_FIELDS = ('kills', 'final_kills', 'deaths', 'beds_broken', 'games_played', 'wins',
+                     'experience', 'iron_collected', 'gold_collected', 'diamond_collected',
+                     'emerald_collected', 'items_purchased')
+
+# Unlock condition keys that read a persisted derived column or an expression instead of a raw counter
+ACHIEVEMENT_CONDITION_EXPRESSIONS = {
+    'level': lambda: Player.level_value,
+    'kd_ratio': lambda: Player.kd_ratio_value,
+    'fkd_ratio': lambda: Player.fkd_ratio_value,
+    'win_rate': lambda: Player.win_rate_value,
+    'star_rating': lambda: Player.star_rating_value,
+    'total_resources': lambda: Player.iron_collected + Player.gold_collected +
+                               Player.diamond_collected + Player.emerald_collected,
+}
+
+# Player counters behind derived stats that quest types and unlock conditions can read
+DERIVED_STAT_DEPENDENCIES = {
+    'level': ('experience',),
+    'kd_ratio': ('kills', 'deaths'),
+    'fkd_ratio': ('final_kills', 'deaths'),
+    'win_rate': ('wins', 'games_played'),
+    'star_rating': ('experience', 'kills', 'final_kills', 'deaths', 'beds_broken', 'games_played', 'wins'),
+    'total_resources': ('iron_collected', 'gold_collected', 'diamond_collected', 'emerald_collected'),
+    'resources': ('iron_collected', 'gold_collected', 'diamond_collected', 'emerald_collected'),
+}
+
+# Derived stats stored in a <stat>_value column so leaderboards can sort on them in SQL
+PERSISTED_DERIVED_STATS = tuple(stat for stat in DERIVED_STAT_DEPENDENCIES if hasattr(Player, f'{stat}_value'))
+
+statistics_cache = SnapshotCache(
+    version_getter=lambda: CacheVersion.current('statistics'),
+    ttl_getter=lambda: current_app.config.get('STATISTICS_CACHE_TTL', 30)
+)
+
+# Rebuilt when the 'rules' version changes; the TTL is only a safety net
+rule_index_cache = SnapshotCache(
+    version_getter=lambda: CacheVersion.current('rules'),
+    ttl_getter=lambda: 3600
+)
+
+# Rebuilt when the 'gradients' version changes; the TTL is only a safety net
+gradient_stylesheet_cache = SnapshotCache(
+    version_getter=lambda: CacheVersion.current('gradients'),
+    ttl_getter=lambda: 3600
+)
+
+# Values allowed into the generated gradients stylesheet; anything else could break out of its rule
+CSS_COLOR_PATTERN = re.compile(r'#(?:[0-9a-fA-F]{3}){1,2}$')
+# CSS named colours (CSS Color Module Level 4)
+CSS_NAMED_COLORS = frozenset('''
+    aliceblue antiquewhite aqua aquamarine azure beige bisque black blanchedalmond blue
+    blueviolet brown burlywood cadetblue chartreuse chocolate coral cornflowerblue cornsilk
+    crimson cyan darkblue darkcyan darkgoldenrod darkgray darkgreen darkgrey darkkhaki
+    darkmagenta darkolivegreen darkorange darkorchid darkred darksalmon darkseagreen
+    darkslateblue darkslategray darkslategrey darkturquoise darkviolet deeppink deepskyblue
+    dimgray dimgrey dodgerblue firebrick floralwhite forestgreen fuchsia gainsboro ghostwhite
+    gold goldenrod gray green greenyellow grey honeydew hotpink indianred indigo ivory khaki
+    lavender lavenderblush lawngreen lemonchiffon lightblue lightcoral lightcyan
+    lightgoldenrodyellow lightgray lightgreen lightgrey lightpink lightsalmon lightseagreen
+    lightskyblue lightslategray lightslategrey lightsteelblue lightyellow lime limegreen linen
+    magenta maroon mediumaquamarine mediumblue mediumorchid mediumpurple mediumseagreen
+    mediumslateblue mediumspringgreen mediumturquoise mediumvioletred midnightblue mintcream
+    mistyrose moccasin navajowhite navy oldlace olive olivedrab orange orangered orchid
+    palegoldenrod palegreen paleturquoise palevioletred papayawhip peachpuff peru pink plum
+    powderblue purple rebeccapurple red rosybrown royalblue saddlebrown salmon sandybrown
+    seagreen seashell sienna silver skyblue slateblue slategray slategrey snow springgreen
+    steelblue tan teal thistle tomato turquoise violet wheat white whitesmoke yellow yellowgreen
+'''.split())
+# Width of the String(7) colour columns: '#rrggbb' or a name no longer than that
+CSS_COLOR_MAX_LENGTH = 7
+CSS_DIRECTION_PATTERN = re.compile(
+    r'(?:-?\d+(?:\.\d+)?(?:deg|grad|rad|turn)|to (?:top|bottom|left|right)(?: (?:top|bottom|left|right))?)$'
+)
+
+
+def normalize_css_color(color):
+    """Lowercase '#rgb'/'#rrggbb' (the '#' may be missing) or a colour name that fits the column, else None"""
+    color = (color or '').strip().lower()
+    if re.fullmatch(r'(?:[0-9a-f]{3}){1,2}', color):
+        color = '#' + color
+    if CSS_COLOR_PATTERN.match(color) or (color in CSS_NAMED_COLORS and len(color) <= CSS_COLOR_MAX_LENGTH):
+        return color
+    return None
+
+
+def custom_gradient_colors(*colors):
+    """Normalized colours of a custom combination, or None unless there are at least two valid ones"""
+    colors = [normalize_css_color(color) for color in colors if color]
+    if len(colors) < 2 or not all(colors):
+        return None
+    return colors
+
+
+def custom_gradient_class(*colors):
+    """Stylesheet class for a custom colour combination, or None if it is not valid (see custom_gradient_colors)"""
+    colors = custom_gradient_colors(*colors)
+    if colors is None:
+        return None
+    return 'gradient-custom-' + '-'.join(color.lstrip('#') for color in colors)
+
+
+@lru_cache(maxsize=256)
+def parse_unlock_condition(unlock_condition):
+    """Parse an unlock_condition JSON object into (key, required value) pairs, once per distinct condition"""
+    return tuple(json.loads(unlock_condition).items())
+
+
+@lru_cache(maxsize=256)
+def compile_unlock_condition(unlock_condition):
+    """Compile an unlock_condition JSON object into a SQL predicate over Player.
+
+    Cached by the condition text, so an edited achievement compiles again
+    while unchanged ones reuse their predicate. Returns None for conditions
+    no player can meet, like Achievement.check_unlock_condition() would.
+    """
+    try:
+        condition = parse_unlock_condition(unlock_condition)
+        clauses = []
+        for key, required_value in condition:
+            required_value = float(required_value)
+            if key in ACHIEVEMENT_CONDITION_EXPRESSIONS:
+                expression = ACHIEVEMENT_CONDITION_EXPRESSIONS[key]()
+            else:
+                column = Player.__table__.c.get(key)
+                if column is None or column.type.python_type not in (int, float):
+                    # Unknown stats read as 0
+                    if required_value > 0:
+                        return None
+                    continue
+                expression = column
+            clauses.append(expression >= required_value)
+        return and_(true(), *clauses)
+    except (ValueError, TypeError, AttributeError):
+        return None
+
+
+def upsert_increments(table, rows, key_columns, increment_columns, replace_columns=()):
+    """Insert rows, or add their increment_columns onto the existing row with the same key_columns.
+
+    A single INSERT ... ON CONFLICT DO UPDATE SET col = col + excluded.col on
+    PostgreSQL and SQLite; elsewhere an executemany UPDATE plus an INSERT of
+    the missing keys. key_columns must be covered by a unique index and be
+    unique within rows.
+    """
+    if not rows:
+        return
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        statement = insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=[table.c[column] for column in key_columns],
+            set_={**{column: table.c[column] + statement.excluded[column] for column in increment_columns},
+                  **{column: statement.excluded[column] for column in replace_columns}}
+        )
+        db.session.execute(statement, rows)
+        return
+
+    key_expression = tuple_(*[table.c[column] for column in key_columns])
+    keys = [tuple(row[column] for column in key_columns) for row in rows]
+    existing = {tuple(key) for key in db.session.execute(
+        select(*[table.c[column] for column in key_columns]).where(key_expression.in_(keys))
+    )}
+    new_rows = [row for row, key in zip(rows, keys) if key not in existing]
+    if new_rows:
+        db.session.execute(table.insert(), new_rows)
+    updates = [{f'delta_{column}': value for column, value in row.items()}
+               for row, key in zip(rows, keys) if key in existing]
+    if updates:
+        db.session.execute(
+            table.update().where(*[table.c[column] == bindparam(f'delta_{column}') for column in key_columns]).values(
+                **{column: table.c[column] + bindparam(f'delta_{column}') for column in increment_columns},
+                **{column: bindparam(f'delta_{column}') for column in replace_columns}
+            ),
+            updates
+        )
+
+
+def insert_missing_defaults(model, key, rows):
+    """Add the default rows whose key column value is not in the table yet, with one SELECT and one commit"""
+    column = getattr(model, key)
+    existing = {value for (value,) in
+                db.session.query(column).filter(column.in_([row[key] for row in rows]))}
+    missing = [model(**row) for row in rows if row[key] not in existing]
+    if missing:
+        db.session.add_all(missing)
+        db.session.commit()
+    return len(missing)
+
+
+def stat_dependencies(key):
+    """Player columns that a quest type or unlock condition key reads, with derived stats expanded"""
+    base_key = key[:-len('_value')] if key.endswith('_value') else key
+    if base_key in DERIVED_STAT_DEPENDENCIES:
+        return set(DERIVED_STAT_DEPENDENCIES[base_key])
+    if key in Player.__table__.c:
+        return {key}
+    return set()
+
+
+def build_rule_index():
+    """Map each Player column to the active quest types and the achievement ids that depend on it.
+
+    Rules that read no column at all (e.g. an empty condition) are listed
+    under '*' and re-evaluated on every change.
+    """
+    index = {'quests': {}, 'achievements': {}}
+    for (quest_type,) in db.session.query(Quest.type).filter(Quest.is_active == True).distinct():
+        for field in stat_dependencies(quest_type):
+            index['quests'].setdefault(field, set()).add(quest_type)
+
+    for achievement_id, unlock_condition in db.session.query(Achievement.id, Achievement.unlock_condition):
+        if compile_unlock_condition(unlock_condition) is None:
+            continue
+        fields = set().union(*(stat_dependencies(key) for key, _ in parse_unlock_condition(unlock_condition)))
+        for field in fields or {'*'}:
+            index['achievements'].setdefault(field, set()).add(achievement_id)
+    return index
+
+
+def rules_for_fields(fields):
+    """Get the quest types and achievement ids to re-evaluate after the given Player fields changed"""
+    index = rule_index_cache.get(build_rule_index)
+    fields = set(fields) | {'*'}
+    quest_types = set().union(*(index['quests'].get(field, ()) for field in fields))
+    achievement_ids = set().union(*(index['achievements'].get(field, ()) for field in fields))
+    return quest_types, achievement_ids
+
+
+def listen_for_changes(models, handler, fields=None):
+    """Call handler(connection, ids) whenever a session writes instances of the given models.
+
+    A flush reports the ids it added, removed or changed; with fields, an
+    update only counts when one of those columns changed. Bulk UPDATE/DELETE
+    statements report None, since the affected rows are unknown.
+    """
+    models = models if isinstance(models, tuple) else (models,)
+
+    def changed_on_flush(session, flush_context):
+        changed = {obj.id for obj in session.new if isinstance(obj, models)} | \
+            {obj.id for obj in session.deleted if isinstance(obj, models)}
+        for obj in session.dirty:
+            if not isinstance(obj, models) or obj.id in changed:
+                continue
+            if fields is None:
+                modified = session.is_modified(obj, include_collections=False)
+            else:
+                state = inspect(obj)
+                modified = any(state.attrs[field].history.has_changes() for field in fields)
+            if modified:
+                changed.add(obj.id)
+        if changed:
+            handler(session.connection(), sorted(changed))
+
+    def changed_by_bulk_write(orm_execute_state):
+        if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+            return
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None and mapper.class_ in models:
+            handler(orm_execute_state.session.connection(), None)
+
+    event.listen(Session, 'after_flush', changed_on_flush)
+    event.listen(Session, 'do_orm_execute', changed_by_bulk_write)
+
+
+def bump_on_change(models, version_name, fields=None):
+    """Bump a cache version whenever instances of the given models are written (see listen_for_changes)"""
+    listen_for_changes(models, lambda connection, ids: CacheVersion.bump(connection, version_name), fields)
+
+
+@event.listens_for(Player, 'before_insert')
+@event.listens_for(Player, 'before_update')
+def refresh_player_derived_stats(mapper, connection, player):
+    """Keep persisted derived statistics in sync on every flush"""
+    player.refresh_derived_stats()
+
+
 class Quest(db.Model):
     """Quest system for gamification"""
     
@@ -413,13 +1430,47 @@ class Quest(db.Model):
     
     @property
     def completion_rate(self):
-        """Calculate overall completion rate"""
-        total_attempts = PlayerQuest.query.filter_by(quest_id=self.id).count()
+        """Calculate overall completion rate (lists of quests should use get_progress_counts() instead)"""
+        total_attempts, completed = Quest.get_progress_counts([self.id]).get(self.id, (0, 0))
         if total_attempts == 0:
             return 0
-        completed = PlayerQuest.query.filter_by(quest_id=self.id, is_completed=True).count()
         return round((completed / total_attempts) * 100, 1)
     
+    @classmethod
+    def get_progress_counts(cls, quest_ids=None):
+        """Count attempts and completions per quest with a single GROUP BY: {quest_id: (total, completed)}"""
+        query = db.session.query(
+            PlayerQuest.quest_id,
+            func.count(PlayerQuest.id),
+            func.sum(case((PlayerQuest.is_completed == True, 1), else_=0))
+        )
+        if quest_ids is not None:
+            query = query.filter(PlayerQuest.quest_id.in_(list(quest_ids)))
+        rows = query.group_by(PlayerQuest.quest_id).all()
+        return {quest_id: (total, int(completed or 0)) for quest_id, total, completed in rows}
+    
+    @classmethod
+    def stat_expression(cls, quest_type):
+        """SQL expression over Player for the stat a quest type tracks, or None if it tracks nothing.
+
+        Derived stats read their persisted column; ratios count whole steps
+        (see Player.get_quest_stat), since progress is an integer.
+        """
+        if quest_type == 'resources':
+            return Player.iron_collected + Player.gold_collected + Player.diamond_collected + Player.emerald_collected
+        if quest_type in ACHIEVEMENT_CONDITION_EXPRESSIONS:
+            expression = ACHIEVEMENT_CONDITION_EXPRESSIONS[quest_type]()
+            if expression.type.python_type is int:
+                return expression
+            # CAST truncates on SQLite but rounds on PostgreSQL
+            if db.session.get_bind().dialect.name != 'sqlite':
+                expression = func.trunc(expression)
+            return cast(expression, Integer)
+        column = Player.__table__.c.get(quest_type)
+        if column is None or column.type.python_type is not int:
+            return None
+        return column
+    
     @classmethod
     def get_active_quests(cls):
         """Get all active quests"""
@@ -511,13 +1562,7 @@ class Quest(db.Model):
             }
         ]
         
-        for quest_data in default_quests:
-            existing = cls.query.filter_by(title=quest_data['title']).first()
-            if not existing:
-                quest = cls(**quest_data)
-                db.session.add(quest)
-        
-        db.session.commit()
+        return insert_missing_defaults(cls, 'title', default_quests)
 
 
 class PlayerQuest(db.Model):
@@ -534,59 +1579,90 @@ class PlayerQuest(db.Model):
     started_at = db.Column(db.DateTime, nullable=True)
     accepted_at = db.Column(db.DateTime, nullable=True)
     
+    __table_args__ = (
+        db.Index('ix_player_quest_player_quest', 'player_id', 'quest_id'),
+        db.Index('ix_player_quest_player_status', 'player_id', 'is_accepted', 'is_completed'),
+        db.Index('ix_player_quest_quest_completed', 'quest_id', 'is_completed'),
+    )
+    
     def __repr__(self):
         return f'<PlayerQuest {self.player_id}:{self.quest_id}>'
     
     @property
     def progress_percentage(self):
         """Calculate progress percentage"""
-        quest_obj = Quest.query.get(self.quest_id)
+        # Many-to-one lookup, served from the identity map when the quest is already loaded
+        quest_obj = self.quest
         if not quest_obj or quest_obj.target_value == 0:
             return 100
         return min(100, round((self.current_progress / quest_obj.target_value) * 100))
     
-    def check_completion(self, player_stat_value):
-        """Check if quest should be completed"""
-        # Calculate progress from baseline
-        progress_from_baseline = max(0, player_stat_value - self.baseline_value)
-        self.current_progress = progress_from_baseline
-        quest_obj = Quest.query.get(self.quest_id)
-        
-        if not self.is_completed and quest_obj and self.current_progress >= quest_obj.target_value:
-            self.is_completed = True
-            self.completed_at = datetime.utcnow()
-            return True
-        return False
-    
     @classmethod
-    def update_player_quest_progress(cls, player):
-        """Update quest progress only for accepted quests"""
-        completed_quests = []
-        
-        # Only update progress for accepted quests
-        accepted_quests = cls.query.filter_by(
-            player_id=player.id,
-            is_accepted=True,
-            is_completed=False
+    def advance_progress(cls, player_ids=None, quest_types=None):
+        """Recalculate accepted quests from current stats and complete the ones that reached their target.
+
+        Issues one set-based UPDATE per quest type (``current_progress = stat -
+        baseline_value``), then marks completions and awards their XP in bulk.
+        Limited to ``player_ids`` and ``quest_types`` when given. Does not
+        commit; returns the completed ``(player_id, quest_id)`` pairs.
+        """
+        pending = [cls.is_accepted == True, cls.is_completed == False]
+        if player_ids is not None:
+            player_ids = list(player_ids)
+            if not player_ids:
+                return []
+            pending.append(cls.player_id.in_(player_ids))
+
+        if quest_types is not None:
+            quest_types = list(quest_types)
+            if not quest_types:
+                return []
+
+        quest_ids_by_type = {}
+        quests = db.session.query(Quest.id, Quest.type)
+        if quest_types is not None:
+            quests = quests.filter(Quest.type.in_(quest_types))
+        for quest_id, quest_type in quests:
+            quest_ids_by_type.setdefault(quest_type, []).append(quest_id)
+
+        quest_ids = []
+        for quest_type, ids in quest_ids_by_type.items():
+            stat = Quest.stat_expression(quest_type)
+            if stat is None:
+                continue
+            quest_ids.extend(ids)
+            progress = select(stat).where(Player.id == cls.player_id).scalar_subquery() - cls.baseline_value
+            db.session.execute(
+                update(cls).where(*pending, cls.quest_id.in_(ids))
+                .values(current_progress=case((progress > 0, progress), else_=0))
+                .execution_options(synchronize_session=False)
+            )
+        if not quest_ids:
+            return []
+
+        due = db.session.query(cls.id, cls.player_id, cls.quest_id, Quest.reward_xp).join(Quest).filter(
+            *pending, cls.quest_id.in_(quest_ids), cls.current_progress >= Quest.target_value
         ).all()
-        
-        for player_quest in accepted_quests:
-            quest = player_quest.quest
-            
-            # Get current stat value
-            current_stat_value = getattr(player, quest.type, 0)
-            
-            # Check completion based on progress from baseline
-            if player_quest.check_completion(current_stat_value):
-                completed_quests.append(quest)
-                
-                # Award XP only, don't auto-assign title
-                player.experience += quest.reward_xp
-        
-        if completed_quests:
-            db.session.commit()
-        
-        return completed_quests
+        # The UPDATEs above bypassed the session, so drop stale PlayerQuest state either way
+        for obj in list(db.session.identity_map.values()):
+            if isinstance(obj, cls):
+                db.session.expire(obj)
+        if not due:
+            return []
+
+        db.session.execute(
+            update(cls).where(cls.id.in_([row.id for row in due]))
+            .values(is_completed=True, completed_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+
+        # Award XP only, don't auto-assign title
+        rewards = {}
+        for row in due:
+            rewards[row.player_id] = rewards.get(row.player_id, 0) + (row.reward_xp or 0)
+        Player.add_experience(rewards)
+
+        return [(row.player_id, row.quest_id) for row in due]
 
 
 class Achievement(db.Model):
@@ -612,10 +1688,9 @@ class Achievement(db.Model):
     def check_unlock_condition(self, player):
         """Check if player meets achievement unlock condition"""
         try:
-            import json
-            condition = json.loads(self.unlock_condition)
+            condition = parse_unlock_condition(self.unlock_condition)
             
-            for key, required_value in condition.items():
+            for key, required_value in condition:
                 if key == 'kd_ratio':
                     if float(player.kd_ratio) < float(required_value):
                         return False
@@ -632,31 +1707,85 @@ class Achievement(db.Model):
                         
             return True
         except Exception as e:
-            print(f"Error checking achievement condition: {e}")
+            current_app.logger.error(f"Error checking achievement condition: {e}")
             return False
     
     @classmethod
-    def check_player_achievements(cls, player):
-        """Check and award new achievements for player"""
-        new_achievements = []
-        
-        # Get all achievements not yet earned by player
-        earned_achievement_ids = [pa.achievement_id for pa in player.player_achievements]
-        unearned_achievements = cls.query.filter(~cls.id.in_(earned_achievement_ids)).all()
-        
-        for achievement in unearned_achievements:
-            if achievement.check_unlock_condition(player):
-                # Award achievement
-                player_achievement = PlayerAchievement(
-                    player_id=player.id,
-                    achievement_id=achievement.id
-                )
-                db.session.add(player_achievement)
-                
-                # Award XP
-                player.experience += achievement.reward_xp
-                
-                new_achievements.append(achievement)
+    def get_earned_counts(cls):
+        """Count how many players earned each achievement with a single GROUP BY: {achievement_id: count}"""
+        rows = db.session.query(
+            PlayerAchievement.achievement_id, func.count(PlayerAchievement.id)
+        ).group_by(PlayerAchievement.achievement_id).all()
+        return dict(rows)
+    
+    @property
+    def unlock_predicate(self):
+        """SQL predicate over Player for the unlock condition (see compile_unlock_condition)"""
+        return compile_unlock_condition(self.unlock_condition)
+    
+    @classmethod
+    def award_eligible(cls, player_ids=None, achievement_ids=None):
+        """Award achievements to every eligible player who doesn't have them yet.
+
+        Runs one INSERT ... SELECT per achievement over the players matching
+        its compiled condition, then adds the reward XP in bulk. Limited to
+        ``player_ids`` and ``achievement_ids`` when given. Does not commit;
+        returns the awarded ``(player_id, achievement)`` pairs.
+        """
+        if player_ids is not None:
+            player_ids = list(player_ids)
+            if not player_ids:
+                return []
+
+        if achievement_ids is not None:
+            achievement_ids = list(achievement_ids)
+            if not achievement_ids:
+                return []
+
+        achievements = cls.query.order_by(cls.id)
+        if achievement_ids is not None:
+            achievements = achievements.filter(cls.id.in_(achievement_ids))
+
+        table = PlayerAchievement.__table__
+        returning = db.session.get_bind().dialect.insert_returning
+        awarded = []
+        rewards = {}
+        for achievement in achievements.all():
+            predicate = achievement.unlock_predicate
+            if predicate is None:
+                continue
+
+            earned_at = datetime.utcnow()
+            eligible = select(Player.id, literal(achievement.id), literal(earned_at)).where(
+                predicate,
+                ~select(table.c.id).where(
+                    table.c.player_id == Player.id,
+                    table.c.achievement_id == achievement.id
+                ).exists()
+            )
+            if player_ids is not None:
+                eligible = eligible.where(Player.id.in_(player_ids))
+
+            statement = table.insert().from_select(['player_id', 'achievement_id', 'earned_at'], eligible)
+            if returning:
+                awarded_ids = db.session.execute(statement.returning(table.c.player_id)).scalars().all()
+            else:
+                db.session.execute(statement)
+                awarded_ids = db.session.execute(select(table.c.player_id).where(
+                    table.c.achievement_id == achievement.id, table.c.earned_at == earned_at
+                )).scalars().all()
+
+            for player_id in awarded_ids:
+                awarded.append((player_id, achievement))
+                rewards[player_id] = rewards.get(player_id, 0) + (achievement.reward_xp or 0)
+
+        Player.add_experience(rewards)
+        return awarded
+    
+    @classmethod
+    def check_player_achievements(cls, player, achievement_ids=None):
+        """Check and award new achievements for player (optionally only achievement_ids)"""
+        new_achievements = [achievement for _, achievement in cls.award_eligible([player.id], achievement_ids)]
         
         if new_achievements:
             db.session.commit()
@@ -703,13 +1832,7 @@ class Achievement(db.Model):
             }
         ]
         
-        for achievement_data in default_achievements:
-            existing = cls.query.filter_by(title=achievement_data['title']).first()
-            if not existing:
-                achievement = cls(**achievement_data)
-                db.session.add(achievement)
-        
-        db.session.commit()
+        return insert_missing_defaults(cls, 'title', default_achievements)
 
 
 class PlayerAchievement(db.Model):
@@ -720,6 +1843,11 @@ class PlayerAchievement(db.Model):
     achievement_id = db.Column(db.Integer, db.ForeignKey('achievement.id'), nullable=False)
     earned_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    __table_args__ = (
+        db.Index('ix_player_achievement_player', 'player_id', 'achievement_id'),
+        db.Index('ix_player_achievement_achievement', 'achievement_id'),
+    )
+    
     def __repr__(self):
         return f'<PlayerAchievement {self.player_id}:{self.achievement_id}>'
 
@@ -775,13 +1903,7 @@ class CustomTitle(db.Model):
             }
         ]
         
-        for title_data in default_titles:
-            existing = cls.query.filter_by(name=title_data['name']).first()
-            if not existing:
-                title = cls(**title_data)
-                db.session.add(title)
-        
-        db.session.commit()
+        return insert_missing_defaults(cls, 'name', default_titles)
 
 
 class PlayerTitle(db.Model):
@@ -794,8 +1916,12 @@ class PlayerTitle(db.Model):
     assigned_by = db.Column(db.String(100), default='admin')
     is_active = db.Column(db.Boolean, default=True)
     
+    __table_args__ = (
+        db.Index('ix_player_title_player_active', 'player_id', 'is_active'),
+    )
+    
     # Relationships
-    player = db.relationship('Player', backref='custom_titles')
+    player = db.relationship('Player', backref=db.backref('custom_titles', cascade='all, delete-orphan'))
     title = db.relationship('CustomTitle', backref='assigned_players')
     
     def __repr__(self):
@@ -827,6 +1953,59 @@ class GradientTheme(db.Model):
             return f"linear-gradient({self.gradient_direction}, {self.color1}, {self.color2}, {self.color3})"
         return f"linear-gradient({self.gradient_direction}, {self.color1}, {self.color2})"
     
+    @property
+    def css_class(self):
+        """Class of this theme in the generated gradients stylesheet"""
+        return f'gradient-theme-{self.id}'
+    
+    @property
+    def has_safe_css(self):
+        """Whether the colours and direction can be written into a stylesheet as they are"""
+        colors = [color for color in (self.color1, self.color2, self.color3) if color]
+        return all(CSS_COLOR_PATTERN.match(color) or color.lower() in CSS_NAMED_COLORS for color in colors) and \
+            bool(CSS_DIRECTION_PATTERN.match(self.gradient_direction or ''))
+    
+    @classmethod
+    def build_stylesheet(cls):
+        """Build the gradients stylesheet: one class per active theme (or theme in use) and per custom colour combination.
+
+        Only the background image is set; the text clipping and animation
+        come from the .player-gradient classes in style.css. Returns a dict
+        with the CSS and a digest of it for the versioned URL.
+        """
+        used_theme_ids = db.session.query(PlayerGradientSetting.gradient_theme_id).filter(
+            PlayerGradientSetting.gradient_theme_id.isnot(None),
+            PlayerGradientSetting.is_enabled == True
+        ).distinct()
+        rules = []
+        for theme in cls.query.filter(or_(cls.is_active == True, cls.id.in_(used_theme_ids))).order_by(cls.id):
+            if theme.has_safe_css:
+                rules.append(f'.{theme.css_class} {{ background-image: {theme.css_gradient}; }}')
+
+        custom = {}
+        combinations = db.session.query(
+            PlayerGradientSetting.custom_color1, PlayerGradientSetting.custom_color2, PlayerGradientSetting.custom_color3
+        ).filter(
+            PlayerGradientSetting.gradient_theme_id.is_(None),
+            PlayerGradientSetting.is_enabled == True,
+            PlayerGradientSetting.custom_color1.isnot(None),
+            PlayerGradientSetting.custom_color2.isnot(None)
+        ).distinct()
+        for colors in combinations:
+            css_class = custom_gradient_class(*colors)
+            if css_class:
+                custom[css_class] = ', '.join(custom_gradient_colors(*colors))
+        for css_class in sorted(custom):
+            rules.append(f'.{css_class} {{ background-image: linear-gradient(45deg, {custom[css_class]}); }}')
+
+        css = '\n'.join(rules) + '\n'
+        return {'css': css, 'digest': hashlib.sha256(css.encode()).hexdigest()[:16]}
+    
+    @classmethod
+    def get_stylesheet(cls):
+        """Get the cached gradients stylesheet (see build_stylesheet)"""
+        return gradient_stylesheet_cache.get(cls.build_stylesheet)
+    
     @classmethod
     def create_default_themes(cls):
         """Create default gradient themes"""
@@ -1050,13 +2229,7 @@ class GradientTheme(db.Model):
             }
         ]
         
-        for theme_data in default_themes:
-            existing = cls.query.filter_by(name=theme_data['name']).first()
-            if not existing:
-                theme = cls(**theme_data)
-                db.session.add(theme)
-        
-        db.session.commit()
+        return insert_missing_defaults(cls, 'name', default_themes)
 
 
 class PlayerGradientSetting(db.Model):
@@ -1073,8 +2246,12 @@ class PlayerGradientSetting(db.Model):
     assigned_by = db.Column(db.String(100), default='admin')
     assigned_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    __table_args__ = (
+        db.Index('ix_player_gradient_setting_lookup', 'player_id', 'element_type', 'is_enabled'),
+    )
+    
     # Relationships
-    player = db.relationship('Player', backref='gradient_settings')
+    player = db.relationship('Player', backref=db.backref('gradient_settings', cascade='all, delete-orphan'))
     gradient_theme = db.relationship('GradientTheme', backref='player_settings')
     
     def __repr__(self):
@@ -1090,3 +2267,22 @@ class PlayerGradientSetting(db.Model):
                 return f"linear-gradient(45deg, {self.custom_color1}, {self.custom_color2}, {self.custom_color3})"
             return f"linear-gradient(45deg, {self.custom_color1}, {self.custom_color2})"
         return None
+    
+    @property
+    def css_class(self):
+        """Get the gradients stylesheet class for this setting"""
+        if self.gradient_theme_id and self.gradient_theme:
+            # Themes with unsafe values are left out of the stylesheet (see GradientTheme.build_stylesheet)
+            return self.gradient_theme.css_class if self.gradient_theme.has_safe_css else None
+        elif self.custom_color1 and self.custom_color2:
+            return custom_gradient_class(self.custom_color1, self.custom_color2, self.custom_color3)
+        return None
+
+
+# Cache versions and the leaderboard change log follow writes to the models they are built from
+bump_on_change(Player, 'statistics', fields=STATISTICS_FIELDS)
+bump_on_change(Player, 'nicknames', fields=('nickname',))
+listen_for_changes(Player, PlayerChange.record, fields=LEADERBOARD_INDEX_FIELDS)
+bump_on_change((Quest, Achievement), 'rules')
+bump_on_change((GradientTheme, PlayerGradientSetting), 'gradients')
+bump_on_change(CustomTitle, 'titles')
@@ -0,0 +1,179 @@
+from app import app, db
+from collections import Counter, deque
+from flask import before_render_template, g, has_request_context, request, template_rendered
+from sqlalchemy import event
+import threading
+import time
+
+# Upper bounds (ms) of the request latency histogram buckets on /admin/perf; the last bucket is open-ended
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+
+class RequestStats:
+    """SQL and template timings collected while one request runs"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.render_seconds = 0.0
+        self.render_depth = 0
+        self.render_started = 0.0
+        self.statements = Counter()
+
+    def repeated_statements(self, threshold):
+        """Statements run at least threshold times, usually one query per row of a list (N+1)"""
+        return {statement: count for statement, count in self.statements.items() if count >= threshold}
+
+
+class PerfStats:
+    """Rolling per-endpoint request samples and recent slow queries, shared by one worker's threads"""
+
+    def __init__(self, window_seconds, max_samples=2000, max_slow_queries=50):
+        self.window_seconds = window_seconds
+        self.max_samples = max_samples
+        self._lock = threading.Lock()
+        self._samples = {}
+        self._repeated = {}
+        self.slow_queries = deque(maxlen=max_slow_queries)
+
+    def record(self, endpoint, total_ms, db_ms, render_ms, queries, repeated):
+        """Add one finished request"""
+        now = time.time()
+        with self._lock:
+            samples = self._samples.setdefault(endpoint, deque(maxlen=self.max_samples))
+            samples.append((now, total_ms, db_ms, render_ms, queries, bool(repeated)))
+            if repeated:
+                self._repeated.setdefault(endpoint, Counter()).update(repeated)
+
+    def record_slow_query(self, endpoint, duration_ms, statement):
+        with self._lock:
+            self.slow_queries.appendleft({'at': time.time(), 'endpoint': endpoint,
+                                          'duration_ms': duration_ms, 'statement': statement})
+
+    def recent_slow_queries(self):
+        """Slow queries seen by this worker, newest first"""
+        with self._lock:
+            return list(self.slow_queries)
+
+    def summary(self):
+        """Per-endpoint latency percentiles, histogram and SQL costs over the rolling window, slowest first"""
+        cutoff = time.time() - self.window_seconds
+        with self._lock:
+            snapshot = {endpoint: [sample for sample in samples if sample[0] >= cutoff]
+                        for endpoint, samples in self._samples.items()}
+            repeated = {endpoint: counter.most_common(3) for endpoint, counter in self._repeated.items()}
+
+        rows = []
+        for endpoint, samples in snapshot.items():
+            if not samples:
+                continue
+            totals = sorted(sample[1] for sample in samples)
+            histogram = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+            for total_ms in totals:
+                histogram[next((index for index, upper in enumerate(LATENCY_BUCKETS_MS) if total_ms <= upper),
+                               len(LATENCY_BUCKETS_MS))] += 1
+            count = len(samples)
+            rows.append({
+                'endpoint': endpoint,
+                'count': count,
+                'p50_ms': totals[count // 2],
+                'p95_ms': totals[min(count - 1, int(count * 0.95))],
+                'max_ms': totals[-1],
+                'avg_db_ms': sum(sample[2] for sample in samples) / count,
+                'avg_render_ms': sum(sample[3] for sample in samples) / count,
+                'avg_queries': sum(sample[4] for sample in samples) / count,
+                'max_queries': max(sample[4] for sample in samples),
+                'n_plus_one_requests': sum(1 for sample in samples if sample[5]),
+                'repeated_statements': repeated.get(endpoint, []),
+                'histogram': histogram,
+            })
+        rows.sort(key=lambda row: row['p95_ms'], reverse=True)
+        return rows
+
+
+perf_stats = PerfStats(window_seconds=app.config['PERF_WINDOW_SECONDS'])
+
+
+def request_stats():
+    """The current request's RequestStats, or None outside instrumented requests"""
+    if has_request_context():
+        return g.get('perf')
+    return None
+
+
+@event.listens_for(db.engine, 'before_cursor_execute')
+def start_query_timer(connection, cursor, statement, parameters, context, executemany):
+    connection.info.setdefault('perf_query_started', []).append(time.perf_counter())
+
+
+@event.listens_for(db.engine, 'handle_error')
+def discard_query_timer(exception_context):
+    # A failed statement never reaches after_cursor_execute
+    connection = exception_context.connection
+    if connection is not None and connection.info.get('perf_query_started'):
+        connection.info['perf_query_started'].pop()
+
+
+@event.listens_for(db.engine, 'after_cursor_execute')
+def record_query(connection, cursor, statement, parameters, context, executemany):
+    """Add a statement's time to the current request and log it if slow"""
+    elapsed = time.perf_counter() - connection.info['perf_query_started'].pop()
+    stats = request_stats()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += elapsed
+        stats.statements[statement] += 1
+
+    elapsed_ms = elapsed * 1000
+    if elapsed_ms >= app.config['SLOW_QUERY_MS']:
+        endpoint = request.endpoint if has_request_context() else None
+        app.logger.warning(f"Slow query ({elapsed_ms:.1f} ms) in {endpoint or 'CLI'}: {statement[:1000]}")
+        perf_stats.record_slow_query(endpoint, elapsed_ms, statement[:1000])
+
+
+@before_render_template.connect_via(app)
+def start_render_timer(sender, template, context, **extra):
+    stats = request_stats()
+    if stats is not None:
+        # Templates rendered inside a template (cached row fragments) count once, as part of the outer one
+        if stats.render_depth == 0:
+            stats.render_started = time.perf_counter()
+        stats.render_depth += 1
+
+
+@template_rendered.connect_via(app)
+def stop_render_timer(sender, template, context, **extra):
+    stats = request_stats()
+    if stats is not None and stats.render_depth:
+        stats.render_depth -= 1
+        if stats.render_depth == 0:
+            stats.render_seconds += time.perf_counter() - stats.render_started
+
+
+@app.before_request
+def start_request_timer():
+    if app.config['PERF_INSTRUMENTATION'] and request.endpoint not in ('static', 'asset'):
+        g.perf = RequestStats()
+
+
+@app.after_request
+def record_request(response):
+    """Emit Server-Timing and add the request to the rolling per-endpoint stats"""
+    stats = request_stats()
+    if stats is None:
+        return response
+
+    total_ms = (time.perf_counter() - stats.started) * 1000
+    db_ms = stats.db_seconds * 1000
+    render_ms = stats.render_seconds * 1000
+    repeated = stats.repeated_statements(app.config['N_PLUS_ONE_THRESHOLD'])
+    response.headers.add('Server-Timing', f'db;dur={db_ms:.1f};desc="{stats.queries} queries"')
+    response.headers.add('Server-Timing', f'render;dur={render_ms:.1f}')
+    response.headers.add('Server-Timing', f'total;dur={total_ms:.1f}')
+    if repeated:
+        app.logger.info(f"Possible N+1 in {request.endpoint}: " +
+                        "; ".join(f"{count}x {statement[:200]}" for statement, count in repeated.items()))
+
+    perf_stats.record(request.endpoint or '<unmatched>', total_ms, db_ms, render_ms, stats.queries, repeated)
+    return response
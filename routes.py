@@ -1,14 +1,72 @@
-from flask import render_template, request, redirect, url_for, flash, session, jsonify, make_response
+from flask import render_template, request, redirect, url_for, flash, session, jsonify, make_response, send_file, Response, stream_with_context, abort
 from app import app, db
-from models import Player, Quest, PlayerQuest, Achievement, PlayerAchievement, CustomTitle, PlayerTitle, GradientTheme, PlayerGradientSetting
+from assets import ASSET_ENCODINGS, ASSETS_DIR, asset_manifest, asset_version
+from avatars import AVATAR_SIZES, DEFAULT_AVATAR_SIZE, avatar_store, builtin_avatar, is_proxied_avatar, prefetch_avatar
+from cache import FragmentCache
+from db_profiles import long_running_statements
+from leaderboard import leaderboard_index, leaderboard_index_enabled
+from markupsafe import Markup
+from perf import LATENCY_BUCKETS_MS, perf_stats
+from search import search_query
+from models import CSS_DIRECTION_PATTERN, DISTRIBUTION_BANDS, LEADERBOARD_SORT_KEYS, LEADERBOARD_WINDOWS, STAT_DELTA_FIELDS, IngestBatch, Match, PlayerStatRollup, custom_gradient_colors, normalize_css_color, rules_for_fields, Player, Quest, PlayerQuest, Achievement, PlayerAchievement, CustomTitle, PlayerTitle, GradientTheme, PlayerGradientSetting
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
+from werkzeug.http import is_resource_modified
 import os
 import csv
+import hashlib
+import hmac
 import io
-from datetime import datetime
+import json
+import mimetypes
+import zlib
+from datetime import datetime, timezone
 
 # Admin password
 ADMIN_PASSWORD = os.environ.get('ADMIN_PASSWORD', 'Minekillfire13!')
 
+# Bearer token for game servers pushing stats to /api/ingest (disabled when unset)
+INGEST_API_KEY = os.environ.get('INGEST_API_KEY', '')
+MAX_INGEST_PLAYERS = 1000
+
+# Rendered leaderboard rows, keyed by player and versioned by stats and cosmetics
+leaderboard_row_cache = FragmentCache(max_bytes=app.config['FRAGMENT_CACHE_MAX_BYTES'])
+
+@app.template_global()
+def leaderboard_row(player, rank, is_admin):
+    """Render a leaderboard row's cells, reusing the cached HTML while the player is unchanged"""
+    highlight = rank <= 3
+    key = (highlight, is_admin)
+    version = (player.last_updated, player.cosmetics_version)
+
+    html = leaderboard_row_cache.get(player.id, key, version)
+    if html is None:
+        html = Markup(render_template('leaderboard_row.html',
+                                      player=player,
+                                      highlight=highlight,
+                                      is_admin=is_admin))
+        leaderboard_row_cache.set(player.id, key, version, html)
+    return html
+
+@app.template_global()
+def gradient_stylesheet_url():
+    """Versioned URL of the generated gradients stylesheet; it changes whenever the classes do"""
+    return url_for('gradient_stylesheet', digest=GradientTheme.get_stylesheet()['digest'])
+
+@app.route('/gradients.<digest>.css')
+def gradient_stylesheet(digest):
+    """Serve one class per gradient theme and custom colour combination (see GradientTheme.build_stylesheet)"""
+    stylesheet = GradientTheme.get_stylesheet()
+    response = make_response(stylesheet['css'])
+    response.mimetype = 'text/css'
+    if digest == stylesheet['digest']:
+        # The content behind a digest never changes; new classes get a new URL
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    else:
+        # A page rendered before the last change: send the current classes without caching them under the old name
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
+
 @app.route('/')
 def index():
     """Display the enhanced leaderboard"""
@@ -16,31 +74,127 @@ def index():
     search = request.args.get('search', '').strip()
     limit = min(int(request.args.get('limit', 50)), 200)
 
+    # Search results are ordered by relevance, so look up their real leaderboard ranks in one query
+    ranks = {}
     if search:
-        players = Player.search_players(search)[:limit]
+        players = Player.search_players(search, limit)
+        rank_sort = sort_by if sort_by in LEADERBOARD_SORT_KEYS else 'experience'
+        ranks = {player_id: player_ranks[rank_sort]['rank']
+                 for player_id, player_ranks in Player.get_ranks([rank_sort], [p.id for p in players]).items()}
+    elif leaderboard_index_enabled():
+        # The in-process index answers the ordering; only the page's own rows are loaded by id
+        player_ids = [row.id for row in leaderboard_index.top(sort_by, limit)]
+        by_id = {player.id: player for player in Player.query.filter(Player.id.in_(player_ids))}
+        players = [by_id[player_id] for player_id in player_ids if player_id in by_id]
     else:
         players = Player.get_leaderboard(sort_by=sort_by, limit=limit)
+    Player.preload_cosmetics(players)
 
     is_admin = session.get('is_admin', False)
-    stats = Player.get_statistics()
+    stats = leaderboard_index.get_statistics() if leaderboard_index_enabled() else Player.get_statistics()
 
     return render_template('index.html', 
                          players=players, 
+                         ranks=ranks,
                          current_sort=sort_by,
                          search_query=search,
                          is_admin=is_admin,
                          stats=stats,
                          limit=limit)
 
+@app.route('/avatar/<int:player_id>.png')
+def avatar(player_id):
+    """Serve a player's avatar from the local cache; a miss is fetched in the background meanwhile"""
+    size = request.args.get('size', DEFAULT_AVATAR_SIZE, type=int)
+    if size not in AVATAR_SIZES:
+        size = DEFAULT_AVATAR_SIZE
+
+    player = Player.query.get_or_404(player_id)
+    source = player.avatar_source(size)
+    if not is_proxied_avatar(source):
+        return redirect(source)
+
+    entry = avatar_store.get(source)
+    max_age = app.config['AVATAR_MAX_AGE']
+    if entry is None:
+        # Not cached yet (or the skin service is down): show a bundled face briefly, then retry
+        entry = builtin_avatar(player.skin_type if player.skin_type in ('steve', 'alex') else player.default_skin)
+        max_age = avatar_store.retry_after
+
+    return send_file(entry['path'], mimetype=entry['content_type'], etag=entry['digest'],
+                     max_age=max_age, conditional=True)
+
+@app.route('/assets/<path:filename>')
+def asset(filename):
+    """Serve a fingerprinted asset from build-assets, precompressed to match Accept-Encoding"""
+    # Only current builds; the name changes with the content, so it can be cached for good
+    if filename not in asset_manifest.values():
+        abort(404)
+
+    path = os.path.join(ASSETS_DIR, filename)
+    encoding = None
+    for token, suffix in ASSET_ENCODINGS:
+        if request.accept_encodings[token] and os.path.exists(path + suffix):
+            encoding, path = token, path + suffix
+            break
+
+    response = send_file(path, mimetype=mimetypes.guess_type(filename)[0], max_age=365 * 24 * 3600, conditional=True)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+def profile_validators(player, page):
+    """ETag and Last-Modified of a profile page for the current viewer"""
+    version, last_modified = player.get_profile_version()
+    # The navbar differs per viewer, and the page links the current stylesheets
+    viewer = (session.get('player_nickname'), session.get('is_admin', False))
+    etag = hashlib.sha1(
+        f'{page}|{version}|{viewer}|{GradientTheme.get_stylesheet()["digest"]}|{asset_version}'.encode()
+    ).hexdigest()
+    return etag, last_modified
+
+def profile_not_modified(etag, last_modified):
+    """Whether the client's copy is current; pending flash messages always need a fresh page"""
+    return '_flashes' not in session and \
+        not is_resource_modified(request.environ, etag=etag, last_modified=last_modified)
+
+def set_profile_cache_headers(response, etag, last_modified):
+    """Let shared caches keep anonymous views briefly; everyone else revalidates with the validators"""
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    if session:
+        response.headers['Cache-Control'] = 'private, no-cache'
+    else:
+        response.headers['Cache-Control'] = f'public, max-age={app.config["PROFILE_CACHE_MAX_AGE"]}'
+    return response
+
 @app.route('/player/<int:player_id>')
 def player_profile(player_id):
     """Display detailed player profile"""
     player = Player.query.get_or_404(player_id)
+    etag, last_modified = profile_validators(player, 'player')
+    if profile_not_modified(etag, last_modified):
+        return set_profile_cache_headers(make_response('', 304), etag, last_modified)
+
     is_admin = session.get('is_admin', False)
 
-    return render_template('player_profile.html', 
-                         player=player, 
-                         is_admin=is_admin)
+    response = make_response(render_template('player_profile.html', 
+                                             player=player, 
+                                             is_admin=is_admin))
+    return set_profile_cache_headers(response, etag, last_modified)
+
+@app.route('/player/<int:player_id>/ranks')
+def player_ranks(player_id):
+    """Leaderboard positions block of a profile, fetched by the page so its ETag ignores other players"""
+    player = Player.query.get_or_404(player_id)
+    ranks = Player.get_ranks(LEADERBOARD_SORT_KEYS, [player.id])[player.id]
+
+    response = make_response(render_template('player_ranks.html', ranks=ranks))
+    response.headers['Cache-Control'] = f'public, max-age={app.config["RANKS_CACHE_MAX_AGE"]}'
+    return response
 
 @app.route('/statistics')
 def statistics():
@@ -246,12 +400,17 @@ def edit_player(player_id):
         player.emerald_collected = request.form.get('emerald_collected', type=int, default=player.emerald_collected)
         player.items_purchased = request.form.get('items_purchased', type=int, default=player.items_purchased)
 
+        # Re-evaluate only the quests and achievements that read a changed stat
+        quest_types, achievement_ids = rules_for_fields(player.changed_fields())
+
         player.last_updated = datetime.utcnow()
+        if PlayerQuest.advance_progress([player.id], quest_types):
+            # Quest rewards add experience, which feeds level and star achievements
+            achievement_ids |= rules_for_fields({'experience'})[1]
         db.session.commit()
 
         # Check for new achievements
-        from models import Achievement
-        new_achievements = Achievement.check_player_achievements(player)
+        new_achievements = Achievement.check_player_achievements(player, achievement_ids)
 
         success_message = f'Статистика игрока {player.nickname} обновлена!'
         if new_achievements:
@@ -278,6 +437,7 @@ def modify_player_stats(player_id):
     try:
         operation = request.form.get('operation', 'add')  # 'add' or 'subtract'
         changes_made = []
+        changed_fields = []
 
         # Define stat fields and their names for logging
         stat_fields = {
@@ -308,13 +468,24 @@ def modify_player_stats(player_id):
                     changes_made.append(f"-{value} {display_name}")
 
                 setattr(player, field, new_value)
+                changed_fields.append(field)
 
         if changes_made:
+            # Re-evaluate only the quests and achievements that read a changed stat
+            quest_types, achievement_ids = rules_for_fields(changed_fields)
+
             player.last_updated = datetime.utcnow()
+            if PlayerQuest.advance_progress([player.id], quest_types):
+                # Quest rewards add experience, which feeds level and star achievements
+                achievement_ids |= rules_for_fields({'experience'})[1]
+            new_achievements = [achievement for _, achievement in Achievement.award_eligible([player.id], achievement_ids)]
             db.session.commit()
 
             operation_text = "Добавлено" if operation == 'add' else "Вычтено"
-            flash(f'{operation_text} для {player.nickname}: {", ".join(changes_made)}', 'success')
+            success_message = f'{operation_text} для {player.nickname}: {", ".join(changes_made)}'
+            if new_achievements:
+                success_message += f' Получены достижения: {", ".join(a.title for a in new_achievements)}'
+            flash(success_message, 'success')
         else:
             flash('Нет изменений для применения!', 'warning')
 
@@ -336,6 +507,7 @@ def delete_player(player_id):
         nickname = player.nickname
         db.session.delete(player)
         db.session.commit()
+        leaderboard_row_cache.invalidate(player_id)
         flash(f'Игрок {nickname} удален из таблицы лидеров!', 'success')
     except Exception as e:
         app.logger.error(f"Error deleting player: {e}")
@@ -353,6 +525,7 @@ def clear_leaderboard():
     try:
         Player.query.delete()
         db.session.commit()
+        leaderboard_row_cache.clear()
         flash('Таблица лидеров очищена!', 'success')
     except Exception as e:
         app.logger.error(f"Error clearing leaderboard: {e}")
@@ -360,50 +533,121 @@ def clear_leaderboard():
 
     return redirect(url_for('admin'))
 
-@app.route('/export')
-def export_leaderboard():
-    """Export leaderboard data as CSV"""
-    try:
-        players = Player.query.order_by(Player.experience.desc()).all()
-
+# Exported columns: (key for JSON formats, CSV header, Player column)
+EXPORT_COLUMNS = [
+    ('nickname', 'Ник', Player.nickname),
+    ('level', 'Уровень', Player.level_value),
+    ('experience', 'Опыт', Player.experience),
+    ('kills', 'Киллы', Player.kills),
+    ('final_kills', 'Финальные киллы', Player.final_kills),
+    ('deaths', 'Смерти', Player.deaths),
+    ('kd_ratio', 'K/D', Player.kd_ratio_value),
+    ('fkd_ratio', 'FK/D', Player.fkd_ratio_value),
+    ('beds_broken', 'Кровати', Player.beds_broken),
+    ('games_played', 'Игры', Player.games_played),
+    ('wins', 'Победы', Player.wins),
+    ('win_rate', 'Процент побед', Player.win_rate_value),
+    ('role', 'Роль', Player.role),
+    ('server_ip', 'Сервер', Player.server_ip),
+    ('iron_collected', 'Железо', Player.iron_collected),
+    ('gold_collected', 'Золото', Player.gold_collected),
+    ('diamond_collected', 'Алмазы', Player.diamond_collected),
+    ('emerald_collected', 'Изумруды', Player.emerald_collected),
+    ('items_purchased', 'Покупки', Player.items_purchased),
+    ('created_at', 'Дата создания', Player.created_at),
+    ('last_updated', 'Последнее обновление', Player.last_updated)
+]
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'columnar': ('application/x-ndjson', 'columns.ndjson')
+}
+
+EXPORT_BATCH_SIZE = 1000
+
+def export_rows(sort_by, limit):
+    """Yield batches of exported rows as tuples, streamed from the database"""
+    query = Player.leaderboard_query(sort_by).with_entities(*[column for _, _, column in EXPORT_COLUMNS])
+    if limit:
+        query = query.limit(limit)
+
+    # A large export, or a slow client between batches, outlasts the request-sized timeouts
+    with long_running_statements(db.session):
+        batch = []
+        for row in query.yield_per(EXPORT_BATCH_SIZE):
+            batch.append(tuple(
+                value.strftime('%Y-%m-%d %H:%M:%S') if isinstance(value, datetime) else value
+                for value in row
+            ))
+            if len(batch) == EXPORT_BATCH_SIZE:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+def export_chunks(export_format, sort_by, limit):
+    """Encode exported rows as CSV, NDJSON rows or NDJSON column groups"""
+    keys = [key for key, _, _ in EXPORT_COLUMNS]
+
+    if export_format == 'csv':
         output = io.StringIO()
         writer = csv.writer(output)
+        writer.writerow([header for _, header, _ in EXPORT_COLUMNS])
+        for batch in export_rows(sort_by, limit):
+            writer.writerows(batch)
+            yield output.getvalue()
+            output.seek(0)
+            output.truncate()
+        yield output.getvalue()
+
+    elif export_format == 'ndjson':
+        for batch in export_rows(sort_by, limit):
+            yield ''.join(json.dumps(dict(zip(keys, row)), ensure_ascii=False) + '\n' for row in batch)
 
-        # Header
-        writer.writerow([
-            'Ник', 'Уровень', 'Опыт', 'Киллы', 'Финальные киллы', 'Смерти',
-            'K/D', 'FK/D', 'Кровати', 'Игры', 'Победы', 'Процент побед',
-            'Роль', 'Сервер', 'Железо', 'Золото', 'Алмазы', 'Изумруды',
-            'Покупки', 'Дата создания', 'Последнее обновление'
-        ])
-
-        # Data
-        for player in players:
-            writer.writerow([
-                player.nickname, player.level, player.experience,
-                player.kills, player.final_kills, player.deaths,
-                player.kd_ratio, player.fkd_ratio, player.beds_broken,
-                player.games_played, player.wins, player.win_rate,
-                player.role, player.server_ip, player.iron_collected,
-                player.gold_collected, player.diamond_collected,
-                player.emerald_collected, player.items_purchased,
-                player.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-                player.last_updated.strftime('%Y-%m-%d %H:%M:%S')
-            ])
-
-        output.seek(0)
-
-        response = make_response(output.getvalue())
-        response.headers['Content-Type'] = 'text/csv'
-        response.headers['Content-Disposition'] = f'attachment; filename=bedwars_leaderboard_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
-
-        return response
+    else:
+        # Parquet-like row groups: one JSON object of column arrays per batch
+        for batch in export_rows(sort_by, limit):
+            yield json.dumps(dict(zip(keys, map(list, zip(*batch)))), ensure_ascii=False) + '\n'
+
+def gzip_chunks(chunks):
+    """Gzip a stream of text chunks on the fly"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
 
-    except Exception as e:
-        app.logger.error(f"Error exporting data: {e}")
-        flash('Произошла ошибка при экспорте данных!', 'error')
+@app.route('/export')
+def export_leaderboard():
+    """Stream leaderboard data as CSV, NDJSON or columnar NDJSON"""
+    export_format = request.args.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        flash('Неизвестный формат экспорта!', 'error')
         return redirect(url_for('index'))
 
+    sort_by = request.args.get('sort', 'experience')
+    if sort_by not in LEADERBOARD_SORT_KEYS:
+        sort_by = 'experience'
+    limit = max(0, request.args.get('limit', 0, type=int))
+
+    mimetype, extension = EXPORT_FORMATS[export_format]
+    chunks = export_chunks(export_format, sort_by, limit)
+    use_gzip = request.args.get('gzip', '1') != '0' and request.accept_encodings['gzip']
+    if use_gzip:
+        chunks = gzip_chunks(chunks)
+
+    response = Response(stream_with_context(chunks), mimetype=mimetype)
+    if mimetype == 'text/csv':
+        response.headers['Content-Type'] = 'text/csv; charset=utf-8'
+    if use_gzip:
+        response.headers['Content-Encoding'] = 'gzip'
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Content-Disposition'] = f'attachment; filename=bedwars_leaderboard_{datetime.now().strftime("%Y%m%d_%H%M%S")}.{extension}'
+
+    return response
+
 @app.route('/api/stats')
 def api_stats():
     """API endpoint for statistics data (for charts)"""
@@ -413,7 +657,6 @@ def api_stats():
 
         # Prepare data for charts
         chart_data = {
-            'player_levels': {},
             'top_players_exp': {
                 'labels': [p.nickname for p in top_players],
                 'data': [p.experience for p in top_players]
@@ -425,25 +668,16 @@ def api_stats():
         }
 
         # Level distribution
-        all_players = Player.query.all()
-        for player in all_players:
-            level = f"Level {player.level}"
-            chart_data['player_levels'][level] = chart_data['player_levels'].get(level, 0) + 1
-
-        # Convert top_player to dict if it exists
-        stats_copy = stats.copy()
-        if stats_copy.get('top_player'):
-            top_player = stats_copy['top_player']
-            stats_copy['top_player'] = {
-                'nickname': top_player.nickname,
-                'level': top_player.level,
-                'experience': top_player.experience,
-                'kills': top_player.kills,
-                'wins': top_player.wins
-            }
+        chart_data['player_levels'] = Player.get_level_distribution()
+
+        # Optional extra histograms, e.g. ?buckets=kd_ratio,win_rate,resources
+        for field in request.args.get('buckets', '').split(','):
+            field = field.strip()
+            if field in DISTRIBUTION_BANDS:
+                chart_data[f'{field}_distribution'] = Player.get_distribution(field)
 
         return jsonify({
-            'stats': stats_copy,
+            'stats': stats,
             'charts': chart_data
         })
 
@@ -451,6 +685,267 @@ def api_stats():
         app.logger.error(f"Error getting API stats: {e}")
         return jsonify({'error': 'Failed to load statistics'}), 500
 
+@app.route('/api/leaderboard')
+def api_leaderboard():
+    """Keyset-paginated leaderboard JSON for bots and in-game scoreboards"""
+    sort_by = request.args.get('sort', 'experience')
+    if sort_by not in LEADERBOARD_SORT_KEYS:
+        sort_by = 'experience'
+    after = request.args.get('after', '').strip()
+    limit = max(1, min(request.args.get('limit', 50, type=int), 200))
+
+    window = request.args.get('window', '').strip()
+    if window:
+        if window not in LEADERBOARD_WINDOWS:
+            return jsonify({'error': 'Invalid window'}), 400
+        return api_window_leaderboard(window, sort_by, limit)
+
+    around = request.args.get('around', '').strip()
+    if around:
+        return api_leaderboard_around(around, sort_by, min(limit, 50))
+
+    try:
+        cursor = Player.parse_leaderboard_cursor(sort_by, after) if after else None
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
+
+    try:
+        if leaderboard_index_enabled():
+            leaderboard_index.sync()
+            version = f'index:{leaderboard_index.version}'
+        else:
+            version = Player.get_leaderboard_version()
+        etag = hashlib.sha1(f'{version}|{sort_by}|{after}|{limit}'.encode()).hexdigest()
+
+        if etag in request.if_none_match:
+            response = make_response('', 304)
+        elif leaderboard_index_enabled():
+            players, next_cursor = leaderboard_index.page_after(sort_by, cursor, limit)
+            response = jsonify({'sort': sort_by, 'players': players, 'next': next_cursor})
+        else:
+            players, next_cursor = Player.get_leaderboard_page(sort_by, cursor, limit)
+            if players:
+                # Rows are consecutive, so one rank lookup numbers the whole page
+                first_rank = Player.get_ranks([sort_by], [players[0]['id']])[players[0]['id']][sort_by]['rank']
+                for offset, row in enumerate(players):
+                    row['rank'] = first_rank + offset
+            response = jsonify({'sort': sort_by, 'players': players, 'next': next_cursor})
+
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+    except Exception as e:
+        app.logger.error(f"Error getting API leaderboard: {e}")
+        return jsonify({'error': 'Failed to load leaderboard'}), 500
+
+def api_leaderboard_around(nickname, sort_by, count):
+    """A player's leaderboard position with count players above and below"""
+    player = Player.query.filter_by(nickname=nickname).first()
+    if not player:
+        return jsonify({'error': 'Player not found'}), 404
+
+    try:
+        version = Player.get_leaderboard_version()
+        etag = hashlib.sha1(f'{version}|around|{player.id}|{sort_by}|{count}'.encode()).hexdigest()
+
+        if etag in request.if_none_match:
+            response = make_response('', 304)
+        else:
+            players, rank = Player.get_leaderboard_around(sort_by, player, count)
+            response = jsonify({'sort': sort_by, 'around': player.nickname, 'rank': rank['rank'],
+                                'percentile': rank['percentile'], 'players': players, 'next': None})
+
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+    except Exception as e:
+        app.logger.error(f"Error getting leaderboard around {nickname}: {e}")
+        return jsonify({'error': 'Failed to load leaderboard'}), 500
+
+@app.route('/api/player/<nickname>/ranks')
+def api_player_ranks(nickname):
+    """A player's rank and percentile for every leaderboard sort option"""
+    player = Player.query.filter_by(nickname=nickname).first()
+    if not player:
+        return jsonify({'error': 'Player not found'}), 404
+
+    try:
+        ranks = Player.get_ranks(LEADERBOARD_SORT_KEYS, [player.id])[player.id]
+        return jsonify({'nickname': player.nickname, 'ranks': ranks})
+
+    except Exception as e:
+        app.logger.error(f"Error getting ranks for {nickname}: {e}")
+        return jsonify({'error': 'Failed to load ranks'}), 500
+
+def api_window_leaderboard(window, sort_by, limit):
+    """Top players for a time window, answered from the hourly/daily rollups"""
+    try:
+        period, since = PlayerStatRollup.get_window(window)
+        version = Player.get_leaderboard_version()
+        etag = hashlib.sha1(f'{version}|{window}|{since.isoformat()}|{sort_by}|{limit}'.encode()).hexdigest()
+
+        if etag in request.if_none_match:
+            response = make_response('', 304)
+        else:
+            players, since = PlayerStatRollup.get_leaderboard(window, sort_by, limit)
+            response = jsonify({'sort': sort_by, 'window': window, 'since': since.isoformat(),
+                                'players': players, 'next': None})
+
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+    except Exception as e:
+        app.logger.error(f"Error getting {window} leaderboard: {e}")
+        return jsonify({'error': 'Failed to load leaderboard'}), 500
+
+@app.route('/api/search/suggest')
+def api_search_suggest():
+    """Nickname autocomplete suggestions"""
+    query = request.args.get('q', '').strip()
+    limit = max(1, min(request.args.get('limit', 8, type=int), 20))
+    if len(query) < 2:
+        return jsonify({'suggestions': []})
+
+    try:
+        rows = search_query(query, limit).with_entities(Player.id, Player.nickname, Player.level_value).all()
+        return jsonify({'suggestions': [
+            {'id': row.id, 'nickname': row.nickname, 'level': row.level_value} for row in rows
+        ]})
+
+    except Exception as e:
+        app.logger.error(f"Error getting search suggestions: {e}")
+        return jsonify({'error': 'Failed to load suggestions'}), 500
+
+def parse_ingest_batch(payload):
+    """Validate an ingest payload and merge it into nickname -> {field: delta}, raising ValueError"""
+    entries = payload.get('players') if isinstance(payload, dict) else None
+    if not isinstance(entries, list) or not entries:
+        raise ValueError('Expected a non-empty "players" list')
+    if len(entries) > MAX_INGEST_PLAYERS:
+        raise ValueError(f'At most {MAX_INGEST_PLAYERS} players per batch')
+
+    deltas = {}
+    for entry in entries:
+        if not isinstance(entry, dict):
+            raise ValueError('Each player must be an object')
+        nickname = entry.get('nickname')
+        if not isinstance(nickname, str) or not nickname.strip() or len(nickname.strip()) > 20:
+            raise ValueError('Each player needs a nickname of 1-20 characters')
+
+        player_deltas = deltas.setdefault(nickname.strip(), dict.fromkeys(STAT_DELTA_FIELDS, 0))
+        for field, value in entry.items():
+            if field == 'nickname':
+                continue
+            if field not in STAT_DELTA_FIELDS:
+                raise ValueError(f'Unknown stat "{field}"')
+            if not isinstance(value, int) or isinstance(value, bool) or not 0 <= value <= 999999:
+                raise ValueError(f'"{field}" must be an integer between 0 and 999999')
+            player_deltas[field] += value
+    return deltas
+
+def parse_ingest_match(payload):
+    """Validate the optional "match" details of an ingest payload, raising ValueError; None if there are none"""
+    details = payload.get('match')
+    if details is None:
+        return None
+    if not isinstance(details, dict):
+        raise ValueError('"match" must be an object')
+
+    match = {}
+    for key, column, max_length in (('server', 'server_ip', 100), ('map', 'map_name', 100), ('mode', 'mode', 50)):
+        value = details.get(key)
+        if value is not None:
+            if not isinstance(value, str) or len(value) > max_length:
+                raise ValueError(f'"match.{key}" must be a string of at most {max_length} characters')
+            match[column] = value
+
+    ended_at = details.get('ended_at')
+    if ended_at is not None:
+        try:
+            ended_at = datetime.fromisoformat(ended_at.replace('Z', '+00:00'))
+        except (TypeError, AttributeError, ValueError):
+            raise ValueError('"match.ended_at" must be an ISO 8601 timestamp')
+        if ended_at.tzinfo is not None:
+            ended_at = ended_at.astimezone(timezone.utc).replace(tzinfo=None)
+        if ended_at > datetime.utcnow():
+            raise ValueError('"match.ended_at" is in the future')
+        match['ended_at'] = ended_at
+    return match
+
+@app.route('/api/ingest', methods=['POST'])
+def api_ingest():
+    """Apply a batch of per-player stat deltas from a game server in one transaction"""
+    if not INGEST_API_KEY:
+        return jsonify({'error': 'Ingest API is not configured'}), 503
+    token = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+    if not hmac.compare_digest(token.encode(), INGEST_API_KEY.encode()):
+        return jsonify({'error': 'Invalid API key'}), 401
+
+    idempotency_key = request.headers.get('Idempotency-Key', '').strip()
+    if len(idempotency_key) > 100:
+        return jsonify({'error': 'Idempotency-Key is too long'}), 400
+
+    payload = request.get_json(silent=True)
+    try:
+        deltas = parse_ingest_batch(payload)
+        match_details = parse_ingest_match(payload)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    def replay(batch):
+        return jsonify({'success': True, 'replayed': True,
+                        'players_updated': batch.players_updated,
+                        'players_created': batch.players_created})
+
+    try:
+        if idempotency_key:
+            batch = db.session.get(IngestBatch, idempotency_key)
+            if batch:
+                return replay(batch)
+            # Claim the key first so a concurrent retry fails on the primary key, not after the work
+            batch = IngestBatch(idempotency_key=idempotency_key)
+            db.session.add(batch)
+            db.session.flush()
+
+        player_ids, created = Player.apply_stat_deltas(deltas)
+        if match_details is not None:
+            Match.record(deltas, **match_details)
+        else:
+            # A plain counter top-up: no match to keep, but it still counts towards the windowed leaderboards
+            PlayerStatRollup.add_deltas(datetime.utcnow(), deltas)
+
+        # Re-evaluate only the quests and achievements that read a stat present in the batch
+        changed_fields = {field for player_deltas in deltas.values() for field, delta in player_deltas.items() if delta}
+        quest_types, achievement_ids = rules_for_fields(changed_fields)
+        if PlayerQuest.advance_progress(player_ids, quest_types):
+            # Quest rewards add experience, which feeds level and star achievements
+            achievement_ids |= rules_for_fields({'experience'})[1]
+        Achievement.award_eligible(player_ids, achievement_ids)
+        if idempotency_key:
+            batch.players_updated = len(player_ids)
+            batch.players_created = created
+        db.session.commit()
+
+        return jsonify({'success': True, 'replayed': False,
+                        'players_updated': len(player_ids),
+                        'players_created': created})
+
+    except IntegrityError:
+        db.session.rollback()
+        batch = db.session.get(IngestBatch, idempotency_key) if idempotency_key else None
+        if batch:
+            return replay(batch)
+        app.logger.error("Integrity error while ingesting stats")
+        return jsonify({'error': 'Conflicting batch, retry later'}), 409
+
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Error ingesting stats: {e}")
+        return jsonify({'error': 'Failed to apply stats'}), 500
+
 # Quest system routes
 @app.route('/quests')
 def quests():
@@ -463,29 +958,25 @@ def quests():
     if player_nickname:
         current_player = Player.query.filter_by(nickname=player_nickname).first()
 
-    # Initialize default quests if none exist
-    if Quest.query.count() == 0:
-        Quest.create_default_quests()
-
     # Get all active quests
     active_quests = Quest.get_active_quests()
 
-    # Get player quest progress if logged in
-    player_progress = {}
+    # Initialize default quests if none exist
+    if not active_quests and Quest.query.first() is None:
+        Quest.create_default_quests()
+        active_quests = Quest.get_active_quests()
 
-    if current_player:
-        # Update quest progress for current player
-        PlayerQuest.update_player_quest_progress(current_player)
+    # Get player quest progress if logged in (kept current by PlayerQuest.advance_progress on stat changes)
+    player_progress = {}
 
-        # Get player's quest progress
-        for quest in active_quests:
-            player_quest = PlayerQuest.query.filter_by(
-                player_id=current_player.id, 
-                quest_id=quest.id
-            ).first()
+    if current_player and active_quests:
+        player_quests = PlayerQuest.query.filter(
+            PlayerQuest.player_id == current_player.id,
+            PlayerQuest.quest_id.in_([quest.id for quest in active_quests])
+        ).order_by(PlayerQuest.id).all()
 
-            if player_quest:
-                player_progress[quest.id] = player_quest
+        for player_quest in player_quests:
+            player_progress.setdefault(player_quest.quest_id, player_quest)
 
     return render_template('quests.html', 
                          quests=active_quests,
@@ -558,8 +1049,7 @@ def accept_quest(quest_id):
         existing_quest.started_at = datetime.utcnow()
 
         # Set baseline value for quest tracking
-        quest = Quest.query.get_or_404(quest_id)
-        existing_quest.baseline_value = getattr(player, quest.type, 0)
+        existing_quest.baseline_value = player.get_quest_stat(quest.type)
 
         db.session.commit()
         flash(f'Квест "{quest.title}" принят!', 'success')
@@ -630,10 +1120,10 @@ def admin_quests():
 
     quests = Quest.query.all()
     quest_stats = []
+    progress_counts = Quest.get_progress_counts()
 
     for quest in quests:
-        total_attempts = PlayerQuest.query.filter_by(quest_id=quest.id).count()
-        completed = PlayerQuest.query.filter_by(quest_id=quest.id, is_completed=True).count()
+        total_attempts, completed = progress_counts.get(quest.id, (0, 0))
         completion_rate = (completed / total_attempts * 100) if total_attempts > 0 else 0
 
         quest_stats.append({
@@ -716,10 +1206,10 @@ def init_demo():
         CustomTitle.create_default_titles()
         GradientTheme.create_default_themes()
 
-        # Update quest progress for all players
-        players = Player.query.all()
-        for player in players:
-            PlayerQuest.update_player_quest_progress(player)
+        # Update quest progress and achievements for all players
+        PlayerQuest.advance_progress()
+        Achievement.award_eligible()
+        db.session.commit()
 
         flash('Демо-данные успешно инициализированы!', 'success')
 
@@ -756,6 +1246,8 @@ def update_player_skin(player_id):
             flash(f'Тип скина изменен на {skin_type} для {player.nickname}!', 'success')
 
         db.session.commit()
+        leaderboard_row_cache.invalidate(player_id)
+        prefetch_avatar(player)
 
     except Exception as e:
         app.logger.error(f"Error updating player skin: {e}")
@@ -883,7 +1375,7 @@ def admin_titles():
         return redirect(url_for('login'))
 
     titles = CustomTitle.query.all()
-    players = Player.query.all()
+    players = Player.preload_cosmetics(Player.query.all())
 
     return render_template('admin_titles.html', titles=titles, players=players)
 
@@ -958,6 +1450,7 @@ def assign_title():
 
         db.session.add(player_title)
         db.session.commit()
+        leaderboard_row_cache.invalidate(player_id)
 
         flash(f'Титул "{title.display_name}" присвоен игроку {player.nickname}!', 'success')
 
@@ -976,6 +1469,7 @@ def remove_title(player_id):
     try:
         PlayerTitle.query.filter_by(player_id=player_id, is_active=True).update({'is_active': False})
         db.session.commit()
+        leaderboard_row_cache.invalidate(player_id)
 
         return jsonify({'success': True})
 
@@ -992,6 +1486,7 @@ def remove_all_titles():
     try:
         PlayerTitle.query.update({'is_active': False})
         db.session.commit()
+        leaderboard_row_cache.clear()
 
         return jsonify({'success': True})
 
@@ -1011,7 +1506,9 @@ def admin_gradients():
         GradientTheme.create_default_themes()
 
     themes = GradientTheme.query.all()
-    players = Player.query.all()
+    players = Player.query.options(
+        selectinload(Player.gradient_settings).joinedload(PlayerGradientSetting.gradient_theme)
+    ).all()
 
     # Group themes by element type
     grouped_themes = {}
@@ -1045,6 +1542,17 @@ def create_gradient():
             flash('Все обязательные поля должны быть заполнены!', 'error')
             return redirect(url_for('admin_gradients'))
 
+        # Only values that can go into the gradients stylesheet as they are
+        colors = [normalize_css_color(color) for color in (color1, color2, color3)]
+        if not all(colors[:2]) or (color3 and not colors[2]):
+            flash('Цвета градиента должны быть в формате #RRGGBB или названием цвета!', 'error')
+            return redirect(url_for('admin_gradients'))
+        color1, color2, color3 = colors
+        gradient_direction = gradient_direction.strip().lower()
+        if not CSS_DIRECTION_PATTERN.match(gradient_direction):
+            flash('Направление градиента должно быть углом (45deg) или вида "to right"!', 'error')
+            return redirect(url_for('admin_gradients'))
+
         # Check if theme already exists
         existing = GradientTheme.query.filter_by(name=name).first()
         if existing:
@@ -1092,6 +1600,13 @@ def assign_gradient():
             flash('Выберите игрока и тип элемента!', 'error')
             return redirect(url_for('admin_gradients'))
 
+        if not gradient_theme_id and (custom_color1 or custom_color2 or custom_color3):
+            colors = custom_gradient_colors(custom_color1, custom_color2, custom_color3)
+            if colors is None:
+                flash('Для кастомного градиента нужны минимум два цвета в формате #RRGGBB или названия цветов!', 'error')
+                return redirect(url_for('admin_gradients'))
+            custom_color1, custom_color2, custom_color3 = (colors + [None])[:3]
+
         player = Player.query.get_or_404(player_id)
 
         # Remove existing gradient for this element type
@@ -1113,6 +1628,7 @@ def assign_gradient():
 
         db.session.add(gradient_setting)
         db.session.commit()
+        leaderboard_row_cache.invalidate(player_id)
 
         theme_name = "кастомный градиент"
         if gradient_theme_id:
@@ -1139,6 +1655,7 @@ def remove_gradient(player_id, element_type):
             element_type=element_type
         ).delete()
         db.session.commit()
+        leaderboard_row_cache.invalidate(player_id)
 
         return jsonify({'success': True})
 
@@ -1155,13 +1672,18 @@ def public_profile(nickname):
         flash('Профиль этого игрока приватный!', 'error')
         return redirect(url_for('index'))
 
+    etag, last_modified = profile_validators(player, 'public')
+    if profile_not_modified(etag, last_modified):
+        return set_profile_cache_headers(make_response('', 304), etag, last_modified)
+
     is_owner = session.get('player_nickname') == nickname
     is_admin = session.get('is_admin', False)
 
-    return render_template('public_profile.html', 
-                         player=player, 
-                         is_owner=is_owner,
-                         is_admin=is_admin)
+    response = make_response(render_template('public_profile.html', 
+                                             player=player, 
+                                             is_owner=is_owner,
+                                             is_admin=is_admin))
+    return set_profile_cache_headers(response, etag, last_modified)
 
 @app.route('/my-profile')
 def my_profile():
@@ -1181,8 +1703,11 @@ def my_profile():
             gradient_themes[theme.element_type] = []
         gradient_themes[theme.element_type].append(theme)
 
+    ranks = Player.get_ranks(LEADERBOARD_SORT_KEYS, [player.id])[player.id]
+
     return render_template('my_profile.html', 
                          player=player,
+                         ranks=ranks,
                          gradient_themes=gradient_themes)
 
 @app.route('/update-profile', methods=['POST'])
@@ -1252,6 +1777,7 @@ def update_profile():
             player.set_social_networks_list([])
 
         db.session.commit()
+        prefetch_avatar(player)
         flash('Профиль успешно обновлен!', 'success')
 
     except Exception as e:
@@ -1293,6 +1819,7 @@ def apply_gradient():
             db.session.add(gradient_setting)
 
         db.session.commit()
+        leaderboard_row_cache.invalidate(player.id)
         return jsonify({'success': True})
 
     except Exception as e:
@@ -1344,6 +1871,7 @@ def activate_player_title():
             if player_title:
                 player_title.is_active = True
                 db.session.commit()
+                leaderboard_row_cache.invalidate(player.id)
                 flash('Титул активирован!', 'success')
             else:
                 flash('Титул не найден!', 'error')
@@ -1364,11 +1892,28 @@ def admin_achievements():
     achievements = Achievement.query.all()
 
     # Add earned count to each achievement
+    earned_counts = Achievement.get_earned_counts()
     for achievement in achievements:
-        achievement.earned_count = PlayerAchievement.query.filter_by(achievement_id=achievement.id).count()
+        achievement.earned_count = earned_counts.get(achievement.id, 0)
 
     return render_template('admin_achievements.html', achievements=achievements)
 
+@app.route('/admin/perf')
+def admin_perf():
+    """Per-endpoint timings, SQL counts, N+1 suspects and slow queries collected by this worker"""
+    if not session.get('is_admin', False):
+        flash('Доступ запрещен!', 'error')
+        return redirect(url_for('login'))
+
+    return render_template('admin_perf.html',
+                           endpoints=perf_stats.summary(),
+                           slow_queries=perf_stats.recent_slow_queries(),
+                           buckets=LATENCY_BUCKETS_MS,
+                           window_minutes=app.config['PERF_WINDOW_SECONDS'] // 60,
+                           slow_query_ms=app.config['SLOW_QUERY_MS'],
+                           n_plus_one_threshold=app.config['N_PLUS_ONE_THRESHOLD'],
+                           enabled=app.config['PERF_INSTRUMENTATION'])
+
 @app.route('/admin/create_achievement', methods=['POST'])
 def create_achievement():
     """Create custom achievement (admin only)"""
@@ -0,0 +1,171 @@
+from app import app, db
+from models import CacheVersion, Player
+from sqlalchemy import Column, Integer, MetaData, String, Table, case, event, func, inspect, text
+from sqlalchemy.exc import DBAPIError
+import threading
+
+# pg_trgm GIN index; makes nickname ILIKE '%q%' an index lookup on PostgreSQL
+POSTGRESQL_SEARCH_DDL = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS ix_player_nickname_trgm ON player USING gin (nickname gin_trgm_ops)',
+]
+
+# External-content FTS5 table with the trigram tokenizer, kept in sync with player by triggers
+SQLITE_SEARCH_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS player_search USING fts5("
+    "nickname, tokenize='trigram', content='player', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS player_search_ai AFTER INSERT ON player BEGIN "
+    "INSERT INTO player_search(rowid, nickname) VALUES (new.id, new.nickname); END",
+    "CREATE TRIGGER IF NOT EXISTS player_search_ad AFTER DELETE ON player BEGIN "
+    "INSERT INTO player_search(player_search, rowid, nickname) VALUES ('delete', old.id, old.nickname); END",
+    "CREATE TRIGGER IF NOT EXISTS player_search_au AFTER UPDATE OF nickname ON player BEGIN "
+    "INSERT INTO player_search(player_search, rowid, nickname) VALUES ('delete', old.id, old.nickname); "
+    "INSERT INTO player_search(rowid, nickname) VALUES (new.id, new.nickname); END",
+    "INSERT INTO player_search(player_search) VALUES ('rebuild')",
+]
+
+# FTS5 trigram queries need at least this many characters; shorter ones fall back to LIKE
+MIN_MATCH_LENGTH = 3
+
+# Not part of db.metadata, so create_all() never tries to create it as a plain table
+player_search = Table(
+    'player_search', MetaData(),
+    Column('rowid', Integer, primary_key=True),
+    Column('nickname', String(100))
+)
+
+
+def create_search_index(connection):
+    """Create the nickname search index for the connection's database; False if there is none for it"""
+    if connection.dialect.name == 'postgresql':
+        try:
+            # A savepoint keeps the surrounding transaction usable when the role may not create extensions
+            with connection.begin_nested():
+                for statement in POSTGRESQL_SEARCH_DDL:
+                    connection.execute(text(statement))
+        except DBAPIError as e:
+            app.logger.warning(f"Nickname search index not created, searches will scan the player table: {e}")
+            return False
+        return True
+    if connection.dialect.name == 'sqlite':
+        for statement in SQLITE_SEARCH_DDL:
+            connection.execute(text(statement))
+        return True
+    return False
+
+
+@event.listens_for(Player.__table__, 'after_create')
+def create_search_index_with_table(target, connection, **kw):
+    """Build the search index along with a new player table"""
+    # Without FTS5, SQLite searches use the in-memory trigram index instead
+    if connection.dialect.name == 'sqlite' and \
+            not connection.execute(text("SELECT sqlite_compileoption_used('ENABLE_FTS5')")).scalar():
+        return
+    create_search_index(connection)
+
+
+class TrigramIndex:
+    """In-memory trigram index over nicknames, used when the database has no search index.
+
+    Rebuilt from (id, nickname) whenever the 'nicknames' version changes,
+    which covers added, renamed and deleted players; stat writes leave it
+    alone, and the database orders the candidates by current experience.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._nicknames = {}
+        self._trigrams = {}
+
+    def search(self, query, limit):
+        """Ids of nicknames containing query; substring-only matches are left out once prefix matches fill limit"""
+        self._refresh()
+        needle = query.casefold()
+        with self._lock:
+            trigrams = _trigrams(needle)
+            if trigrams:
+                candidates = set.intersection(*(self._trigrams.get(trigram, set()) for trigram in trigrams))
+            else:
+                candidates = self._nicknames.keys()
+
+            leading = []
+            substring = []
+            for player_id in candidates:
+                nickname = self._nicknames[player_id]
+                if nickname.startswith(needle):
+                    leading.append(player_id)
+                elif needle in nickname:
+                    substring.append(player_id)
+
+        # A substring match never outranks a full page of exact and prefix matches
+        return leading if len(leading) >= limit else leading + substring
+
+    def _refresh(self):
+        version = CacheVersion.current('nicknames')
+        if version == self._version:
+            return
+
+        nicknames = {}
+        trigrams = {}
+        rows = db.session.query(Player.id, Player.nickname).yield_per(1000)
+        for player_id, nickname in rows:
+            nickname = nickname.casefold()
+            nicknames[player_id] = nickname
+            for trigram in _trigrams(nickname):
+                trigrams.setdefault(trigram, set()).add(player_id)
+
+        with self._lock:
+            self._nicknames = nicknames
+            self._trigrams = trigrams
+            self._version = version
+
+
+def _trigrams(value):
+    return {value[i:i + 3] for i in range(len(value) - 2)}
+
+
+trigram_index = TrigramIndex()
+_has_fts_index = None
+
+
+def has_fts_index():
+    """Check once per process whether the SQLite FTS5 search table exists"""
+    global _has_fts_index
+    if _has_fts_index is None:
+        _has_fts_index = inspect(db.engine).has_table('player_search')
+    return _has_fts_index
+
+
+def search_candidates(query):
+    """Unordered Player query for nicknames containing query (case-insensitive), using the database's search index"""
+    escaped = query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    results = Player.query.filter(Player.nickname.ilike(f'%{escaped}%', escape='\\'))
+
+    if db.engine.dialect.name == 'sqlite' and len(query) >= MIN_MATCH_LENGTH:
+        # Trigram candidates from the FTS5 index (a quoted phrase is a substring match);
+        # the ILIKE above rechecks them so results match the other backends
+        phrase = '"' + query.replace('"', '""') + '"'
+        results = results.join(player_search, player_search.c.rowid == Player.id).filter(
+            text('player_search MATCH :phrase').bindparams(phrase=phrase)
+        )
+    return results
+
+
+def search_query(query, limit):
+    """Build a ranked, limited Player query for nicknames containing query (case-insensitive)"""
+    query = query.strip()
+
+    if db.engine.dialect.name == 'sqlite' and not has_fts_index():
+        candidates = Player.query.filter(Player.id.in_(trigram_index.search(query, limit)))
+    else:
+        candidates = search_candidates(query)
+
+    escaped = query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    nickname = Player.nickname
+    rank = case(
+        (func.lower(nickname) == query.lower(), 0),
+        (nickname.ilike(f'{escaped}%', escape='\\'), 1),
+        else_=2
+    )
+    return candidates.order_by(rank, Player.experience.desc(), Player.id).limit(limit)
@@ -23,6 +23,9 @@ function initializeApp() {
     // Initialize search functionality
     initializeSearch();
     
+    // Load leaderboard positions into profile pages
+    loadPlayerRanks();
+    
     // Initialize mobile optimizations
     initializeMobileOptimizations();
     
@@ -374,6 +377,19 @@ function showSaveIndicator() {
 }
 
 // Search Functionality
+// Profile ranks change with every player's stats, so they are fetched
+// separately and the profile page itself stays cacheable
+function loadPlayerRanks() {
+    document.querySelectorAll('[data-ranks-url]').forEach(container => {
+        fetch(container.dataset.ranksUrl)
+            .then(response => response.ok ? response.text() : '')
+            .then(html => {
+                container.innerHTML = html;
+            })
+            .catch(error => console.error('Error loading player ranks:', error));
+    });
+}
+
 function initializeSearch() {
     const searchInput = document.querySelector('input[name="search"]');
     if (!searchInput) return;
@@ -393,7 +409,7 @@ function addSearchSuggestions(searchInput) {
     
     searchInput.addEventListener('input', debounce(() => {
         updateSearchSuggestions(searchInput, suggestions);
-    }, 300));
+    }, 150));
     
     searchInput.addEventListener('blur', () => {
         setTimeout(() => {
@@ -402,38 +418,53 @@ function addSearchSuggestions(searchInput) {
     });
 }
 
+let suggestionsRequest = null;
+
 function updateSearchSuggestions(searchInput, suggestionsDiv) {
-    const query = searchInput.value.trim().toLowerCase();
-    if (query.length < 2) {
-        suggestionsDiv.style.display = 'none';
-        return;
-    }
-    
-    // Get player names from current page
-    const playerNames = Array.from(document.querySelectorAll('.player-name'))
-        .map(el => el.textContent.trim())
-        .filter(name => name.toLowerCase().includes(query))
-        .slice(0, 5);
+    // Drop the request for a query the user has already typed past
+    if (suggestionsRequest) suggestionsRequest.abort();
+    suggestionsRequest = null;
     
-    if (playerNames.length === 0) {
+    const query = searchInput.value.trim();
+    if (query.length < 2) {
         suggestionsDiv.style.display = 'none';
         return;
     }
     
-    suggestionsDiv.innerHTML = playerNames
-        .map(name => `<div class="search-suggestion p-2 cursor-pointer hover:bg-secondary">${name}</div>`)
-        .join('');
-    
-    suggestionsDiv.style.display = 'block';
-    
-    // Add click handlers
-    suggestionsDiv.querySelectorAll('.search-suggestion').forEach(suggestion => {
-        suggestion.addEventListener('click', () => {
-            searchInput.value = suggestion.textContent;
+    // Ask the server so players outside the rendered page are found too
+    const request = new AbortController();
+    suggestionsRequest = request;
+    fetch(`/api/search/suggest?q=${encodeURIComponent(query)}&limit=5`, { signal: request.signal })
+        .then(response => response.json())
+        .then(data => {
+            if (request.signal.aborted) return;
+            
+            const suggestions = data.suggestions || [];
+            if (suggestions.length === 0) {
+                suggestionsDiv.style.display = 'none';
+                return;
+            }
+            
+            suggestionsDiv.innerHTML = '';
+            suggestions.forEach(player => {
+                const suggestion = document.createElement('div');
+                suggestion.className = 'search-suggestion p-2 cursor-pointer hover:bg-secondary';
+                suggestion.textContent = player.nickname;
+                suggestion.addEventListener('click', () => {
+                    searchInput.value = player.nickname;
+                    suggestionsDiv.style.display = 'none';
+                    searchInput.form.submit();
+                });
+                suggestionsDiv.appendChild(suggestion);
+            });
+            
+            suggestionsDiv.style.display = 'block';
+        })
+        .catch(error => {
+            if (error.name === 'AbortError') return;
+            console.error('Error loading search suggestions:', error);
             suggestionsDiv.style.display = 'none';
-            searchInput.form.submit();
         });
-    });
 }
 
 function addSearchFilters() {
@@ -0,0 +1,50 @@
+import os
+import tempfile
+
+import pytest
+
+# app.py reads its settings at import time, so point it at a throwaway SQLite database first
+TEST_DIR = tempfile.mkdtemp(prefix='bedwars-tests-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(TEST_DIR, 'test.db')
+os.environ['AVATAR_CACHE_DIR'] = os.path.join(TEST_DIR, 'avatars')
+
+from app import app  # noqa: E402
+from dataset import generate_dataset  # noqa: E402
+from migrations import prepare_database  # noqa: E402
+import routes  # noqa: E402
+
+INGEST_API_KEY = 'test-ingest-key'
+
+
+@pytest.fixture(scope='session')
+def seeded_app():
+    """The app on a migrated database with default content and a small synthetic population"""
+    # Keeps migrate.lock out of the repository's instance folder
+    app.instance_path = TEST_DIR
+    with app.app_context():
+        prepare_database()
+        generate_dataset(500, seed=1)
+    return app
+
+
+@pytest.fixture
+def cli(seeded_app):
+    return seeded_app.test_cli_runner()
+
+
+@pytest.fixture
+def client(seeded_app):
+    return seeded_app.test_client()
+
+
+@pytest.fixture
+def ingest(client, monkeypatch):
+    """POST a payload to /api/ingest with the test API key (or another key)"""
+    monkeypatch.setattr(routes, 'INGEST_API_KEY', INGEST_API_KEY)
+
+    def post(payload, key=INGEST_API_KEY, idempotency_key=None):
+        headers = {'Authorization': f'Bearer {key}'}
+        if idempotency_key:
+            headers['Idempotency-Key'] = idempotency_key
+        return client.post('/api/ingest', json=payload, headers=headers)
+    return post
@@ -0,0 +1,44 @@
+from app import db
+from models import Achievement, Player, PlayerAchievement
+
+CONDITIONS = [
+    '{"games_played": 50}',
+    '{"kills": 200, "wins": 10}',
+    '{"kd_ratio": 1.5}',
+    '{"win_rate": 40}',
+    '{"total_resources": 20000}',
+    '{"level": 5, "star_rating": 2}',
+    '{"unknown_stat": 0}',
+    '{"unknown_stat": 1}',
+    '{}',
+]
+
+
+def test_award_eligible_matches_per_player_check(seeded_app):
+    with seeded_app.app_context():
+        achievements = [Achievement(title=f'Parity {index}', description='', unlock_condition=condition, reward_xp=0)
+                        for index, condition in enumerate(CONDITIONS)]
+        db.session.add_all(achievements)
+        db.session.flush()
+        players = Player.query.order_by(Player.id).limit(80).all()
+        # Some players already hold one of them and must not get it twice
+        for player in players[:10]:
+            db.session.add(PlayerAchievement(player_id=player.id, achievement_id=achievements[0].id))
+        db.session.flush()
+
+        held = {(row.player_id, row.achievement_id) for row in PlayerAchievement.query}
+        expected = {(player.id, achievement.id) for player in players for achievement in achievements
+                    if achievement.check_unlock_condition(player) and (player.id, achievement.id) not in held}
+        assert expected, 'the sample should unlock something'
+
+        player_ids = [player.id for player in players]
+        achievement_ids = [achievement.id for achievement in achievements]
+        awarded = Achievement.award_eligible(player_ids, achievement_ids)
+
+        assert {(player_id, achievement.id) for player_id, achievement in awarded} == expected
+        assert len(awarded) == len(expected)
+
+        assert Achievement.award_eligible(player_ids, achievement_ids) == []
+        assert PlayerAchievement.query.filter(PlayerAchievement.achievement_id.in_(achievement_ids)).count() == \
+            len(expected) + 10
+        db.session.rollback()
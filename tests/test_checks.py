@@ -0,0 +1,10 @@
+def test_hot_queries_are_served_by_indexes(cli):
+    result = cli.invoke(args=['check-query-plans'])
+    assert result.exit_code == 0, result.output
+
+
+def test_leaderboard_index_matches_sql(cli):
+    result = cli.invoke(args=['check-leaderboard-index'])
+    assert result.exit_code == 0, result.output
+    assert 'ok   incremental update' in result.output
+
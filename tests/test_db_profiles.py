@@ -0,0 +1,6 @@
+from db_profiles import engine_options
+
+
+def test_postgresql_profile_pings_pooled_connections():
+    assert engine_options('postgresql', environ={})['pool_pre_ping'] is True
+    assert engine_options('postgresql', environ={'DB_POOL_PRE_PING': '0'})['pool_pre_ping'] is False
@@ -0,0 +1,50 @@
+from datetime import datetime
+
+from app import db
+from models import PERSISTED_DERIVED_STATS, Player
+
+
+def assert_derived_stats_match(player):
+    for stat in PERSISTED_DERIVED_STATS:
+        assert getattr(player, f'{stat}_value') == getattr(player, stat), stat
+
+
+def test_persisted_stats_cover_every_sortable_derived_stat():
+    assert set(PERSISTED_DERIVED_STATS) == {'level', 'kd_ratio', 'fkd_ratio', 'win_rate', 'star_rating'}
+
+
+def test_stat_writes_keep_derived_columns_in_sync(seeded_app):
+    with seeded_app.app_context():
+        player = Player.query.order_by(Player.id).first()
+        nickname = player.nickname
+
+        # ORM write
+        player.kills += 40
+        player.deaths += 3
+        db.session.commit()
+        assert_derived_stats_match(db.session.get(Player, player.id))
+
+        # Core upserts from the ingest path and quest rewards
+        Player.apply_stat_deltas({nickname: {'wins': 7, 'games_played': 9, 'final_kills': 12},
+                                  'DerivedNewcomer': {'kills': 3, 'experience': 2000}})
+        Player.add_experience({player.id: 20000})
+        db.session.commit()
+        for fresh in Player.query.filter(Player.nickname.in_([nickname, 'DerivedNewcomer'])):
+            assert_derived_stats_match(fresh)
+
+
+def test_update_derived_stats_repairs_rows_without_touching_last_updated(seeded_app):
+    with seeded_app.app_context():
+        player = Player.query.filter(Player.kills > 0).order_by(Player.id).first()
+        stamp = datetime(2020, 1, 1)
+        db.session.execute(Player.__table__.update().where(Player.id == player.id)
+                           .values(kd_ratio_value=-1, level_value=0, last_updated=stamp))
+        db.session.commit()
+
+        assert Player.update_derived_stats(db.session.connection(), Player.id == player.id) == [player.id]
+        db.session.commit()
+        db.session.expire_all()
+
+        repaired = db.session.get(Player, player.id)
+        assert_derived_stats_match(repaired)
+        assert repaired.last_updated == stamp
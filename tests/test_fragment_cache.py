@@ -0,0 +1,34 @@
+from app import db
+from models import Player, PlayerGradientSetting, custom_gradient_class
+from routes import leaderboard_row_cache
+
+
+def cached_row(player_id):
+    """The leaderboard row HTML cached for an anonymous viewer of a top-3 player"""
+    entry = leaderboard_row_cache._entries.get((player_id, (True, False)))
+    return entry and entry[1]
+
+
+def test_gradient_change_invalidates_cached_leaderboard_row(seeded_app, client):
+    with seeded_app.app_context():
+        player_id = Player.query.order_by(Player.experience.desc(), Player.id).first().id
+        PlayerGradientSetting.query.filter_by(player_id=player_id, element_type='nickname').delete()
+        db.session.add(PlayerGradientSetting(player_id=player_id, element_type='nickname', is_enabled=True,
+                                             custom_color1='#112233', custom_color2='#445566'))
+        db.session.commit()
+    first_class = custom_gradient_class('#112233', '#445566')
+    second_class = custom_gradient_class('#abcdef', '#fedcba')
+
+    assert first_class in client.get('/').get_data(as_text=True)
+    assert first_class in cached_row(player_id)
+
+    # Changed without going through a route, so nothing calls leaderboard_row_cache.invalidate():
+    # the row's version key alone has to notice
+    with seeded_app.app_context():
+        setting = PlayerGradientSetting.query.filter_by(player_id=player_id, element_type='nickname').one()
+        setting.custom_color1, setting.custom_color2 = '#abcdef', '#fedcba'
+        db.session.commit()
+
+    page = client.get('/').get_data(as_text=True)
+    assert second_class in page and first_class not in page
+    assert second_class in cached_row(player_id)
@@ -0,0 +1,39 @@
+import pytest
+
+from models import CSS_COLOR_MAX_LENGTH, GradientTheme, PlayerGradientSetting, custom_gradient_colors, normalize_css_color
+
+
+@pytest.mark.parametrize('color, expected', [
+    ('#FF8800', '#ff8800'),
+    ('f80', '#f80'),
+    (' Crimson ', 'crimson'),
+    ('skyblue', 'skyblue'),
+    ('darkblue', None),        # a real colour name, but longer than the column
+    ('notacolor', None),
+    ('redd', None),
+    ('a' * 20, None),
+    ('red;}body{', None),
+    ('', None),
+])
+def test_normalize_css_color(color, expected):
+    assert normalize_css_color(color) == expected
+
+
+def test_accepted_colors_fit_the_columns():
+    for column in (GradientTheme.color1, GradientTheme.color3, PlayerGradientSetting.custom_color1):
+        assert column.type.length == CSS_COLOR_MAX_LENGTH
+    assert custom_gradient_colors('gold', 'mediumvioletred') is None
+
+
+def test_create_gradient_rejects_overlong_color_name(seeded_app, client):
+    with client.session_transaction() as session:
+        session['is_admin'] = True
+
+    response = client.post('/admin/create_gradient', data={
+        'name': 'too_long_color', 'display_name': 'Too long', 'element_type': 'nickname',
+        'color1': 'lightgoldenrodyellow', 'color2': '#000000',
+    })
+
+    assert response.status_code == 302
+    with seeded_app.app_context():
+        assert GradientTheme.query.filter_by(name='too_long_color').first() is None
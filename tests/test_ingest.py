@@ -0,0 +1,50 @@
+from models import IngestBatch, Player
+
+
+def player_stats(app, nickname):
+    with app.app_context():
+        player = Player.query.filter_by(nickname=nickname).first()
+        return player and {'kills': player.kills, 'wins': player.wins, 'games_played': player.games_played}
+
+
+def test_rejects_wrong_api_key(seeded_app, ingest):
+    response = ingest({'players': [{'nickname': 'IngestIntruder', 'kills': 5}]}, key='not-the-key')
+
+    assert response.status_code == 401
+    assert player_stats(seeded_app, 'IngestIntruder') is None
+
+
+def test_replayed_idempotency_key_returns_stored_response(seeded_app, ingest):
+    payload = {'players': [{'nickname': 'IngestReplay', 'kills': 4, 'wins': 1}]}
+
+    first = ingest(payload, idempotency_key='replay-batch-1')
+    second = ingest(payload, idempotency_key='replay-batch-1')
+
+    assert first.status_code == second.status_code == 200
+    assert first.get_json() == {'success': True, 'replayed': False, 'players_updated': 1, 'players_created': 1}
+    assert second.get_json() == {'success': True, 'replayed': True, 'players_updated': 1, 'players_created': 1}
+    assert player_stats(seeded_app, 'IngestReplay') == {'kills': 4, 'wins': 1, 'games_played': 0}
+    with seeded_app.app_context():
+        assert IngestBatch.query.filter_by(idempotency_key='replay-batch-1').count() == 1
+
+
+def test_batch_of_new_and_existing_players_adds_counters(seeded_app, ingest):
+    with seeded_app.app_context():
+        existing = Player.query.order_by(Player.id).first()
+        nickname = existing.nickname
+        before = {'kills': existing.kills, 'wins': existing.wins, 'games_played': existing.games_played}
+
+    response = ingest({'players': [
+        {'nickname': nickname, 'kills': 3, 'games_played': 1},
+        {'nickname': 'IngestNewcomer', 'kills': 2, 'games_played': 1},
+        # Repeated nicknames in one batch are merged before they are applied
+        {'nickname': 'IngestNewcomer', 'kills': 5, 'wins': 1, 'games_played': 1},
+    ]})
+
+    assert response.status_code == 200
+    assert response.get_json()['players_updated'] == 2
+    assert response.get_json()['players_created'] == 1
+    assert player_stats(seeded_app, nickname) == {
+        'kills': before['kills'] + 3, 'wins': before['wins'], 'games_played': before['games_played'] + 1,
+    }
+    assert player_stats(seeded_app, 'IngestNewcomer') == {'kills': 7, 'wins': 1, 'games_played': 2}
@@ -0,0 +1,54 @@
+from app import db
+from leaderboard import LeaderboardIndex
+from models import LEADERBOARD_SORT_KEYS, CustomTitle, Player, PlayerGradientSetting, PlayerTitle
+
+
+def test_deleting_a_player_removes_their_cosmetics(seeded_app):
+    with seeded_app.app_context():
+        player = Player.query.join(PlayerGradientSetting).first()
+        player_id = player.id
+        db.session.add(PlayerTitle(player_id=player_id, title_id=CustomTitle.query.first().id))
+        db.session.flush()
+        db.session.expire(player)
+        db.session.delete(player)
+        db.session.flush()
+
+        assert PlayerGradientSetting.query.filter_by(player_id=player_id).count() == 0
+        assert PlayerTitle.query.filter_by(player_id=player_id).count() == 0
+        db.session.rollback()
+
+
+def brute_force_ranks(sort_by):
+    column = Player.get_sort_column(sort_by)
+    rows = db.session.query(Player.id, column).all()
+    ordered = sorted(rows, key=lambda row: (-row[1], row[0]))
+    total = len(ordered)
+    return {player_id: {'rank': position, 'percentile': round((total - position) / total * 100, 1)}
+            for position, (player_id, _) in enumerate(ordered, start=1)}
+
+
+def test_ranks_agree_with_leaderboard_index_and_brute_force(seeded_app):
+    with seeded_app.app_context():
+        # Identical stats, so only the id tie-break separates them
+        twins = [Player(nickname=f'RankTwin{index}', kills=42, final_kills=7, deaths=21, beds_broken=3,
+                        games_played=30, wins=12, experience=4200) for index in range(2)]
+        db.session.add_all(twins)
+        db.session.commit()
+
+        player_ids = [twin.id for twin in twins] + [player_id for (player_id,) in
+                                                    db.session.query(Player.id).order_by(Player.id)][::25]
+        ranks = Player.get_ranks(LEADERBOARD_SORT_KEYS, player_ids)
+        index = LeaderboardIndex(poll_seconds=0)
+
+        for sort_by in LEADERBOARD_SORT_KEYS:
+            expected = brute_force_ranks(sort_by)
+            for player_id in player_ids:
+                assert ranks[player_id][sort_by] == expected[player_id], (sort_by, player_id)
+                assert index.rank(sort_by, player_id) == expected[player_id], (sort_by, player_id)
+            assert ranks[twins[1].id][sort_by]['rank'] == ranks[twins[0].id][sort_by]['rank'] + 1
+
+            # Both ends of the percentile range
+            for player_id in (min(expected, key=lambda key: expected[key]['rank']),
+                              max(expected, key=lambda key: expected[key]['rank'])):
+                assert Player.get_ranks([sort_by], [player_id])[player_id][sort_by] == expected[player_id]
+                assert index.rank(sort_by, player_id) == expected[player_id]
@@ -0,0 +1,42 @@
+from app import db
+from models import Player
+
+
+def sample_players(app):
+    with app.app_context():
+        first, second = Player.query.filter_by(profile_is_public=True).order_by(Player.id).limit(2)
+        return first.id, first.nickname, second.id
+
+
+def test_profile_revalidates_until_the_player_changes(seeded_app, client):
+    player_id, nickname, other_id = sample_players(seeded_app)
+    for url in (f'/player/{player_id}', f'/profile/{nickname}'):
+        first = client.get(url)
+        assert first.status_code == 200
+        etag = first.headers['ETag']
+
+        assert client.get(url, headers={'If-None-Match': etag}).status_code == 304
+
+        # Another player's stats move everyone's ranks, but ranks are not part of this page
+        with seeded_app.app_context():
+            db.session.get(Player, other_id).kills += 5
+            db.session.commit()
+        assert client.get(url, headers={'If-None-Match': etag}).status_code == 304
+
+        with seeded_app.app_context():
+            db.session.get(Player, player_id).kills += 1
+            db.session.commit()
+        changed = client.get(url, headers={'If-None-Match': etag})
+        assert changed.status_code == 200
+        assert changed.headers['ETag'] != etag
+
+
+def test_ranks_are_served_separately_with_a_short_max_age(seeded_app, client):
+    player_id, _, _ = sample_players(seeded_app)
+
+    response = client.get(f'/player/{player_id}/ranks')
+
+    assert response.status_code == 200
+    assert 'player-ranks' in response.get_data(as_text=True)
+    assert response.headers['Cache-Control'] == f'public, max-age={seeded_app.config["RANKS_CACHE_MAX_AGE"]}'
+    assert f'/player/{player_id}/ranks' in client.get(f'/player/{player_id}').get_data(as_text=True)
@@ -0,0 +1,41 @@
+from app import db
+from models import Player, PlayerQuest, Quest
+
+
+def accept(player, quest):
+    player_quest = PlayerQuest(player_id=player.id, quest_id=quest.id, is_accepted=True,
+                               baseline_value=player.get_quest_stat(quest.type))
+    db.session.add(player_quest)
+    return player_quest
+
+
+def test_advance_progress_tracks_counter_and_derived_quests(seeded_app):
+    with seeded_app.app_context():
+        player = Player(nickname='QuestRunner', kills=0, deaths=0, experience=0)
+        quests = {
+            'kills': Quest(title='Kills', description='', type='kills', target_value=5, reward_xp=0),
+            'level': Quest(title='Levels', description='', type='level', target_value=2, reward_xp=0),
+            'kd_ratio': Quest(title='K/D', description='', type='kd_ratio', target_value=3, reward_xp=0),
+        }
+        db.session.add_all([player, *quests.values()])
+        db.session.flush()
+        progress = {quest_type: accept(player, quest) for quest_type, quest in quests.items()}
+        db.session.commit()
+
+        player.kills, player.deaths, player.experience = 4, 2, 1500  # level 1 -> 3, K/D 0 -> 2.0
+        db.session.commit()
+        completed = PlayerQuest.advance_progress([player.id], list(quests))
+        db.session.commit()
+
+        assert set(completed) == {(player.id, quests['level'].id)}
+        assert progress['kills'].current_progress == 4
+        assert progress['level'].current_progress == 2 and progress['level'].is_completed
+        assert progress['kd_ratio'].current_progress == 2 and not progress['kd_ratio'].is_completed
+
+        player.kills = 7  # K/D 3.5 counts as 3 whole steps
+        db.session.commit()
+        completed = PlayerQuest.advance_progress([player.id], list(quests))
+        db.session.commit()
+
+        assert set(completed) == {(player.id, quests['kills'].id), (player.id, quests['kd_ratio'].id)}
+        assert progress['kd_ratio'].current_progress == 3
@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta
+
+from app import db
+from models import Match, MatchParticipant, Player, PlayerStatRollup
+
+
+def test_get_window():
+    now = datetime(2026, 5, 14, 15, 42)
+    assert PlayerStatRollup.get_window('day', now) == ('hour', datetime(2026, 5, 13, 16))
+    assert PlayerStatRollup.get_window('week', now) == ('day', datetime(2026, 5, 8))
+    assert PlayerStatRollup.get_window('month', now) == ('day', datetime(2026, 4, 15))
+    assert PlayerStatRollup.get_window('season', now) == ('day', datetime(2026, 4, 1))
+
+
+def test_ingest_records_a_match_only_for_match_payloads(seeded_app, ingest):
+    with seeded_app.app_context():
+        matches = Match.query.count()
+
+    assert ingest({'players': [{'nickname': 'RollupTopUp', 'kills': 3}]}).status_code == 200
+    with seeded_app.app_context():
+        assert Match.query.count() == matches
+        player_id = Player.query.filter_by(nickname='RollupTopUp').one().id
+        # The top-up still counts towards the windowed leaderboards
+        assert {row.period: row.kills for row in PlayerStatRollup.query.filter_by(player_id=player_id)} == \
+            {'hour': 3, 'day': 3}
+
+    assert ingest({'players': [{'nickname': 'RollupTopUp', 'kills': 2}],
+                   'match': {'map': 'Lighthouse', 'mode': 'solo'}}).status_code == 200
+    with seeded_app.app_context():
+        assert Match.query.count() == matches + 1
+        assert MatchParticipant.query.filter_by(player_id=player_id).one().kills == 2
+
+
+def test_window_leaderboard_api_sums_the_window(seeded_app, client, ingest):
+    for kills in (600000, 500000):
+        assert ingest({'players': [{'nickname': 'WindowTopper', 'kills': kills}], 'match': {}}).status_code == 200
+
+    response = client.get('/api/leaderboard?window=day&sort=kills&limit=5')
+
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['window'] == 'day'
+    assert data['players'][0]['nickname'] == 'WindowTopper'
+    assert data['players'][0]['kills'] == 1100000
+    assert client.get('/api/leaderboard?window=decade').status_code == 400
+
+
+def test_compaction_keeps_window_totals(seeded_app):
+    with seeded_app.app_context():
+        now = datetime.utcnow()
+        players = Player.query.order_by(Player.id).limit(3).all()
+        for days_ago in (3, 10, 20):
+            Match.record({player.nickname: {'kills': days_ago, 'wins': 1} for player in players},
+                         ended_at=now - timedelta(days=days_ago))
+        db.session.commit()
+        before = {window: PlayerStatRollup.get_leaderboard(window, 'kills', 10000)[0]
+                  for window in ('week', 'month', 'season')}
+
+        matches, hourly = PlayerStatRollup.compact(keep_matches_days=7, keep_hourly_days=2)
+        db.session.commit()
+
+        assert matches >= 2 and hourly >= 3 * 3
+        assert Match.query.filter(Match.ended_at < now - timedelta(days=7)).count() == 0
+        assert PlayerStatRollup.query.filter(
+            PlayerStatRollup.period == 'hour', PlayerStatRollup.period_start < now - timedelta(days=2, hours=1)
+        ).count() == 0
+        for window, players_before in before.items():
+            assert PlayerStatRollup.get_leaderboard(window, 'kills', 10000)[0] == players_before
@@ -0,0 +1,40 @@
+import search
+from app import db
+from models import CacheVersion, Player
+from search import TrigramIndex, search_query
+
+
+def test_trigram_index_rebuilds_only_when_nicknames_change(seeded_app):
+    with seeded_app.app_context():
+        index = TrigramIndex()
+        player = Player.query.order_by(Player.id).first()
+        index.search(player.nickname, 5)
+        built = CacheVersion.current('nicknames')
+
+        player.kills += 10
+        db.session.commit()
+        assert CacheVersion.current('nicknames') == built
+
+        player.nickname = 'TrigramRenamed'
+        db.session.commit()
+        assert CacheVersion.current('nicknames') > built
+        assert index.search('trigramrenamed', 5) == [player.id]
+
+        Player.apply_stat_deltas({'TrigramIngested': {'kills': 1}})
+        db.session.commit()
+        assert len(index.search('TrigramIngested', 5)) == 1
+
+
+def test_fallback_search_orders_by_current_experience(seeded_app, monkeypatch):
+    monkeypatch.setattr(search, 'has_fts_index', lambda: False)
+    with seeded_app.app_context():
+        for nickname, experience in (('FallbackAlpha', 100), ('FallbackBeta', 200), ('XFallbackGamma', 900)):
+            db.session.add(Player(nickname=nickname, experience=experience))
+        db.session.commit()
+        assert [p.nickname for p in search_query('fallback', 10)] == ['FallbackBeta', 'FallbackAlpha', 'XFallbackGamma']
+
+        # A stat write reorders results without rebuilding the index
+        Player.query.filter_by(nickname='FallbackAlpha').one().experience = 5000
+        db.session.commit()
+        assert [p.nickname for p in search_query('fallback', 10)] == ['FallbackAlpha', 'FallbackBeta', 'XFallbackGamma']
+        assert [p.nickname for p in search_query('fallback', 2)] == ['FallbackAlpha', 'FallbackBeta']
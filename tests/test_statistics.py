@@ -0,0 +1,33 @@
+from collections import Counter
+
+from models import DISTRIBUTION_BANDS, Player
+
+
+def test_level_distribution_matches_player_level(seeded_app, client):
+    with seeded_app.app_context():
+        expected = Counter(f'Level {player.level}' for player in Player.query)
+        distribution = Player.get_level_distribution()
+
+    assert distribution == dict(expected)
+    assert client.get('/api/stats').get_json()['charts']['player_levels'] == distribution
+
+
+def test_band_distributions_match_python_bucketing(seeded_app, client):
+    values = {
+        'kd_ratio': lambda player: player.kd_ratio,
+        'win_rate': lambda player: player.win_rate,
+        'resources': lambda player: player.total_resources,
+    }
+    with seeded_app.app_context():
+        players = Player.query.all()
+        for field, bands in DISTRIBUTION_BANDS.items():
+            expected = dict.fromkeys((label for _, label in bands), 0)
+            for player in players:
+                value = values[field](player)
+                label = next(label for upper, label in bands if upper is None or value < upper)
+                expected[label] += 1
+            assert Player.get_distribution(field) == expected, field
+
+    charts = client.get('/api/stats?buckets=kd_ratio,win_rate').get_json()['charts']
+    assert set(charts) >= {'kd_ratio_distribution', 'win_rate_distribution'}
+    assert 'resources_distribution' not in charts